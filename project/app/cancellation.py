@@ -0,0 +1,118 @@
+"""
+Request Cancellation
+Cancel tokens keyed by request id. The MCP server registers one per agent request; tools
+call checkpoint() between units of work (model turns, download chunks, fetched emails) and
+stop there once the request is cancelled. Worker threads see the request's token when
+started with asyncio.to_thread or contextvars.copy_context().
+"""
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class RequestCancelled(Exception):
+    """Raised at a checkpoint once the current request has been cancelled."""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag for one request."""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.event = threading.Event()
+        self.reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    def check(self):
+        if self.event.is_set():
+            raise RequestCancelled(f"Request {self.request_id} {self.reason}")
+
+
+class CancelStats:
+    """Work skipped because the requester was no longer waiting for it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {
+            "requests_cancelled": 0,
+            "agent_loops_stopped": 0,
+            "model_turns_skipped": 0,
+            "tool_calls_skipped": 0,
+            "download_bytes_avoided": 0,
+            "emails_skipped": 0
+        }
+
+    def record(self, key: str, amount: int = 1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+
+stats = CancelStats()
+
+_tokens: Dict[str, CancelToken] = {}
+_tokens_lock = threading.Lock()
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "cancel_token", default=None
+)
+
+
+@contextmanager
+def request_scope(request_id: str):
+    """Register a token for the request and make it current for the duration of the block."""
+    token = CancelToken(request_id)
+    with _tokens_lock:
+        _tokens[request_id] = token
+    context_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(context_token)
+        with _tokens_lock:
+            if _tokens.get(request_id) is token:
+                del _tokens[request_id]
+
+
+def cancel(request_id: str, reason: str = "cancelled by client") -> bool:
+    """Cancel a running request; returns False if no such request is running."""
+    with _tokens_lock:
+        token = _tokens.get(request_id)
+    if token is None or token.cancelled:
+        return False
+    # Counted where the request observes the cancellation, which also covers MCP cancel notifications
+    token.cancel(reason)
+    return True
+
+
+def active() -> int:
+    """Number of requests currently running in this process."""
+    with _tokens_lock:
+        return len(_tokens)
+
+
+def current() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def is_cancelled() -> bool:
+    token = _current_token.get()
+    return token is not None and token.cancelled
+
+
+def checkpoint():
+    """Raise RequestCancelled if the current request has been cancelled; no-op outside a request."""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
@@ -0,0 +1,62 @@
+"""
+On-the-fly BM25 ranking over document sections (pages or chunks).
+Used to pull only the relevant parts of a large document into the model prompt.
+"""
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25:
+    """Okapi BM25 index built in memory over a list of sections."""
+
+    def __init__(self, sections: List[str], k1: float = 1.5, b: float = 0.75):
+        """
+        Build the index.
+
+        Args:
+            sections: Texts to rank (e.g. one per page)
+            k1: Term frequency saturation
+            b: Length normalization strength
+        """
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(section)) for section in sections]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.doc_freq = Counter()
+        for counts in self.term_counts:
+            self.doc_freq.update(counts.keys())
+
+    def idf(self, term: str) -> float:
+        n = len(self.term_counts)
+        df = self.doc_freq.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> List[float]:
+        """Score every section against the query."""
+        terms = set(tokenize(query))
+        idf = {term: self.idf(term) for term in terms}
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    score += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+    def top(self, query: str, k: int = 3) -> List[Tuple[int, float]]:
+        """Return up to k (section index, score) pairs with a positive score, best first."""
+        ranked = sorted(enumerate(self.scores(query)), key=lambda item: item[1], reverse=True)
+        return [(index, score) for index, score in ranked[:k] if score > 0]
@@ -3,19 +3,30 @@ Google Drive Agent with Native Search
 Integrates Drive API for file operations and content search
 """
 import os
-import io
+import ssl
+import json
+import time
+import socket
+import hashlib
+import http.client
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
-# Google Drive imports
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+# Google API client libraries are imported on first use; they dominate import time
 from mcp.server.fastmcp import FastMCP
-# NEW IMPORT FOR PDF EXTRACTION
-from pypdf import PdfReader
+# Shared PyMuPDF extraction (also used by the expense agent)
+import pdf_text
 from logging_utils import get_logger
+from text_cache import get_text_cache
+import semantic_index
+import drive_metadata
+import upload_store
+import cancellation
+from doc_search import BM25
 
 
 mcp = FastMCP("Drive Agent")
@@ -26,9 +37,34 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 # Get the directory of this script for consistent file paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Downloads are streamed to disk in chunks of this size (default 8 MB) so peak
+# memory per download is bounded by the chunk size rather than the file size
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DRIVE_DOWNLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+# Number of times a transient failure may be resumed from the last good chunk
+DOWNLOAD_RETRIES = int(os.getenv("DRIVE_DOWNLOAD_RETRIES", 5))
+# Upper bound on concurrent transfers for the batch upload/download tools
+TRANSFER_WORKERS = int(os.getenv("DRIVE_TRANSFER_WORKERS", 4))
+
+# Serializes token file reads/refreshes when several transfers authenticate at once
+_credentials_lock = threading.Lock()
+
 @mcp.tool()
 def get_drive_service():
     """Authenticate and return the Drive service."""
+    with _credentials_lock:
+        creds = _load_credentials()
+    if not creds:
+        return None
+    from googleapiclient.discovery import build
+    # Each call builds its own service: the underlying httplib2 connection is
+    # not thread-safe, so concurrent transfers must not share one
+    return build('drive', 'v3', credentials=creds)
+
+def _load_credentials():
+    """Load, refresh or obtain Drive credentials, persisting them to drive_token.json."""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
     creds = None
     token_path = os.path.join(SCRIPT_DIR, './drive_token.json')
     credentials_path = os.path.join(SCRIPT_DIR, './drive_credentials.json')
@@ -50,47 +86,89 @@ def get_drive_service():
         # Save the credentials for the next run
         with open(token_path, 'w') as token:
             token.write(creds.to_json())
-    return build('drive', 'v3', credentials=creds)
+    return creds
+
+# Drive caps pageSize at 1000; larger listings are followed via nextPageToken
+MAX_PAGE_SIZE = 1000
+LIST_FIELDS = "files(id, name, mimeType, size)"
+
+def iter_file_pages(service, query: str = None, max_results: int = None,
+                    page_token: str = None, fields: str = LIST_FIELDS,
+                    page_size: int = MAX_PAGE_SIZE):
+    """
+    Generator over Drive listing pages that follows nextPageToken.
+    
+    Yields (files, next_page_token) one page at a time so callers can stop
+    early without materializing the whole listing. Each page is sized so it
+    ends exactly at max_results, which keeps the returned token a valid cursor.
+    
+    Args:
+        service: Authenticated Drive service
+        query: Optional query string for filtering
+        max_results: Stop after this many files (None follows every page)
+        page_token: Cursor returned by a previous page
+        fields: Partial-response fields for each file
+        page_size: Upper bound on files requested per page
+    """
+    remaining = max_results
+    while True:
+        size = page_size if remaining is None else min(page_size, remaining)
+        if size <= 0:
+            return
+        results = service.files().list(
+            pageSize=size,
+            q=query,
+            pageToken=page_token,
+            fields=f"nextPageToken, {fields}"
+        ).execute()
+        files = results.get('files', [])
+        page_token = results.get('nextPageToken')
+        if remaining is not None:
+            remaining -= len(files)
+        yield files, page_token
+        if not page_token:
+            return
 
 @mcp.tool()
-def list_files(max_results: int = 10, query: str = None) -> str:
+def list_files(max_results: int = 10, query: str = None, page_token: str = None) -> str:
     """
     List files from Google Drive.
     
     Args:
         max_results: Maximum number of files to return
         query: Optional query string for filtering
+        page_token: Optional cursor from a previous listing to fetch the next page
     """
     logger = get_logger()
     logger.log_tool_call(
         tool_name="list_files",
-        parameters={"max_results": max_results, "query": query}
+        parameters={"max_results": max_results, "query": query, "page_token": page_token}
     )
     try:
         service = get_drive_service()
         if not service:
             return "Error: Drive authentication required."
         
-        results = service.files().list(
-            pageSize=max_results,
-            q=query,
-            fields="files(id, name, mimeType, modifiedTime, size)"
-        ).execute()
-        
-        files = results.get('files', [])
+        output = ["Files found:"]
+        count = 0
+        next_token = None
+        for files, next_token in iter_file_pages(service, query=query, max_results=max_results,
+                                                 page_token=page_token):
+            for file in files:
+                size = file.get('size', 'N/A')
+                output.append(f"ID: {file['id']} | Name: {file['name']} | Type: {file['mimeType']} | Size: {size} bytes")
+            count += len(files)
         
-        if not files:
+        if not count:
             return "No files found."
         
-        output = ["Files found:"]
-        for file in files:
-            size = file.get('size', 'N/A')
-            output.append(f"ID: {file['id']} | Name: {file['name']} | Type: {file['mimeType']} | Size: {size} bytes")
+        if next_token:
+            output.append(f"More files available. Next page token: {next_token}")
             
         logger.log_tool_call(
             tool_name="list_files",
-            parameters={"max_results": max_results, "query": query},
-            result=f"Found {len(files)} files"
+            parameters={"max_results": max_results, "query": query, "page_token": page_token},
+            result=f"Found {count} files" + (" (more available)" if next_token else "")
         )
         return "\n".join(output)
     
@@ -133,6 +211,87 @@ def search_files(search_term: str, use_semantic: bool = False) -> str:
         )
         return f"Error searching files: {e}"
 
+# Network failures worth resuming a download after; local I/O errors such as ENOSPC or
+# EACCES are OSErrors too but will not go away by retrying
+TRANSIENT_NETWORK_ERRORS = (ConnectionError, TimeoutError, socket.timeout, socket.gaierror,
+                            ssl.SSLError, http.client.HTTPException)
+
+def _is_transient(error: Exception) -> bool:
+    """Return True for errors worth resuming a download after."""
+    from googleapiclient.errors import HttpError
+    from httplib2 import ServerNotFoundError
+    if isinstance(error, HttpError):
+        return error.resp.status in (408, 429, 500, 502, 503, 504)
+    return isinstance(error, TRANSIENT_NETWORK_ERRORS + (ServerNotFoundError,))
+
+def safe_filename(name: str, fallback: str) -> str:
+    """Turn a Drive file name into a single local path component (Drive names may contain '/')."""
+    name = name.replace("/", "_").replace("\\", "_").replace("\0", "_").strip()
+    if name in ("", ".", ".."):
+        return fallback
+    return name
+
+def stream_download(request, save_path: str, chunk_size: int = None) -> int:
+    """
+    Stream a Drive media request to disk and return the number of bytes written.
+    
+    Chunks are written to a temp file next to save_path, which is atomically
+    renamed into place once complete, so readers never see a partial file.
+    On a transient failure the downloader resumes from the last good chunk.
+    If the current request is cancelled the download stops before the next chunk.
+    
+    Args:
+        request: Drive get_media/export_media request
+        save_path: Final local path for the file
+        chunk_size: Bytes per chunk (defaults to DOWNLOAD_CHUNK_SIZE)
+    """
+    from googleapiclient.http import MediaIoBaseDownload
+    directory = os.path.dirname(os.path.abspath(save_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.download-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=chunk_size or DOWNLOAD_CHUNK_SIZE)
+            token = cancellation.current()
+            failures = 0
+            status = None
+            done = False
+            while not done:
+                if token is not None and token.cancelled:
+                    if status is not None and status.total_size:
+                        cancellation.stats.record("download_bytes_avoided", status.total_size - status.resumable_progress)
+                    token.check()
+                try:
+                    status, done = downloader.next_chunk(num_retries=DOWNLOAD_RETRIES)
+                except Exception as e:
+                    # MediaIoBaseDownload tracks its byte offset, so calling
+                    # next_chunk again continues with a Range request
+                    failures += 1
+                    if failures > DOWNLOAD_RETRIES or not _is_transient(e):
+                        raise
+                    time.sleep(min(2 ** failures, 30))
+            fh.flush()
+            os.fsync(fh.fileno())
+            size = fh.tell()
+        os.replace(tmp_path, save_path)
+        return size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def downloaded_tempfile(request, suffix: str = ''):
+    """Stream a Drive media request to a temp file and yield its path; the file is removed afterwards."""
+    fd, path = tempfile.mkstemp(prefix='drive-', suffix=suffix)
+    os.close(fd)
+    try:
+        stream_download(request, path)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
 @mcp.tool()
 def download_file(file_id: str, destination: str = None) -> str:
     """
@@ -153,27 +312,13 @@ def download_file(file_id: str, destination: str = None) -> str:
             return "Error: Drive authentication required."
         
         # Get file metadata
-        file_metadata = service.files().get(fileId=file_id, fields='name,mimeType').execute()
+        file_metadata = drive_metadata.get_metadata(file_id, lambda: service)
         filename = file_metadata['name']
         
-        # Download file
+        # Stream file to disk
         request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        # Save to file
-        save_path = destination if destination else filename
-        
-        # Ensure directory exists
-        if os.path.dirname(save_path):
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            
-        with open(save_path, 'wb') as f:
-            f.write(fh.getbuffer())
+        save_path = destination if destination else safe_filename(filename, file_id)
+        stream_download(request, save_path)
             
         logger.log_tool_call(
             tool_name="download_file",
@@ -190,19 +335,80 @@ def download_file(file_id: str, destination: str = None) -> str:
         )
         return f"Error downloading file: {e}"
 
+def file_md5(filepath: str, chunk_size: int = 1024 * 1024) -> str:
+    """Compute the MD5 hex digest of a local file without loading it into memory."""
+    digest = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _iter_folder_files(service, folder_id: str = None):
+    """Files in a folder with the fields needed for content comparison, page by page."""
+    query = f"'{folder_id or 'root'}' in parents and trashed = false"
+    for files, _ in iter_file_pages(service, query=query,
+                                    fields="files(id, name, md5Checksum, size)"):
+        yield from files
+
+def folder_files_by_size(service, folder_id: str = None) -> Dict[int, List[Dict]]:
+    """
+    List a folder once and group its files by size, so a batch of uploads can check
+    every file for duplicates without listing the folder again.
+    """
+    by_size = {}
+    for file in _iter_folder_files(service, folder_id):
+        if 'md5Checksum' in file:
+            by_size.setdefault(int(file.get('size', -1)), []).append(file)
+    return by_size
+
+def find_duplicate(service, filepath: str, folder_id: str = None,
+                   folder_files: Dict[int, List[Dict]] = None) -> Optional[Dict]:
+    """
+    Find a file in the target folder whose content matches filepath.
+    
+    Drive cannot filter on md5Checksum, so the folder listing is paged with
+    only the fields needed and compared locally; the cheap size comparison
+    runs first so the local MD5 is only computed when a candidate exists.
+    
+    Args:
+        folder_files: Optional listing from folder_files_by_size; without it the folder
+            is paged until a match is found
+    
+    Returns:
+        The matching file's metadata (id, name) or None
+    """
+    size = os.path.getsize(filepath)
+    local_md5 = None
+    candidates = (folder_files.get(size, []) if folder_files is not None
+                  else _iter_folder_files(service, folder_id))
+    for file in candidates:
+        if 'md5Checksum' not in file or int(file.get('size', -1)) != size:
+            continue
+        if local_md5 is None:
+            local_md5 = file_md5(filepath)
+        if file['md5Checksum'] == local_md5:
+            return file
+    return None
+
 @mcp.tool()
-def upload_file(filepath: str, folder_id: str = None) -> str:
+def upload_file(filepath: str, folder_id: str = None, skip_duplicates: bool = True) -> str:
     """
     Upload a file to Google Drive.
     
     Args:
         filepath: Local path to file to upload
         folder_id: Optional folder ID to upload to
+        skip_duplicates: If True, return the existing file when identical content is already in the folder
     """
+    return _upload_file(filepath, folder_id, skip_duplicates)
+
+def _upload_file(filepath: str, folder_id: str = None, skip_duplicates: bool = True,
+                 folder_files: Dict[int, List[Dict]] = None) -> str:
+    """upload_file, optionally checking duplicates against a listing shared by a whole batch."""
     logger = get_logger()
     logger.log_tool_call(
         tool_name="upload_file",
-        parameters={"filepath": filepath, "folder_id": folder_id}
+        parameters={"filepath": filepath, "folder_id": folder_id, "skip_duplicates": skip_duplicates}
     )
     try:
         if not os.path.exists(filepath):
@@ -212,10 +418,23 @@ def upload_file(filepath: str, folder_id: str = None) -> str:
         if not service:
             return "Error: Drive authentication required."
         
-        file_metadata = {'name': os.path.basename(filepath)}
+        if skip_duplicates:
+            existing = find_duplicate(service, filepath, folder_id, folder_files)
+            if existing:
+                result = f"File already exists in Drive with identical content, skipped upload. ID: {existing['id']}, Name: {existing['name']}"
+                logger.log_tool_call(
+                    tool_name="upload_file",
+                    parameters={"filepath": filepath, "folder_id": folder_id},
+                    result=result
+                )
+                return result
+        
+        # UI uploads are stored under their content hash; Drive gets the name the user uploaded
+        file_metadata = {'name': upload_store.original_name(filepath) or os.path.basename(filepath)}
         if folder_id:
             file_metadata['parents'] = [folder_id]
             
+        from googleapiclient.http import MediaFileUpload
         media = MediaFileUpload(filepath, resumable=True)
         
         file = service.files().create(
@@ -239,52 +458,195 @@ def upload_file(filepath: str, folder_id: str = None) -> str:
         )
         return f"Error uploading file: {e}"
 
+def _run_transfers(tool_name: str, items: List[str], transfer) -> str:
+    """
+    Run transfer(item) for every item on a bounded thread pool.
+    
+    Each completion is logged as it finishes so progress is visible while the
+    slower transfers are still running; the summary lists results in input order.
+    """
+    logger = get_logger()
+    results = {}
+    workers = max(1, min(TRANSFER_WORKERS, len(items)))
+    def run(item):
+        # Transfers still waiting for a worker are skipped once the request is cancelled
+        cancellation.checkpoint()
+        return transfer(item)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=tool_name) as pool:
+        # Copy the context so workers share the request's metadata resolver and cancel token
+        futures = {pool.submit(contextvars.copy_context().run, run, item): item for item in items}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = f"Error: {e}"
+            results[item] = result
+            logger.log_tool_call(
+                tool_name=tool_name,
+                parameters={"item": item},
+                result=f"[{done_count}/{len(items)}] {result}"
+            )
+    
+    failed = sum(1 for r in results.values() if r.startswith("Error"))
+    output = [f"{tool_name}: {len(items) - failed}/{len(items)} succeeded"]
+    for i, item in enumerate(items, 1):
+        status = "FAILED" if results[item].startswith("Error") else "OK"
+        output.append(f"{i}. [{status}] {item}: {results[item]}")
+    return "\n".join(output)
+
+@mcp.tool()
+def upload_files(paths: List[str], folder_id: str = None, skip_duplicates: bool = True) -> str:
+    """
+    Upload several files to Google Drive concurrently.
+    
+    Args:
+        paths: Local paths of the files to upload
+        folder_id: Optional folder ID to upload to
+        skip_duplicates: If True, files whose content already exists in the folder are not re-uploaded
+    """
+    logger = get_logger()
+    logger.log_tool_call(
+        tool_name="upload_files",
+        parameters={"paths": paths, "folder_id": folder_id}
+    )
+    if not paths:
+        return "Error: No files to upload."
+    folder_files = None
+    if skip_duplicates:
+        # One listing of the target folder serves every file's duplicate check
+        try:
+            service = get_drive_service()
+            if not service:
+                return "Error: Drive authentication required."
+            folder_files = folder_files_by_size(service, folder_id)
+        except Exception as e:
+            logger.log_error(
+                error_type="drive_upload_error",
+                error_message=str(e),
+                context="upload_files"
+            )
+            return f"Error listing the target folder: {e}"
+    return _run_transfers(
+        "upload_files",
+        list(dict.fromkeys(paths)),
+        lambda path: _upload_file(path, folder_id, skip_duplicates, folder_files)
+    )
+
+@mcp.tool()
+def download_files(file_ids: List[str], dest_dir: str = None) -> str:
+    """
+    Download several files from Google Drive concurrently.
+    
+    Args:
+        file_ids: IDs of the files to download
+        dest_dir: Optional local directory to save the files into
+    """
+    logger = get_logger()
+    logger.log_tool_call(
+        tool_name="download_files",
+        parameters={"file_ids": file_ids, "dest_dir": dest_dir}
+    )
+    if not file_ids:
+        return "Error: No files to download."
+
+    file_ids = list(dict.fromkeys(file_ids))
+    # One batched metadata round-trip for every file instead of one per transfer
+    drive_metadata.prefetch(file_ids, get_drive_service)
+
+    def local_path(file_id, unique=False):
+        name = safe_filename(drive_metadata.get_metadata(file_id, get_drive_service)['name'], file_id)
+        if unique:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem} ({file_id}){ext}"
+        # Without dest_dir files go to the working directory, as download_file does
+        return os.path.join(dest_dir, name) if dest_dir else name
+
+    # Pick every local path up front so files sharing a Drive name do not overwrite each other
+    destinations = {}
+    taken = set()
+    for file_id in file_ids:
+        try:
+            path = local_path(file_id)
+        except Exception:
+            continue  # Looked up again, and reported, by the file's own transfer
+        if path.lower() in taken:
+            path = local_path(file_id, unique=True)
+        taken.add(path.lower())
+        destinations[file_id] = path
+
+    def transfer(file_id):
+        destination = destinations.get(file_id) or local_path(file_id, unique=True)
+        return download_file(file_id=file_id, destination=destination)
+
+    return _run_transfers("download_files", file_ids, transfer)
+
+# Characters of each matching chunk shown in semantic_search results
+SNIPPET_CHARS = 300
+
 @mcp.tool()
 def semantic_search(query: str, max_files: int = 10) -> str:
     """
-    Search for files by content using Google Drive's native full-text search.
-    This searches inside Google Docs, PDFs, and text files.
+    Search document content by meaning using the local vector index.
+    Returns ranked chunks from indexed PDFs, Google Docs and text files; files that
+    are not indexed yet are covered by Google Drive's native full-text search.
     
     Args:
         query: The text to search for inside files
         max_files: Maximum number of results
     """
+    # Gemini sends numeric arguments as floats; slices and chromadb need an int
+    max_files = int(max_files)
     logger = get_logger()
     logger.log_tool_call(
         tool_name="semantic_search",
         parameters={"query": query, "max_files": max_files}
     )
     try:
-        service = get_drive_service()
-        if not service:
-            return "Error: Drive authentication required."
-        
-        # Use Drive API's fullText search
-        # This is powerful and searches inside the file content
-        drive_query = f"fullText contains '{query}' and trashed = false"
+        output = [f"Content Search Results for: '{query}'\n"]
         
-        results = service.files().list(
-            pageSize=max_files,
-            q=drive_query,
-            fields="files(id, name, mimeType, webViewLink, size, modifiedTime)"
-        ).execute()
+        hits = semantic_index.search(query, n_results=max_files)
+        for i, hit in enumerate(hits, 1):
+            snippet = " ".join(hit['text'].split())[:SNIPPET_CHARS]
+            output.append(f"{i}. {hit['name']} (chunk {hit['chunk']}, score {hit['score']:.3f})")
+            output.append(f"   ID: {hit['file_id']}")
+            output.append(f"   Excerpt: {snippet}\n")
         
-        files = results.get('files', [])
+        fallback = []
+        if len(hits) < max_files:
+            service = get_drive_service()
+            if not service:
+                return "Error: Drive authentication required."
+            
+            # Drive's fullText keyword search, restricted to files the local
+            # index cannot answer for yet
+            escaped = query.replace("\\", "\\\\").replace("'", "\\'")
+            drive_query = f"fullText contains '{escaped}' and trashed = false"
+            results = service.files().list(
+                pageSize=max_files,
+                q=drive_query,
+                fields="files(id, name, mimeType, webViewLink)"
+            ).execute()
+            files = results.get('files', [])
+            indexed = semantic_index.indexed_file_ids([f['id'] for f in files])
+            fallback = [f for f in files if f['id'] not in indexed][:max_files - len(hits)]
         
-        if not files:
+        if not hits and not fallback:
             return f"No files found containing '{query}'"
         
-        output = [f"Content Search Results for: '{query}'\n"]
-        for i, file in enumerate(files, 1):
-            output.append(f"{i}. {file['name']}")
-            output.append(f"   ID: {file['id']}")
-            output.append(f"   Type: {file['mimeType']}")
-            output.append(f"   Link: {file.get('webViewLink', 'N/A')}\n")
+        if fallback:
+            output.append("Keyword matches in files not yet indexed:\n")
+            for i, file in enumerate(fallback, len(hits) + 1):
+                output.append(f"{i}. {file['name']}")
+                output.append(f"   ID: {file['id']}")
+                output.append(f"   Type: {file['mimeType']}")
+                output.append(f"   Link: {file.get('webViewLink', 'N/A')}\n")
             
         logger.log_tool_call(
             tool_name="semantic_search",
             parameters={"query": query},
-            result=f"Found {len(files)} files"
+            result=f"Found {len(hits)} indexed chunks, {len(fallback)} unindexed files"
         )
         return "\n".join(output)
     except Exception as e:
@@ -295,6 +657,54 @@ def semantic_search(query: str, max_files: int = 10) -> str:
         )
         return f"Error in content search: {e}"
 
+@mcp.tool()
+def index_file(file_id: str) -> str:
+    """
+    Add a PDF, Google Doc, or plain text file to the local semantic search index.
+    Files already indexed at their current version are skipped.
+    
+    Args:
+        file_id: ID of the file to index
+    """
+    logger = get_logger()
+    logger.log_tool_call(
+        tool_name="index_file",
+        parameters={"file_id": file_id}
+    )
+    try:
+        service = get_drive_service()
+        if not service:
+            return "Error: Drive authentication required."
+        
+        file_metadata = drive_metadata.get_metadata(file_id, lambda: service)
+        if file_metadata['mimeType'] not in SUPPORTED_DOCUMENT_TYPES:
+            return "Error: Unsupported file type. Supported: Google Docs, PDF, plain text."
+        
+        version = document_version(file_metadata)
+        if version and semantic_index.indexed_version(file_id) == version:
+            return f"{file_metadata['name']} is already indexed (version {version})."
+        
+        # read_document serves unchanged files from the text cache
+        content = read_document(file_id)
+        if content.startswith("Error"):
+            return content
+        
+        embedded = semantic_index.index_document(file_id, file_metadata['name'], version or '', content)
+        result = f"Indexed {file_metadata['name']}: {embedded} chunks embedded."
+        logger.log_tool_call(
+            tool_name="index_file",
+            parameters={"file_id": file_id},
+            result=result
+        )
+        return result
+    except Exception as e:
+        logger.log_error(
+            error_type="drive_index_file_error",
+            error_message=str(e),
+            context="index_file"
+        )
+        return f"Error indexing file: {e}"
+
 @mcp.tool()
 def read_text_file(file_id: str) -> str:
     """
@@ -309,7 +719,7 @@ def read_text_file(file_id: str) -> str:
             return "Error: Drive authentication required."
         
         # Get file metadata to check mimeType
-        file_metadata = service.files().get(fileId=file_id, fields='name,mimeType').execute()
+        file_metadata = drive_metadata.get_metadata(file_id, lambda: service)
         mime_type = file_metadata['mimeType']
         
         if mime_type != 'text/plain':
@@ -317,74 +727,174 @@ def read_text_file(file_id: str) -> str:
         
         # Download file content as text
         request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        fh.seek(0)
-        content = fh.read().decode('utf-8')
+        with downloaded_tempfile(request, suffix='.txt') as path:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
         
         return content
     
     except Exception as e:
         return f"Error reading text file: {e}"
 
+SUPPORTED_DOCUMENT_TYPES = (
+    'application/vnd.google-apps.document',
+    'application/pdf',
+    'text/plain'
+)
+
+def document_version(file_metadata: Dict) -> Optional[str]:
+    """Version key for cached content: md5Checksum for binary files, modifiedTime for Google Docs."""
+    return file_metadata.get('md5Checksum') or file_metadata.get('modifiedTime')
+
+# Plain text and Google Docs have no pages, so they are split into sections of about this size
+SECTION_CHARS = 3000
+# Sections returned by read_document's locate mode
+LOCATE_TOP_K = 3
+
+def split_sections(text: str, size: int = SECTION_CHARS) -> List[str]:
+    """Split page-less text on line boundaries; joining the sections with newlines restores it."""
+    sections, current, length = [], [], 0
+    for line in text.split("\n"):
+        if current and length + len(line) > size:
+            sections.append("\n".join(current))
+            current, length = [], 0
+        current.append(line)
+        length += len(line) + 1
+    sections.append("\n".join(current))
+    return sections
+
+def extract_document_pages(service, file_id: str, mime_type: str) -> List[str]:
+    """
+    Download or export a supported document and return its text page by page.
+    
+    Raises:
+        ValueError: If the mime type is not a supported document type
+    """
+    if mime_type == 'application/vnd.google-apps.document':
+        # Export Google Doc to plain text
+        request = service.files().export_media(fileId=file_id, mimeType='text/plain')
+    elif mime_type in ['application/pdf', 'text/plain']:
+        # Download binary content for PDF or text
+        request = service.files().get_media(fileId=file_id)
+    else:
+        raise ValueError("Unsupported file type. Supported: Google Docs, PDF, plain text.")
+    
+    # Download/export the content to disk and parse from there
+    with downloaded_tempfile(request) as path:
+        if mime_type == 'application/pdf':
+            # PyMuPDF reads pages from the on-disk file
+            return pdf_text.extract_pages(path)
+        with open(path, 'r', encoding='utf-8') as fh:
+            # For text or exported Google Doc
+            return split_sections(fh.read().strip())
+
+def load_document_pages(service, file_id: str, file_metadata: Dict):
+    """
+    Return (pages, cache_hit) for a document, using the text cache when the version is unchanged.
+    
+    Args:
+        service: Authenticated Drive service
+        file_id: ID of the file
+        file_metadata: Metadata with mimeType and md5Checksum/modifiedTime
+    """
+    cache = get_text_cache()
+    version = document_version(file_metadata)
+    if version:
+        content = cache.get(file_id, version)
+        pages = _cached_pages(content) if content is not None else None
+        if pages is not None:
+            return pages, True
+    
+    pages = extract_document_pages(service, file_id, file_metadata['mimeType'])
+    if version:
+        # A JSON list keeps page boundaries without a separator that the text itself could contain
+        cache.put(file_id, version, json.dumps(pages, ensure_ascii=False))
+    return pages, False
+
+def _cached_pages(content: str) -> Optional[List[str]]:
+    """Pages stored by load_document_pages, or None for entries in an older format."""
+    try:
+        pages = json.loads(content)
+    except ValueError:
+        return None
+    if isinstance(pages, list) and all(isinstance(page, str) for page in pages):
+        return pages
+    return None
+
+def _format_sections(pages: List[str], selected: List[int], unit: str, scores: Dict[int, float] = None) -> str:
+    output = []
+    for index in selected:
+        label = f"--- {unit} {index + 1}"
+        if scores:
+            label += f" (score {scores[index]:.2f})"
+        output.append(f"{label} ---\n{pages[index].strip()}")
+    return "\n\n".join(output)
+
 # NEW TOOL: Read contents of PDF, Google Doc, or text file
 @mcp.tool()
-def read_document(file_id: str) -> str:
+def read_document(file_id: str, pages: str = None, max_chars: int = None, locate: str = None) -> str:
     """
     Read the contents of a PDF, Google Doc, or plain text file from Google Drive and return the extracted text.
+    Text is served from the local cache when the file has not changed since it was last read.
+    For large documents, use pages, max_chars or locate to return only part of the text.
     
     Args:
         file_id: ID of the file to read
+        pages: Optional 1-based page range such as "1-3,7" (sections of about 3000 characters for Docs and text files)
+        max_chars: Optional maximum number of characters to return
+        locate: Optional query; returns only the pages that best match it
     """
+    # Gemini sends numeric arguments as floats, which cannot slice a string
+    max_chars = int(max_chars) if max_chars else None
     logger = get_logger()
     logger.log_tool_call(
         tool_name="read_document",
-        parameters={"file_id": file_id}
+        parameters={"file_id": file_id, "pages": pages, "max_chars": max_chars, "locate": locate}
     )
     try:
         service = get_drive_service()
         if not service:
             return "Error: Drive authentication required."
         
-        # Get file metadata to check mimeType
-        file_metadata = service.files().get(fileId=file_id, fields='name,mimeType').execute()
+        # Get file metadata to check mimeType and the current version
+        file_metadata = drive_metadata.get_metadata(file_id, lambda: service)
         mime_type = file_metadata['mimeType']
         
-        fh = io.BytesIO()
-        
-        if mime_type == 'application/vnd.google-apps.document':
-            # Export Google Doc to plain text
-            request = service.files().export_media(fileId=file_id, mimeType='text/plain')
-        elif mime_type in ['application/pdf', 'text/plain']:
-            # Download binary content for PDF or text
-            request = service.files().get_media(fileId=file_id)
-        else:
+        if mime_type not in SUPPORTED_DOCUMENT_TYPES:
             return "Error: Unsupported file type. Supported: Google Docs, PDF, plain text."
         
-        # Download/export the content
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        fh.seek(0)
+        document_pages, cache_hit = load_document_pages(service, file_id, file_metadata)
+        if cache_hit:
+            logger.log_tool_call(
+                tool_name="read_document",
+                parameters={"file_id": file_id},
+                result=f"Cache hit for version {document_version(file_metadata)}"
+            )
         
-        if mime_type == 'application/pdf':
-            # Extract text from PDF
-            reader = PdfReader(fh)
-            content = ""
-            for page in reader.pages:
-                content += page.extract_text() + "\n"
-            return content.strip()
+        if not (pages or locate):
+            content = "\n".join(document_pages).strip()
         else:
-            # For text or exported Google Doc
-            content = fh.read().decode('utf-8')
-            return content.strip()
+            unit = "Page" if mime_type == 'application/pdf' else "Section"
+            try:
+                selected = (pdf_text.parse_page_range(pages, len(document_pages)) if pages
+                            else list(range(len(document_pages))))
+            except ValueError as e:
+                return f"Error: {e}"
+            scores = None
+            if locate:
+                ranked = BM25([document_pages[i] for i in selected]).top(locate, LOCATE_TOP_K)
+                if not ranked:
+                    return f"No {unit.lower()}s of {file_metadata['name']} match '{locate}'."
+                scores = {selected[i]: score for i, score in ranked}
+                selected = [selected[i] for i, _ in ranked]
+            content = (f"{file_metadata['name']} ({len(document_pages)} {unit.lower()}s total)\n\n"
+                       + _format_sections(document_pages, selected, unit, scores))
+        
+        if max_chars and len(content) > max_chars:
+            content = (content[:max_chars]
+                       + f"\n\n[Truncated: showing {max_chars} of {len(content)} characters. "
+                       f"Use pages or locate to read other parts.]")
+        return content
     
     except Exception as e:
         logger.log_error(
@@ -394,14 +904,28 @@ def read_document(file_id: str) -> str:
         )
         return f"Error reading document: {e}"
 
+@mcp.tool()
+def document_cache_stats() -> str:
+    """Report hit/miss metrics and usage of the read_document text cache."""
+    stats = get_text_cache().stats()
+    return (
+        f"Document text cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"(hit rate {stats['hit_rate']:.1%}), {stats['evictions']} evictions, "
+        f"{stats['entries']} entries, {stats['bytes']}/{stats['max_bytes']} bytes"
+    )
+
 # Tool definitions for Gemini integration
 if __name__ == "__main__":
     print("Google Drive Agent - Available Functions:")
-    print("1. list_files(max_results, query)")
+    print("1. list_files(max_results, query, page_token)")
     print("2. search_files(search_term, use_semantic)")
     print("3. download_file(file_id, destination)")
-    print("4. upload_file(filepath, folder_id)")
+    print("4. upload_file(filepath, folder_id, skip_duplicates)")
     print("5. semantic_search(query, max_files)")
     print("6. read_text_file(file_id)")
     # NEW: Add to the list
-    print("7. read_document(file_id)")
\ No newline at end of file
+    print("7. read_document(file_id, pages, max_chars, locate)")
+    print("8. upload_files(paths, folder_id, skip_duplicates)")
+    print("9. download_files(file_ids, dest_dir)")
+    print("10. document_cache_stats()")
+    print("11. index_file(file_id)")
\ No newline at end of file
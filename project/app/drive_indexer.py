@@ -0,0 +1,299 @@
+"""
+Background Drive Indexer
+Follows the Drive Changes API and keeps the local semantic index in sync with new or modified documents.
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import semantic_index
+from drive_agent import (
+    SUPPORTED_DOCUMENT_TYPES,
+    document_version,
+    get_drive_service,
+    iter_file_pages,
+    load_document_pages
+)
+from logging_utils import get_logger
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_PATH = os.getenv("DRIVE_INDEXER_CHECKPOINT", os.path.join(SCRIPT_DIR, "cache", "indexer_state.json"))
+# Seconds between polls of the Changes API once caught up
+POLL_INTERVAL = float(os.getenv("DRIVE_INDEXER_POLL_INTERVAL", 60))
+# Threads downloading and extracting text
+INDEXER_WORKERS = int(os.getenv("DRIVE_INDEXER_WORKERS", 4))
+# Chunks per embedding call, gathered across files
+EMBED_BATCH_CHUNKS = int(os.getenv("DRIVE_INDEXER_EMBED_BATCH", 256))
+
+FILE_FIELDS = "id, name, mimeType, md5Checksum, modifiedTime, trashed"
+CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    """Parse an RFC 3339 Drive timestamp."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class DriveIndexer:
+    """
+    Incremental indexer that runs in a daemon thread.
+    Progress is checkpointed after every processed page so a restart resumes where it stopped.
+    """
+
+    def __init__(self, checkpoint_path: str = CHECKPOINT_PATH, workers: int = INDEXER_WORKERS,
+                 poll_interval: float = POLL_INTERVAL, embed_batch: int = EMBED_BATCH_CHUNKS):
+        """
+        Initialize the indexer.
+
+        Args:
+            checkpoint_path: JSON file holding the change and backfill page tokens
+            workers: Number of download/extraction threads
+            poll_interval: Seconds to wait between polls once caught up
+            embed_batch: Maximum chunks per embedding call
+        """
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.embed_batch = embed_batch
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.state = self._load_checkpoint()
+        self.stats = {
+            "files_indexed": 0,
+            "files_skipped": 0,
+            "files_removed": 0,
+            "chunks_embedded": 0,
+            "chunks_unchanged": 0,
+            "errors": 0,
+            "pending": 0,
+            "last_poll": None,
+            "lag_seconds": None,
+            "embed_seconds": 0.0,
+            "started": None
+        }
+
+    def _load_checkpoint(self) -> Dict:
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"page_token": None, "backfill_token": None, "backfill_done": False}
+
+    def _save_checkpoint(self):
+        """Write the checkpoint atomically so a crash never leaves a torn file."""
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def start(self):
+        """Start the background thread (no-op if already running)."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.stats["started"] = time.time()
+        self.thread = threading.Thread(target=self._run, name="drive-indexer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 30):
+        """Ask the thread to stop after the current page and wait for it."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _run(self):
+        logger = get_logger()
+        while not self.stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                logger.log_error(
+                    error_type="drive_indexer_error",
+                    error_message=str(e),
+                    context="DriveIndexer._run"
+                )
+            self.stop_event.wait(self.poll_interval)
+
+    def poll_once(self):
+        """Backfill existing documents on first run, then apply pending changes."""
+        service = get_drive_service()
+        if not service:
+            raise RuntimeError("Drive authentication required.")
+
+        if not self.state["page_token"]:
+            # Take the change cursor before the backfill so edits made while
+            # crawling are picked up afterwards
+            start = service.changes().getStartPageToken().execute()
+            self.state["page_token"] = start["startPageToken"]
+            self._save_checkpoint()
+
+        if not self.state["backfill_done"]:
+            self._backfill(service)
+
+        token = self.state["page_token"]
+        while token and not self.stop_event.is_set():
+            response = service.changes().list(
+                pageToken=token, spaces="drive", pageSize=100, fields=CHANGE_FIELDS
+            ).execute()
+            removed, files = [], []
+            for change in response.get("changes", []):
+                file = change.get("file") or {}
+                if change.get("removed") or file.get("trashed"):
+                    removed.append(change["fileId"])
+                elif file.get("mimeType") in SUPPORTED_DOCUMENT_TYPES:
+                    files.append(file)
+            self._remove(removed)
+            self._index(files, track_lag=True)
+            if "newStartPageToken" in response:
+                self.state["page_token"] = response["newStartPageToken"]
+                token = None
+            else:
+                token = self.state["page_token"] = response["nextPageToken"]
+            self._save_checkpoint()
+
+        with self.lock:
+            self.stats["last_poll"] = time.time()
+
+    def _backfill(self, service):
+        """Crawl every supported document once, checkpointing the listing cursor per page."""
+        mime_filter = " or ".join(f"mimeType = '{m}'" for m in SUPPORTED_DOCUMENT_TYPES)
+        query = f"({mime_filter}) and trashed = false"
+        pages = iter_file_pages(service, query=query, page_token=self.state["backfill_token"],
+                                fields=f"files({FILE_FIELDS})", page_size=100)
+        for files, next_token in pages:
+            self._index(files)
+            self.state["backfill_token"] = next_token
+            self._save_checkpoint()
+            if self.stop_event.is_set():
+                return
+        self.state["backfill_done"] = True
+        self._save_checkpoint()
+
+    def _remove(self, file_ids: List[str]):
+        for file_id in file_ids:
+            semantic_index.remove_document(file_id)
+        with self.lock:
+            self.stats["files_removed"] += len(file_ids)
+
+    def _extract(self, file: Dict) -> str:
+        """Return the text of a file, reusing the read_document cache. Runs on a worker thread."""
+        # Drive services are not thread-safe, so each worker builds its own
+        pages, _ = load_document_pages(get_drive_service(), file["id"], file)
+        return "\n".join(pages)
+
+    def _index(self, files: List[Dict], track_lag: bool = False):
+        """
+        Extract changed files in parallel, then embed their changed chunks in shared batches.
+
+        Args:
+            files: Drive file metadata (FILE_FIELDS)
+            track_lag: Record modification-to-index lag (skipped for the backfill of old files)
+        """
+        stale = [f for f in files
+                 if semantic_index.indexed_version(f["id"]) != (document_version(f) or "")]
+        with self.lock:
+            self.stats["files_skipped"] += len(files) - len(stale)
+            self.stats["pending"] = len(stale)
+        if not stale:
+            return
+
+        logger = get_logger()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="drive-indexer") as pool:
+            futures = [(f, pool.submit(self._extract, f)) for f in stale]
+            plans = []
+            for file, future in futures:
+                try:
+                    chunks = semantic_index.chunk_text(future.result())
+                except Exception as e:
+                    with self.lock:
+                        self.stats["errors"] += 1
+                    logger.log_error(
+                        error_type="drive_indexer_extract_error",
+                        error_message=str(e),
+                        context=f"DriveIndexer._extract({file['id']})"
+                    )
+                    continue
+                changed, unchanged, removed = semantic_index.plan_update(file["id"], chunks)
+                plans.append((file, chunks, changed, unchanged, removed))
+
+        # One embedding call per batch of chunks, regardless of which file they came from
+        pending = [(p, i) for p in plans for i in p[2]]
+        vectors = {}
+        started = time.time()
+        for offset in range(0, len(pending), self.embed_batch):
+            batch = pending[offset:offset + self.embed_batch]
+            embeddings = semantic_index.embed([plan[1][i] for plan, i in batch])
+            for (plan, i), vector in zip(batch, embeddings):
+                vectors[(plan[0]["id"], i)] = vector
+        embed_seconds = time.time() - started
+
+        now = datetime.now(timezone.utc)
+        lags = []
+        for file, chunks, changed, unchanged, removed in plans:
+            semantic_index.write_chunks(
+                file["id"], file.get("name", ""), document_version(file) or "",
+                chunks, changed, unchanged, removed,
+                [vectors[(file["id"], i)] for i in changed]
+            )
+            modified = _parse_time(file.get("modifiedTime")) if track_lag else None
+            if modified:
+                lags.append((now - modified).total_seconds())
+
+        with self.lock:
+            self.stats["files_indexed"] += len(plans)
+            self.stats["chunks_embedded"] += len(pending)
+            self.stats["chunks_unchanged"] += sum(len(p[3]) for p in plans)
+            self.stats["embed_seconds"] += embed_seconds
+            self.stats["pending"] = 0
+            if lags:
+                self.stats["lag_seconds"] = max(lags)
+
+    def status(self) -> Dict:
+        """Return a snapshot of progress, lag and throughput."""
+        with self.lock:
+            stats = dict(self.stats)
+        embed_seconds = stats.pop("embed_seconds")
+        stats["embed_chunks_per_second"] = stats["chunks_embedded"] / embed_seconds if embed_seconds else 0.0
+        stats["running"] = bool(self.thread and self.thread.is_alive())
+        stats["backfill_done"] = self.state["backfill_done"]
+        return stats
+
+
+_indexer: Optional[DriveIndexer] = None
+_indexer_lock = threading.Lock()
+
+
+def get_indexer() -> DriveIndexer:
+    """Get or create the shared indexer."""
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None:
+            _indexer = DriveIndexer()
+        return _indexer
+
+
+def indexer_status() -> str:
+    """Human-readable indexer status for the agent and operators."""
+    stats = get_indexer().status()
+    last_poll = datetime.fromtimestamp(stats["last_poll"]).strftime("%Y-%m-%d %H:%M:%S") if stats["last_poll"] else "never"
+    lag = f"{stats['lag_seconds']:.0f}s" if stats["lag_seconds"] is not None else "N/A"
+    return (
+        f"Drive indexer: {'running' if stats['running'] else 'stopped'}, "
+        f"backfill {'complete' if stats['backfill_done'] else 'in progress'}, last poll {last_poll}\n"
+        f"Files indexed: {stats['files_indexed']} | unchanged: {stats['files_skipped']} | "
+        f"removed: {stats['files_removed']} | pending: {stats['pending']} | errors: {stats['errors']}\n"
+        f"Chunks embedded: {stats['chunks_embedded']} | reused: {stats['chunks_unchanged']} | "
+        f"throughput: {stats['embed_chunks_per_second']:.1f} chunks/s | lag: {lag}"
+    )
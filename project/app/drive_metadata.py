@@ -0,0 +1,181 @@
+"""
+Batched Drive Metadata Resolver
+Coalesces files().get lookups issued within a short window into a single BatchHttpRequest
+and caches the results for the lifetime of one agent request. Errors are only cached when a
+retry cannot help (404, or 403 other than rate limiting); transient ones are retried.
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Every drive tool reads from this one field set so a single lookup serves them all
+METADATA_FIELDS = "id, name, mimeType, md5Checksum, modifiedTime, size"
+# Seconds a lookup waits for others to join its batch
+BATCH_WINDOW = float(os.getenv("DRIVE_METADATA_BATCH_WINDOW", 0.01))
+# Drive accepts at most 100 calls per batch request
+MAX_BATCH_SIZE = 100
+
+
+class MetadataResolver:
+    """
+    Thread-safe metadata resolver.
+    The first caller in a window becomes the leader, waits BATCH_WINDOW for other lookups
+    to queue up and then fetches all of them in one batch round-trip.
+    """
+
+    def __init__(self, window: float = BATCH_WINDOW):
+        """
+        Initialize the resolver.
+
+        Args:
+            window: Seconds to wait for lookups to coalesce before flushing
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        # Metadata, or a definitive error, per file
+        self.results: Dict[str, object] = {}
+        # Transient error of the latest lookup, handed to its waiters; the next lookup retries
+        self.errors: Dict[str, Exception] = {}
+        self.pending: Dict[str, threading.Event] = {}
+        self.queue: List[str] = []
+        self.leader_waiting = False
+        self.stats = {"lookups": 0, "cache_hits": 0, "round_trips": 0, "files_fetched": 0}
+
+    def get(self, file_id: str, service_factory: Callable) -> Dict:
+        """
+        Return metadata for a file, batching with concurrent lookups.
+
+        Raises:
+            The Drive error for this file if the lookup failed
+        """
+        with self.lock:
+            self.stats["lookups"] += 1
+            if file_id in self.results:
+                self.stats["cache_hits"] += 1
+                return self._result(file_id)
+            event = self.pending.get(file_id)
+            leader = False
+            if event is None:
+                event = self.pending[file_id] = threading.Event()
+                self.queue.append(file_id)
+                leader = not self.leader_waiting
+                self.leader_waiting = self.leader_waiting or leader
+
+        if leader:
+            time.sleep(self.window)
+            self._flush(service_factory)
+        event.wait()
+        with self.lock:
+            if file_id not in self.results:
+                raise self.errors[file_id]
+            return self._result(file_id)
+
+    def prefetch(self, file_ids: List[str], service_factory: Callable):
+        """Fetch metadata for many files up front in as few round-trips as possible."""
+        with self.lock:
+            for file_id in dict.fromkeys(file_ids):
+                if file_id not in self.results and file_id not in self.pending:
+                    self.pending[file_id] = threading.Event()
+                    self.queue.append(file_id)
+        self._flush(service_factory)
+
+    def _result(self, file_id: str) -> Dict:
+        """Return a stored result or raise its stored error. Caller holds the lock."""
+        result = self.results[file_id]
+        if isinstance(result, Exception):
+            raise result
+        return dict(result)
+
+    def _flush(self, service_factory: Callable):
+        with self.lock:
+            file_ids, self.queue = self.queue, []
+            self.leader_waiting = False
+        for start in range(0, len(file_ids), MAX_BATCH_SIZE):
+            self._fetch(file_ids[start:start + MAX_BATCH_SIZE], service_factory)
+
+    def _fetch(self, file_ids: List[str], service_factory: Callable):
+        """Fetch one group of ids and wake everyone waiting on them."""
+        if not file_ids:
+            return
+        results = {}
+        try:
+            service = service_factory()
+            if not service:
+                raise RuntimeError("Drive authentication required.")
+            if len(file_ids) == 1:
+                # A batch envelope only adds overhead for a single call
+                results[file_ids[0]] = service.files().get(fileId=file_ids[0], fields=METADATA_FIELDS).execute()
+            else:
+                def callback(request_id, response, exception):
+                    results[request_id] = exception if exception is not None else response
+
+                batch = service.new_batch_http_request(callback=callback)
+                for file_id in file_ids:
+                    batch.add(service.files().get(fileId=file_id, fields=METADATA_FIELDS), request_id=file_id)
+                batch.execute()
+        except Exception as e:
+            for file_id in file_ids:
+                results.setdefault(file_id, e)
+
+        with self.lock:
+            self.stats["round_trips"] += 1
+            self.stats["files_fetched"] += len(file_ids)
+            for file_id in file_ids:
+                result = results.get(file_id, RuntimeError(f"No metadata returned for {file_id}"))
+                if isinstance(result, Exception) and not is_definitive(result):
+                    self.errors[file_id] = result
+                else:
+                    self.results[file_id] = result
+                    self.errors.pop(file_id, None)
+                self.pending.pop(file_id).set()
+
+
+def is_definitive(error: Exception) -> bool:
+    """True for Drive errors a retry cannot fix: the file is missing or not accessible."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        return False
+    status = int(status)
+    if status == 403:
+        # Rate limits are reported as 403 too
+        return "ratelimitexceeded" not in str(error).lower().replace(" ", "")
+    return status == 404
+
+
+_current_resolver: contextvars.ContextVar[Optional[MetadataResolver]] = contextvars.ContextVar(
+    "drive_metadata_resolver", default=None
+)
+
+
+@contextmanager
+def metadata_scope():
+    """
+    Share one resolver (and its cache) for the duration of a request.
+    Worker threads see it when started with contextvars.copy_context().
+    """
+    resolver = MetadataResolver()
+    token = _current_resolver.set(resolver)
+    try:
+        yield resolver
+    finally:
+        _current_resolver.reset(token)
+
+
+def get_resolver() -> MetadataResolver:
+    """Return the request's resolver, or a throwaway one outside a metadata_scope."""
+    return _current_resolver.get() or MetadataResolver()
+
+
+def get_metadata(file_id: str, service_factory: Callable) -> Dict:
+    """Resolve metadata for one file through the current request's resolver."""
+    return get_resolver().get(file_id, service_factory)
+
+
+def prefetch(file_ids: List[str], service_factory: Callable):
+    """Warm the current request's resolver with metadata for several files."""
+    resolver = _current_resolver.get()
+    if resolver is not None:
+        resolver.prefetch(file_ids, service_factory)
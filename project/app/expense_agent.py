@@ -1,11 +1,20 @@
 """
 Expense Agent for Reimbursement Validation
-Uses Gemini to validate a receipt PDF against a fixed expense policy.
+Uses Gemini to validate a receipt PDF against the (hot-reloaded) expense policy.
 """
 import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
-import google.generativeai as genai
-import fitz  # PyMuPDF for PDF text extraction
+import pdf_text  # Shared PyMuPDF extraction
+import expense_rules
+import expense_policy
+import upload_store  # Original names of uploaded receipts
+from verdict_cache import file_sha256, get_verdict_cache
+from gemini_client import get_genai
 from datetime import datetime
 from mcp.server.fastmcp import FastMCP
 from logging_utils import get_logger
@@ -14,33 +23,90 @@ from logging_utils import get_logger
 mcp = FastMCP("Expense Agent")
 load_dotenv()
 
-# Configure Gemini
+# Gemini is configured on first use (see gemini_client)
 API_KEY = os.getenv("GEMINI_API_KEY")
-if API_KEY:
-    genai.configure(api_key=API_KEY)
-else:
+if not API_KEY:
     print("Warning: GEMINI_API_KEY not set.")
 
 AI_MODEL = "gemini-2.5-flash"
+# Gemini requests per minute allowed across concurrent validations
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 60))
+# Receipts validated at once by validate_reimbursements
+BATCH_CONCURRENCY = int(os.getenv("EXPENSE_BATCH_CONCURRENCY", 8))
 
-# Fixed policy text (loaded from Expense Policy.txt)
-# Assuming Expense Policy.txt is in the same directory; adjust path if needed
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-POLICY_PATH = os.path.join(SCRIPT_DIR, "Expense Policy.txt")
+# JSON schema for the single validation call
+VERDICT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "receipt_date": {"type": "STRING", "description": "Receipt date as YYYY-MM-DD, or UNKNOWN"},
+        "total": {"type": "NUMBER"},
+        "items": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "description": {"type": "STRING"},
+                    "amount": {"type": "NUMBER"},
+                    "eligible": {"type": "BOOLEAN"}
+                },
+                "required": ["description", "eligible"]
+            }
+        },
+        "violated_rule": {"type": "STRING"},
+        "verdict": {"type": "STRING", "format": "enum", "enum": ["APPROVED", "DENIED"]}
+    },
+    "required": ["receipt_date", "items", "violated_rule", "verdict"]
+}
 
-with open(POLICY_PATH, "r", encoding="utf-8") as f:
-    POLICY_TEXT = f.read()
+# The policy (Expense Policy.txt) is reloaded whenever the file changes; each validation
+# works against one snapshot holding its text, compiled hard rules and version hash.
+# It is first read on the first validation, not at import.
+_policy_watched = False
+_policy_watch_lock = threading.Lock()
+
+def current_policy() -> expense_policy.PolicySnapshot:
+    """Return the current policy snapshot, tying verdict cache invalidation to policy changes on first use."""
+    global _policy_watched
+    with _policy_watch_lock:
+        if not _policy_watched:
+            policy_store = expense_policy.get_policy_store()
+            # Cached verdicts are only valid for the policy and rules version they were reached under
+            get_verdict_cache().purge_other_policies(verdict_key(policy_store.snapshot))
+            policy_store.on_change(lambda snapshot: get_verdict_cache().purge_other_policies(verdict_key(snapshot)))
+            _policy_watched = True
+    return expense_policy.current_policy()
+
+def verdict_key(policy: expense_policy.PolicySnapshot) -> str:
+    """Verdict cache key for a policy: its text hash plus the deterministic rules version."""
+    return f"{policy.version}:rules-{expense_rules.RULES_VERSION}"
 
 def read_pdf_text(pdf_path: str) -> str:
     """Extract all text from a PDF file."""
     if not os.path.exists(pdf_path):
         return "Error: Receipt file not found."
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    doc.close()
-    return text
+    return pdf_text.extract_text(pdf_path)
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing calls evenly to stay under a requests-per-minute quota.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        """Block until the caller may issue its request."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# Shared across concurrent validations so batches respect the Gemini quota
+gemini_limiter = RateLimiter(GEMINI_RPM)
 
 @mcp.tool()
 def validate_reimbursement(receipt_path: str) -> str:
@@ -56,76 +122,125 @@ def validate_reimbursement(receipt_path: str) -> str:
         tool_name="validate_reimbursement",
         parameters={"receipt_path": receipt_path}
     )
-    receipt_text = read_pdf_text(receipt_path)
-    if receipt_text.startswith("Error"):
-        return "DENIED"  # No receipt, no reimbursement
+    cached, receipt_hash = lookup_cached_verdict(receipt_path)
+    if cached:
+        return cached[0]
+    verdict, _ = validate_receipt_text(receipt_path, read_pdf_text(receipt_path), receipt_hash)
+    return verdict
 
-    # Step 1: Extract receipt date
-    date_prompt = f"""
-    Extract only the receipt date from the following text.
-    Return the date in ISO format (YYYY-MM-DD) if possible.
-    If no date is found, reply with 'UNKNOWN'.
+def lookup_cached_verdict(receipt_path: str) -> Tuple[Optional[Tuple[str, str]], Optional[str]]:
+    """
+    Look up a previous verdict for identical receipt bytes under the current policy.
+    
+    Returns:
+        ((verdict, reason) or None, receipt SHA-256 or None if the file is missing)
+    """
+    if not os.path.exists(receipt_path):
+        return None, None
+    receipt_hash = file_sha256(receipt_path)
+    cached = get_verdict_cache().get(receipt_hash, verdict_key(current_policy()))
+    if cached:
+        get_logger().log_tool_call(
+            tool_name="validate_reimbursement",
+            parameters={"receipt_path": receipt_path},
+            result=f"{cached[0]} (cached verdict for receipt {receipt_hash[:12]})"
+        )
+    return cached, receipt_hash
 
-    Receipt text:
-    {receipt_text}
+def validate_receipt_text(receipt_path: str, receipt_text: str, receipt_hash: str = None) -> Tuple[str, str]:
+    """
+    Validate already-extracted receipt text against the policy.
+    Definite verdicts are stored in the verdict cache when receipt_hash is given.
+    
+    Returns:
+        (verdict, reason) where verdict is 'APPROVED' or 'DENIED'
     """
+    logger = get_logger()
+    if receipt_text.startswith("Error"):
+        return "DENIED", "Receipt file not found"  # No receipt, no reimbursement
 
-    model = genai.GenerativeModel(AI_MODEL)
-    date_response = model.generate_content(date_prompt)
-    receipt_date_str = date_response.text.strip()
+    policy = current_policy()
+
+    # Step 0: Deterministic pre-screen; clear violations are denied without calling Gemini
+    screen = expense_rules.prescreen(receipt_text, policy.rules)
+    if screen.verdict:
+        reason = '; '.join(screen.violations)
+        logger.log_tool_call(
+            tool_name="validate_reimbursement",
+            parameters={"receipt_path": receipt_path},
+            result=f"DENIED by policy rules: {reason}"
+        )
+        if receipt_hash:
+            get_verdict_cache().put(receipt_hash, verdict_key(policy), "DENIED", reason,
+                                    screen.receipt.date, policy.rules.max_age_days)
+        return "DENIED", reason
 
-    # Step 2: Compute days since receipt
+    # Step 1: Extract receipt date locally
     analysis_date = datetime.now()
-    days_since_receipt = None
-    receipt_date = None
+    receipt_date = screen.receipt.date
+    days_since_receipt = screen.days_since_receipt
 
-    try:
-        if receipt_date_str != "UNKNOWN":
-            receipt_date = datetime.strptime(receipt_date_str, "%Y-%m-%d")
-            days_since_receipt = (analysis_date - receipt_date).days
-    except Exception:
-        pass  # If parsing fails, treat as UNKNOWN
-    logger.log_model_response(
-        model_name=f"{AI_MODEL} (expense_date_extraction)",
-        prompt=date_prompt,
-        response=receipt_date_str,
-        thinking_trace="Extracting receipt date from PDF text"
-    )
-    # Step 3: Build main prompt
+    # Step 2: Build the prompt for a single structured call covering date, items and verdict
     current_date = analysis_date.strftime("%Y-%m-%d")
+    # The policy lives in a Gemini cached context when possible; otherwise its compact form is inlined
+    model, inline_policy = expense_policy.get_policy_context_cache().model(
+        policy,
+        AI_MODEL,
+        generation_config=get_genai().GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=VERDICT_SCHEMA
+        )
+    )
     main_prompt = f"""
-    You are an expense auditor.
     Date of analysis: {current_date}
-
+    """
+    if inline_policy:
+        main_prompt = f"""
+    You are an expense auditor.{main_prompt}
     Here is the company policy document:
-    {POLICY_TEXT}
-
+    {inline_policy}
+    """
+    main_prompt += f"""
     Here is the receipt with expenses:
     {receipt_text}
     """
 
     if receipt_date:
         main_prompt += f"""
-        The receipt is dated {receipt_date_str}, which is {days_since_receipt} days ago.
+        The receipt is dated {receipt_date.strftime("%Y-%m-%d")}, which is {days_since_receipt} days ago.
+        """
+
+    if screen.receipt.items:
+        items = "\n".join(f"- {item.description}: ${item.amount:.2f}" for item in screen.receipt.items)
+        main_prompt += f"""
+        A local pre-screen parsed these line items and found no date, amount or excluded-item violations:
+        {items}
+        Focus on whether each item is an eligible expense under the policy.
         """
 
-    main_prompt += """
-    Task: Determine if the reimbursement for the item(s) in the receipt should be granted based on the policy, including date constraints (e.g., must be within 30 days), eligible items, price limits, and non-reimbursable items.
-    Output only 'APPROVED' or 'DENIED'. If any part violates the policy (e.g., date too old, item not eligible, over $100), output 'DENIED'.
+    main_prompt += f"""
+    Task: Determine if the reimbursement for the item(s) in the receipt should be granted based on the policy, including date constraints (e.g., must be within {policy.rules.max_age_days} days), eligible items, price limits, and non-reimbursable items.
+    Report the receipt date (YYYY-MM-DD, or UNKNOWN), the total, each item with whether it is eligible, the policy rule that is violated (empty if none) and the verdict.
+    If any part violates the policy (e.g., date too old, item not eligible, over ${policy.rules.max_amount:.0f}), the verdict is 'DENIED'.
     """
 
-    # Call Gemini
-    # Call Gemini
+    # Step 3: One Gemini call with a JSON response schema
+    gemini_limiter.wait()
     response = model.generate_content(main_prompt)
-    result = response.text.strip().upper()
-    
-    logger. log_model_response(
+
+    try:
+        verdict = json.loads(response.text)
+        result = str(verdict.get("verdict", "")).strip().upper()
+    except (ValueError, AttributeError) as e:
+        verdict, result = {}, f"UNPARSEABLE: {e}"
+
+    logger.log_model_response(
         model_name=f"{AI_MODEL} (expense_validation)",
         prompt=main_prompt,
-        response=result,
-        thinking_trace=f"Validating reimbursement against policy. Receipt date: {receipt_date_str if receipt_date else 'UNKNOWN'}, Days since: {days_since_receipt if days_since_receipt else 'N/A'}"
+        response=json.dumps(verdict) if verdict else result,
+        thinking_trace=f"Validating reimbursement against policy. Receipt date: {receipt_date.strftime('%Y-%m-%d') if receipt_date else verdict.get('receipt_date', 'UNKNOWN')}, Days since: {days_since_receipt if days_since_receipt is not None else 'N/A'}"
     )
-    
+
     # Ensure output is strictly APPROVED or DENIED
     if result not in ["APPROVED", "DENIED"]:
         logger.log_error(
@@ -133,16 +248,108 @@ def validate_reimbursement(receipt_path: str) -> str:
             error_message=f"Model returned unclear result: {result}",
             context="validate_reimbursement"
         )
-        return "DENIED"  # Default to denied if unclear
-    
+        return "DENIED", "Model returned an unclear verdict"  # Default to denied if unclear
+
+    # The date rule stays deterministic even when only the model could find the date
+    if not receipt_date:
+        try:
+            receipt_date = datetime.strptime(verdict.get("receipt_date", ""), "%Y-%m-%d")
+            if result == "APPROVED" and (analysis_date - receipt_date).days > policy.rules.max_age_days:
+                result = "DENIED"
+                verdict["violated_rule"] = f"Receipt is older than {policy.rules.max_age_days} days"
+        except ValueError:
+            pass  # UNKNOWN or malformed; keep the model's verdict
+
+    reason = verdict.get("violated_rule") or ""
     logger.log_tool_call(
         tool_name="validate_reimbursement",
         parameters={"receipt_path": receipt_path},
-        result=result
+        result=f"{result} (violated rule: {reason or 'none'})"
     )
+
+    if receipt_hash:
+        get_verdict_cache().put(receipt_hash, verdict_key(policy), result, reason, receipt_date, policy.rules.max_age_days)
+    return result, reason
+
+@mcp.tool()
+def validate_reimbursements(receipt_paths: List[str]) -> str:
+    """
+    Validate many receipt PDFs in one call and return a verdict table.
+    Text is extracted in a process pool; policy checks and Gemini calls run concurrently
+    under the shared rate limit.
     
-    return result
+    Args:
+        receipt_paths: Local paths to the receipt PDFs.
+    """
+    logger = get_logger()
+    logger.log_tool_call(
+        tool_name="validate_reimbursements",
+        parameters={"receipt_paths": receipt_paths}
+    )
+    paths = list(dict.fromkeys(receipt_paths))
+    if not paths:
+        return "Error: No receipts provided."
+
+    # Receipts seen before under this policy skip extraction and Gemini entirely
+    results, hashes = {}, {}
+    for path in paths:
+        cached, hashes[path] = lookup_cached_verdict(path)
+        if cached:
+            results[path] = cached
+    pending = [p for p in paths if p not in results]
+
+    existing = [p for p in pending if os.path.exists(p)]
+    texts = dict(zip(existing, pdf_text.extract_many(existing)))
+
+    def validate(path):
+        text = texts.get(path, "Error: Receipt file not found.")
+        if isinstance(text, Exception):
+            return "DENIED", f"Could not read receipt: {text}"
+        return validate_receipt_text(path, text, hashes[path])
+
+    workers = max(1, min(BATCH_CONCURRENCY, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="validate") as pool:
+        futures = {pool.submit(validate, path): path for path in pending}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = ("DENIED", f"Error: {e}")
+
+    approved = sum(1 for verdict, _ in results.values() if verdict == "APPROVED")
+    output = [
+        f"Validated {len(paths)} receipts: {approved} APPROVED, {len(paths) - approved} DENIED",
+        "",
+        "| # | Receipt | Verdict | Reason |",
+        "|---|---------|---------|--------|"
+    ]
+    for i, path in enumerate(paths, 1):
+        verdict, reason = results[path]
+        name = (upload_store.original_name(path) or os.path.basename(path)).replace('|', '/')
+        output.append(f"| {i} | {name} | {verdict} | {reason.replace('|', '/') or '-'} |")
+
+    logger.log_tool_call(
+        tool_name="validate_reimbursements",
+        parameters={"receipt_paths": receipt_paths},
+        result=f"{approved}/{len(paths)} approved"
+    )
+    return "\n".join(output)
+
+@mcp.tool()
+def prescreen_stats() -> str:
+    """Report how many receipts the local policy rules and the verdict cache resolved without calling Gemini."""
+    stats = expense_rules.stats.snapshot()
+    cache = get_verdict_cache().stats()
+    return (
+        f"Expense pre-screen: {stats['screened']} receipts screened, "
+        f"{stats['fast_path']} resolved locally ({stats['fast_path_rate']:.1%}), "
+        f"{stats['sent_to_llm']} sent to Gemini\n"
+        f"Verdict cache: {cache['hits']} hits, {cache['misses']} misses "
+        f"(hit rate {cache['hit_rate']:.1%}), {cache['entries']} entries"
+    )
 
 if __name__ == "__main__":
     print("Expense Agent - Available Functions:")
-    print("1. validate_reimbursement(receipt_path)")
\ No newline at end of file
+    print("1. validate_reimbursement(receipt_path)")
+    print("2. validate_reimbursements(receipt_paths)")
+    print("3. prescreen_stats()")
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+Hot-Reloadable Expense Policy
+Loads Expense Policy.txt into a versioned snapshot (structured rules plus a compact prompt form),
+reloads it when the file changes on disk and keeps a Gemini cached context per policy version
+so validation prompts do not re-send the policy text.
+"""
+import os
+import time
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import expense_rules
+from gemini_client import get_genai
+from logging_utils import get_logger
+from verdict_cache import text_sha256
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+POLICY_PATH = os.getenv("EXPENSE_POLICY_PATH", os.path.join(SCRIPT_DIR, "Expense Policy.txt"))
+# Minimum seconds between stat() calls on the policy file
+POLICY_CHECK_INTERVAL = float(os.getenv("EXPENSE_POLICY_CHECK_INTERVAL", 2))
+# Lifetime of the Gemini cached context; it is recreated shortly before it expires
+POLICY_CACHE_TTL = int(os.getenv("EXPENSE_POLICY_CACHE_TTL", 3600))
+POLICY_CACHE_ENABLED = os.getenv("EXPENSE_POLICY_CACHE", "1") != "0"
+CACHE_REFRESH_MARGIN = 60
+# Gemini refuses to cache contexts below this many tokens; smaller policies go inline without asking
+POLICY_CACHE_MIN_TOKENS = int(os.getenv("EXPENSE_POLICY_CACHE_MIN_TOKENS", 1024))
+# Rough token estimate for the size check
+CHARS_PER_TOKEN = 4
+# Backoff after a failed context creation: first delay, doubling per consecutive failure up to the cap
+CACHE_RETRY_INITIAL_DELAY = 5.0
+CACHE_RETRY_MAX_DELAY = 300.0
+
+AUDITOR_INSTRUCTION = "You are an expense auditor. Judge receipts strictly against this company expense policy:"
+
+
+@dataclass
+class PolicySnapshot:
+    text: str
+    compact: str
+    rules: expense_rules.PolicyRules
+    version: str
+    mtime: float
+    loaded_at: float
+
+
+def compact_policy(text: str) -> str:
+    """
+    Condense the policy for prompts: drop blank lines and fold each bullet's sub-items
+    into a single comma-separated line under it.
+    """
+    lines: List[str] = []
+    sub_items: List[str] = []
+
+    def flush():
+        if sub_items and lines:
+            lines[-1] = f"{lines[-1].rstrip(':')}: {', '.join(sub_items)}"
+        sub_items.clear()
+
+    for raw in text.lstrip("\ufeff").splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("*"):
+            sub_items.append(line.lstrip("* ").strip())
+            continue
+        flush()
+        lines.append(f"- {line.lstrip('- ').strip()}" if line.startswith("-") else line)
+    flush()
+    return "\n".join(lines)
+
+
+def load_policy(path: str = POLICY_PATH) -> PolicySnapshot:
+    """Read and compile the policy file into a snapshot."""
+    mtime = os.stat(path).st_mtime
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return PolicySnapshot(
+        text=text,
+        compact=compact_policy(text),
+        rules=expense_rules.compile_policy(text),
+        version=text_sha256(text),
+        mtime=mtime,
+        loaded_at=time.time()
+    )
+
+
+class PolicyStore:
+    """
+    Thread-safe holder of the current policy snapshot.
+    current() checks the file's mtime at most every check_interval seconds and swaps in a
+    new snapshot when it changed; readers keep whichever snapshot they already hold.
+    """
+
+    def __init__(self, path: str = POLICY_PATH, check_interval: float = POLICY_CHECK_INTERVAL):
+        """
+        Initialize the store and load the policy.
+
+        Args:
+            path: Policy text file
+            check_interval: Minimum seconds between checks for changes
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.listeners: List[Callable[[PolicySnapshot], None]] = []
+        self.snapshot = load_policy(path)
+        self.last_check = time.monotonic()
+        self.reloads = 0
+
+    def on_change(self, listener: Callable[[PolicySnapshot], None]):
+        """Call listener with the new snapshot whenever the policy version changes."""
+        self.listeners.append(listener)
+
+    def current(self) -> PolicySnapshot:
+        """Return the current snapshot, reloading it first if the file changed."""
+        with self.lock:
+            if time.monotonic() - self.last_check < self.check_interval:
+                return self.snapshot
+            self.last_check = time.monotonic()
+            try:
+                changed = os.stat(self.path).st_mtime != self.snapshot.mtime
+            except OSError:
+                changed = False  # Keep serving the last good policy while the file is replaced
+            if not changed:
+                return self.snapshot
+        return self.reload()
+
+    def reload(self) -> PolicySnapshot:
+        """Re-read the policy file; on failure the previous snapshot stays active."""
+        try:
+            snapshot = load_policy(self.path)
+        except OSError as e:
+            get_logger().log_error(
+                error_type="expense_policy_reload_failed",
+                error_message=str(e),
+                context=self.path
+            )
+            return self.snapshot
+
+        with self.lock:
+            previous = self.snapshot
+            self.snapshot = snapshot
+            self.last_check = time.monotonic()
+            if snapshot.version == previous.version:
+                return snapshot
+            self.reloads += 1
+
+        get_logger().log_tool_call(
+            tool_name="expense_policy_reload",
+            parameters={"path": self.path},
+            result=f"Policy updated to version {snapshot.version[:12]} (was {previous.version[:12]})"
+        )
+        for listener in self.listeners:
+            listener(snapshot)
+        return snapshot
+
+
+class PolicyContextCache:
+    """
+    Gemini cached contexts holding the policy, one per policy version and model.
+    Policies below the model's minimum cacheable size are remembered as uncacheable and
+    sent inline in their compact form instead; other creation failures are retried with backoff.
+    """
+
+    def __init__(self, ttl: int = POLICY_CACHE_TTL, enabled: bool = POLICY_CACHE_ENABLED,
+                 min_tokens: int = POLICY_CACHE_MIN_TOKENS):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.min_tokens = min_tokens
+        self.lock = threading.Lock()
+        self.contexts: Dict[Tuple[str, str], Tuple[object, float]] = {}
+        self.uncacheable = set()
+        # Keys whose context is being created, so concurrent callers wait instead of creating another
+        self.creating: Dict[Tuple[str, str], threading.Event] = {}
+        # key -> (consecutive failures, earliest next attempt)
+        self.failures: Dict[Tuple[str, str], Tuple[int, float]] = {}
+
+    def get(self, snapshot: PolicySnapshot, model_name: str):
+        """Return a live CachedContent for this policy version, or None to send the policy inline."""
+        key = (snapshot.version, model_name)
+        if not self.enabled:
+            return None
+        if len(snapshot.compact) / CHARS_PER_TOKEN < self.min_tokens:
+            with self.lock:
+                self.uncacheable.add(key)
+            return None
+        with self.lock:
+            if key in self.uncacheable:
+                return None
+            entry = self.contexts.get(key)
+            if entry and entry[1] - CACHE_REFRESH_MARGIN > time.time():
+                return entry[0]
+            failure = self.failures.get(key)
+            if failure and failure[1] > time.monotonic():
+                return None
+            creating = self.creating.get(key)
+            if creating is None:
+                self.creating[key] = threading.Event()
+        if creating is not None:
+            creating.wait()
+            with self.lock:
+                entry = self.contexts.get(key)
+                return entry[0] if entry else None
+
+        stale = []
+        context = None
+        try:
+            context = get_genai().caching.CachedContent.create(
+                model=model_name,
+                display_name=f"expense-policy-{snapshot.version[:12]}",
+                system_instruction=AUDITOR_INSTRUCTION,
+                contents=[snapshot.compact],
+                ttl=timedelta(seconds=self.ttl)
+            )
+        except Exception as e:
+            with self.lock:
+                if _below_minimum_size(e):
+                    self.uncacheable.add(key)
+                    note = "sent inline"
+                else:
+                    count = self.failures.get(key, (0, 0.0))[0] + 1
+                    delay = min(CACHE_RETRY_INITIAL_DELAY * 2 ** (count - 1), CACHE_RETRY_MAX_DELAY)
+                    self.failures[key] = (count, time.monotonic() + delay)
+                    note = f"sent inline, retrying in {delay:.0f}s"
+            get_logger().log_error(
+                error_type="expense_policy_cache_unavailable",
+                error_message=str(e),
+                context=f"policy {snapshot.version[:12]} {note}"
+            )
+        else:
+            with self.lock:
+                self.contexts[key] = (context, time.time() + self.ttl)
+                self.failures.pop(key, None)
+                stale = [self.contexts.pop(k)[0] for k in list(self.contexts) if k[1] == model_name and k != key]
+        finally:
+            with self.lock:
+                self.creating.pop(key).set()
+        for old in stale:
+            self._delete(old)
+        return context
+
+    def _delete(self, context):
+        try:
+            context.delete()
+        except Exception:
+            pass  # The context expires on its own
+
+    def model(self, snapshot: PolicySnapshot, model_name: str,
+              generation_config=None) -> Tuple[object, Optional[str]]:
+        """
+        Build a model for validating against this policy.
+
+        Returns:
+            (model, inline_policy) where inline_policy is the compact policy text the prompt must
+            include, or None when the model already carries the policy through a cached context
+        """
+        genai = get_genai()
+        context = self.get(snapshot, model_name)
+        if context is not None:
+            return genai.GenerativeModel.from_cached_content(context, generation_config=generation_config), None
+        return genai.GenerativeModel(model_name, generation_config=generation_config), snapshot.compact
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"cached_contexts": len(self.contexts), "uncacheable_versions": len(self.uncacheable)}
+
+
+def _below_minimum_size(error: Exception) -> bool:
+    """True when Gemini rejected a context for having too few tokens (retrying cannot help)."""
+    message = str(error).lower()
+    return "too small" in message or "min_total_token_count" in message or (
+        "minimum" in message and "token" in message)
+
+
+_store: Optional[PolicyStore] = None
+_context_cache: Optional[PolicyContextCache] = None
+_store_lock = threading.Lock()
+
+
+def get_policy_store() -> PolicyStore:
+    """Get or create the shared policy store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PolicyStore()
+        return _store
+
+
+def get_policy_context_cache() -> PolicyContextCache:
+    """Get or create the shared Gemini policy context cache."""
+    global _context_cache
+    with _store_lock:
+        if _context_cache is None:
+            _context_cache = PolicyContextCache()
+        return _context_cache
+
+
+def current_policy() -> PolicySnapshot:
+    """Return the current policy snapshot, picking up any change to the file."""
+    return get_policy_store().current()
@@ -0,0 +1,211 @@
+"""
+Deterministic Expense Policy Rules
+Parses receipt text locally (date, line items, total, vendor) and evaluates the hard
+constraints of the expense policy without calling Gemini.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import receipt_dates
+
+AMOUNT_RE = re.compile(r"\$\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?|\d+(?:\.\d{2})?)")
+TOTAL_RE = re.compile(r"^\s*(grand\s+total|total(\s+due|\s+amount)?|amount\s+due|balance\s+due)\b", re.IGNORECASE)
+# Labels that are not purchases (summary, tender and header lines); matched against a line's
+# text with the amount removed, so "Cash: $200.00" is skipped like a bare "Cash"
+SKIP_LABEL_RE = re.compile(r"""^(
+    sub[\s-]?total | (sales\s+)?tax(es)?\b.* | tip | gratuity | discount\b.* | savings\b.*
+  | change(\s+due)? | cash(\s+tendered)? | tendered | amount\s+(due|paid|tendered)
+  | balance\b.* | payments?\b.* | paid\b.*
+  | ((credit|debit)\s+)?card(\s+(payment|tendered|ending|no\.?|number)\b.*|\s*[#*xX\d].*)?
+  | (visa|mastercard|master\s+card|amex|american\s+express|discover)\b.*
+  | items? | price | qty | receipt\b.* | date\b.*
+)$""", re.IGNORECASE | re.VERBOSE)
+BULLET_RE = re.compile(r"^\s*[•\-\*·]\s*")
+# Bump whenever parsing or evaluation changes, so verdicts cached under the old rules are re-checked
+RULES_VERSION = "2"
+
+# Terms that mark a purchase as alcohol when the policy excludes alcoholic beverages
+ALCOHOL_TERMS = ["beer", "wine", "liquor", "vodka", "whiskey", "whisky", "rum", "tequila", "gin", "champagne", "alcohol"]
+
+
+@dataclass
+class LineItem:
+    description: str
+    amount: float
+
+
+@dataclass
+class ParsedReceipt:
+    date: Optional[datetime] = None
+    # Context of the label before the date ("positive", "neutral" or "negative")
+    date_context: Optional[str] = None
+    total: Optional[float] = None
+    items: List[LineItem] = field(default_factory=list)
+    vendor: Optional[str] = None
+
+
+@dataclass
+class PolicyRules:
+    max_age_days: int = 30
+    max_amount: float = 100.0
+    non_reimbursable: List[str] = field(default_factory=list)
+
+
+@dataclass
+class RuleResult:
+    receipt: ParsedReceipt
+    days_since_receipt: Optional[int] = None
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def verdict(self) -> Optional[str]:
+        """'DENIED' when a hard rule is violated, None when Gemini must judge eligibility."""
+        return "DENIED" if self.violations else None
+
+
+def compile_policy(policy_text: str) -> PolicyRules:
+    """Extract the hard constraints from the policy text, keeping defaults for anything not stated."""
+    rules = PolicyRules()
+    age = re.search(r"within\s+(\d+)\s+days", policy_text, re.IGNORECASE)
+    if age:
+        rules.max_age_days = int(age.group(1))
+    amount = re.search(r"more\s+than\s+\$\s*(\d+(?:\.\d+)?)", policy_text, re.IGNORECASE)
+    if amount:
+        rules.max_amount = float(amount.group(1))
+
+    section = re.search(r"Non-Reimbursable Items:(.*)", policy_text, re.IGNORECASE | re.DOTALL)
+    if section:
+        body = section.group(1)
+        listed = re.search(r"not limited to\s+(.*?)(?:\.\s|\.$|$)", body, re.IGNORECASE | re.DOTALL)
+        text = listed.group(1) if listed else body
+        for term in re.split(r",|\bor\b|\band\b", text):
+            term = re.sub(r"^\s*(any|all)\s+", "", term.strip(), flags=re.IGNORECASE).strip(" .").lower()
+            if term:
+                rules.non_reimbursable.append(term)
+        if any("alcohol" in term for term in rules.non_reimbursable):
+            rules.non_reimbursable.extend(t for t in ALCOHOL_TERMS if t not in rules.non_reimbursable)
+    return rules
+
+
+def _term_pattern(term: str) -> re.Pattern:
+    """Whole-word pattern for a policy term that also matches its singular/plural form."""
+    words = term.rstrip("s") if term.endswith("s") and not term.endswith("ss") else term
+    return re.compile(r"\b" + r"\s+".join(map(re.escape, words.split())) + r"s?\b", re.IGNORECASE)
+
+
+def _parse_amount(value: str) -> float:
+    return float(value.replace(",", ""))
+
+
+def parse_receipt(text: str, today: Optional[datetime] = None) -> ParsedReceipt:
+    """
+    Parse receipt text into date, line items, total and vendor.
+
+    Handles items with the price on the same line ("Stapler x1: $50") and layouts
+    where PDF extraction puts the price on a later line than the description.
+    """
+    receipt = ParsedReceipt()
+    date = receipt_dates.best_candidate(text, today)
+    if date:
+        receipt.date, receipt.date_context = date.date, date.context
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    pending_description = None
+    expecting_total = False
+    for line in lines:
+        amount = AMOUNT_RE.search(line)
+        label = AMOUNT_RE.sub("", line).strip(" :\t")
+        if TOTAL_RE.match(line):
+            if amount:
+                receipt.total = _parse_amount(amount.group(1))
+            else:
+                expecting_total = True
+            pending_description = None
+            continue
+        if amount and not label:
+            # A bare price line belongs to the preceding label
+            value = _parse_amount(amount.group(1))
+            if expecting_total:
+                receipt.total = value
+                expecting_total = False
+            elif pending_description:
+                receipt.items.append(LineItem(pending_description, value))
+            pending_description = None
+            continue
+        if SKIP_LABEL_RE.match(BULLET_RE.sub("", label)):
+            # A bare label's price on the next line must not attach to an earlier item either
+            pending_description = None
+            continue
+        if receipt_dates.find_candidates(line):
+            continue
+        if amount:
+            receipt.items.append(LineItem(BULLET_RE.sub("", label), _parse_amount(amount.group(1))))
+            pending_description = None
+        elif BULLET_RE.match(line) or pending_description is None:
+            if receipt.vendor is None and not receipt.items and not BULLET_RE.match(line):
+                receipt.vendor = line
+                continue
+            pending_description = BULLET_RE.sub("", line)
+    if receipt.total is None and receipt.items:
+        receipt.total = round(sum(item.amount for item in receipt.items), 2)
+    return receipt
+
+
+def evaluate(receipt: ParsedReceipt, rules: PolicyRules, today: Optional[datetime] = None) -> RuleResult:
+    """Check the parsed receipt against the hard policy constraints."""
+    today = today or datetime.now()
+    result = RuleResult(receipt=receipt)
+    if receipt.date:
+        result.days_since_receipt = (today - receipt.date).days
+        # Only a date labelled (or at least not mislabelled) as the transaction date can deny on age
+        if result.days_since_receipt > rules.max_age_days and receipt.date_context in ("positive", "neutral"):
+            result.violations.append(
+                f"Receipt is {result.days_since_receipt} days old (limit {rules.max_age_days} days)"
+            )
+    for item in receipt.items:
+        if item.amount > rules.max_amount:
+            result.violations.append(f"'{item.description}' costs ${item.amount:.2f} (limit ${rules.max_amount:.0f})")
+        for term in rules.non_reimbursable:
+            if _term_pattern(term).search(item.description):
+                result.violations.append(f"'{item.description}' is non-reimbursable ({term})")
+                break
+    if receipt.total is not None and receipt.total > rules.max_amount:
+        result.violations.append(f"Total ${receipt.total:.2f} exceeds ${rules.max_amount:.0f}")
+    return result
+
+
+class PrescreenStats:
+    """Counts how many receipts the deterministic fast path resolves without Gemini."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.screened = 0
+        self.fast_denied = 0
+
+    def record(self, result: RuleResult):
+        with self.lock:
+            self.screened += 1
+            if result.verdict:
+                self.fast_denied += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "screened": self.screened,
+                "fast_path": self.fast_denied,
+                "sent_to_llm": self.screened - self.fast_denied,
+                "fast_path_rate": self.fast_denied / self.screened if self.screened else 0.0
+            }
+
+
+stats = PrescreenStats()
+
+
+def prescreen(receipt_text: str, rules: PolicyRules, today: Optional[datetime] = None) -> RuleResult:
+    """Parse and evaluate a receipt, recording whether the fast path resolved it."""
+    result = evaluate(parse_receipt(receipt_text, today), rules, today)
+    stats.record(result)
+    return result
@@ -0,0 +1,23 @@
+"""
+Lazy google-generativeai access.
+The SDK (and the gRPC/protobuf stack under it) takes a large share of process startup, so it
+is imported and configured with GEMINI_API_KEY on first use rather than at module import.
+"""
+import os
+import threading
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """Import google.generativeai on first call, configure it and return the module."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            api_key = os.getenv("GEMINI_API_KEY")
+            if api_key:
+                genai.configure(api_key=api_key)
+            _genai = genai
+        return _genai
@@ -1,31 +1,30 @@
 import os
+import time
+import importlib.util
+import uuid
+import asyncio
 import base64
+from collections.abc import Mapping, Sequence
+from typing import Optional
 import imaplib
 import email
 from email.header import decode_header
-import google.generativeai as genai
-import resend  # Resend API for sending emails (bypasses SMTP)
-from expense_agent import validate_reimbursement
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 from dotenv import load_dotenv
 from logging_utils import get_logger
-from drive_agent import (
-    get_drive_service,
-    list_files,
-    search_files,
-    download_file,
-    upload_file,
-    semantic_search,
-    read_text_file,
-    read_document
-)
+import mcp_progress
+import cancellation
+from gemini_client import get_genai
+from drive_metadata import metadata_scope
+# The drive and expense agents (Google API client, PyMuPDF, policy loading), google-generativeai
+# and resend are imported on first use so the server starts serving quickly
 
 load_dotenv()
 mcp = FastMCP("Gemini Server")
 
 API_KEY = os.getenv("GEMINI_API_KEY")
-if API_KEY:
-    genai.configure(api_key=API_KEY)
 
 # Gmail credentials for READING emails (IMAP)
 GMAIL_USER = os.getenv("GMAIL_USER")
@@ -34,8 +33,6 @@ GMAIL_PASSWORD = os.getenv("GMAIL_PASSWORD")
 # Resend credentials for SENDING emails (HTTPS API)
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 RESEND_FROM_EMAIL = os.getenv("RESEND_FROM_EMAIL")
-if RESEND_API_KEY:
-    resend.api_key = RESEND_API_KEY
 
 def list_emails_tool(max_results: int = 10, query: str = None):
     """List recent emails from the inbox using IMAP."""
@@ -55,7 +52,11 @@ def list_emails_tool(max_results: int = 10, query: str = None):
         latest_email_ids = email_ids[-max_results:]
        
         output = []
-        for e_id in reversed(latest_email_ids):
+        for n, e_id in enumerate(reversed(latest_email_ids)):
+            # Stop fetching once nobody is waiting for the listing
+            if cancellation.is_cancelled():
+                cancellation.stats.record("emails_skipped", len(latest_email_ids) - n)
+                break
             try:
                 _, msg_data = mail.fetch(e_id, "(RFC822)")
                 for response_part in msg_data:
@@ -117,6 +118,8 @@ def send_email_tool(to: str, subject: str, body: str):
         return "Error: RESEND_API_KEY or RESEND_FROM_EMAIL not set in environment variables."
     
     try:
+        import resend  # Resend API for sending emails (bypasses SMTP)
+        resend.api_key = RESEND_API_KEY
         params = {
             "from": RESEND_FROM_EMAIL,
             "to": [to],
@@ -130,48 +133,104 @@ def send_email_tool(to: str, subject: str, body: str):
         return f"Error sending email via Resend: {e}"
 
 # Drive tools
-def list_drive_files_tool(max_results: int = 10, query: str = None):
+def list_drive_files_tool(max_results: int = 10, query: str = None, page_token: str = None):
     try:
-        return list_files(max_results=max_results, query=query)
+        from drive_agent import list_files
+        return list_files(max_results=max_results, query=query, page_token=page_token)
     except Exception as e:
         return f"Error listing Drive files: {e}"
 
 def search_drive_files_tool(search_term: str, use_semantic: bool = False):
     try:
+        from drive_agent import search_files
         return search_files(search_term=search_term, use_semantic=use_semantic)
     except Exception as e:
         return f"Error searching Drive files: {e}"
 
 def download_drive_file_tool(file_id: str, destination: str = None):
     try:
+        from drive_agent import download_file
         return download_file(file_id=file_id, destination=destination)
     except Exception as e:
         return f"Error downloading file: {e}"
 
 def upload_drive_file_tool(filepath: str, folder_id: str = None):
     try:
+        from drive_agent import upload_file
         return upload_file(filepath=filepath, folder_id=folder_id)
     except Exception as e:
         return f"Error uploading file: {e}"
 
+def upload_drive_files_tool(paths: list[str], folder_id: str = None):
+    try:
+        from drive_agent import upload_files
+        return upload_files(paths=paths, folder_id=folder_id)
+    except Exception as e:
+        return f"Error uploading files: {e}"
+
+def download_drive_files_tool(file_ids: list[str], dest_dir: str = None):
+    try:
+        from drive_agent import download_files
+        return download_files(file_ids=file_ids, dest_dir=dest_dir)
+    except Exception as e:
+        return f"Error downloading files: {e}"
+
 def semantic_search_tool(query: str, max_files: int = 10):
     try:
+        from drive_agent import semantic_search
         return semantic_search(query=query, max_files=max_files)
     except Exception as e:
         return f"Error in content search: {e}"
 
-def read_drive_document_tool(file_id: str):
+def read_drive_document_tool(file_id: str, pages: str = None, max_chars: int = None, locate: str = None):
     try:
-        return read_document(file_id=file_id)
+        from drive_agent import read_document
+        return read_document(file_id=file_id, pages=pages, max_chars=max_chars, locate=locate)
     except Exception as e:
         return f"Error reading document: {e}"
 
+def index_drive_document_tool(file_id: str):
+    try:
+        from drive_agent import index_file
+        return index_file(file_id=file_id)
+    except Exception as e:
+        return f"Error indexing document: {e}"
+
+def drive_indexer_status_tool():
+    try:
+        from drive_indexer import indexer_status
+        return indexer_status()
+    except Exception as e:
+        return f"Error reading indexer status: {e}"
+
+def document_cache_stats_tool():
+    try:
+        from drive_agent import document_cache_stats
+        return document_cache_stats()
+    except Exception as e:
+        return f"Error reading document cache stats: {e}"
+
+def prescreen_stats_tool():
+    try:
+        from expense_agent import prescreen_stats
+        return prescreen_stats()
+    except Exception as e:
+        return f"Error reading pre-screen stats: {e}"
+
 def validate_reimbursement_tool(receipt_path: str):
     try:
+        from expense_agent import validate_reimbursement
         return validate_reimbursement(receipt_path=receipt_path)
     except Exception as e:
         return f"Error validating reimbursement: {e}"
 
+def validate_reimbursements_tool(receipt_paths: list[str]):
+    try:
+        from expense_agent import validate_reimbursements
+        return validate_reimbursements(receipt_paths=receipt_paths)
+    except Exception as e:
+        return f"Error validating reimbursements: {e}"
+
 tools_map = {
     'list_emails_tool': list_emails_tool,
     'read_email_tool': read_email_tool,
@@ -180,112 +239,337 @@ tools_map = {
     'search_drive_files_tool': search_drive_files_tool,
     'download_drive_file_tool': download_drive_file_tool,
     'upload_drive_file_tool': upload_drive_file_tool,
+    'upload_drive_files_tool': upload_drive_files_tool,
+    'download_drive_files_tool': download_drive_files_tool,
     'semantic_search_tool': semantic_search_tool,
     'validate_reimbursement_tool': validate_reimbursement_tool,
-    'read_drive_document_tool': read_drive_document_tool
+    'validate_reimbursements_tool': validate_reimbursements_tool,
+    'read_drive_document_tool': read_drive_document_tool,
+    'index_drive_document_tool': index_drive_document_tool,
+    'drive_indexer_status_tool': drive_indexer_status_tool,
+    'document_cache_stats_tool': document_cache_stats_tool,
+    'prescreen_stats_tool': prescreen_stats_tool
 }
 
+# Upper bound on model turns per agent_action request
+AGENT_MAX_STEPS = 10
+
+
+async def report_progress(ctx: Context, step: int, message: str):
+    """Send a progress notification to the client; clients that did not ask for progress ignore it."""
+    if ctx is None:
+        return
+    try:
+        await ctx.report_progress(step, AGENT_MAX_STEPS, message)
+    except Exception:
+        pass  # Progress is best effort and must never fail the request
+
+
+def plain_args(value):
+    """
+    Convert function-call arguments to plain Python. Gemini sends them as proto-plus map and
+    repeated values (list arguments arrive as RepeatedComposite), which neither the tools nor
+    json.dumps accept.
+    """
+    if isinstance(value, Mapping):
+        return {key: plain_args(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return [plain_args(item) for item in value]
+    return value
+
+
+def _chunk_parts(chunk) -> list:
+    """Content parts of a streamed chunk; empty for chunks without a candidate."""
+    try:
+        return list(chunk.candidates[0].content.parts)
+    except (AttributeError, IndexError):
+        return []
+
+
+async def stream_call(ctx: Context, step: int, send, *args):
+    """
+    Run a blocking Gemini call with stream=True in a worker thread, forwarding answer text to
+    the client as progress notifications while it is generated. Text narrated before a function
+    call is not part of the answer, so the client is told to discard it when the call arrives.
+
+    Returns:
+        The fully consumed response, usable like a non-streamed one
+    """
+    loop = asyncio.get_running_loop()
+    messages: asyncio.Queue = asyncio.Queue()
+
+    def run():
+        try:
+            response = send(*args, stream=True)
+            streamed = False
+            for chunk in response:
+                cancellation.checkpoint()
+                parts = _chunk_parts(chunk)
+                if any(part.function_call for part in parts):
+                    if streamed:
+                        loop.call_soon_threadsafe(messages.put_nowait, mcp_progress.RESET_TEXT)
+                        streamed = False
+                    continue
+                text = "".join(part.text for part in parts if part.text)
+                if text:
+                    loop.call_soon_threadsafe(messages.put_nowait, mcp_progress.partial_text(text))
+                    streamed = True
+            return response
+        finally:
+            loop.call_soon_threadsafe(messages.put_nowait, None)
+
+    call = asyncio.ensure_future(asyncio.to_thread(run))
+    while (message := await messages.get()) is not None:
+        await report_progress(ctx, step, message)
+    return await call
+
+
 @mcp.tool()
-def agent_action(request: str) -> str:
-    """Ask the AI Agent to perform an action."""
+async def agent_action(request: str, request_id: str = None, ctx: Context = None) -> str:
+    """
+    Ask the AI Agent to perform an action.
+    
+    Args:
+        request: The user's request
+        request_id: Optional id that cancel_request can use to stop this request
+    """
     if not API_KEY: return "Error: GEMINI_API_KEY not set."
     logger = get_logger()
+    request_id = request_id or uuid.uuid4().hex
     
-    model = genai.GenerativeModel(
+    model = get_genai().GenerativeModel(
         model_name='gemini-2.5-flash',
         tools=[
             list_emails_tool, read_email_tool, send_email_tool,
             list_drive_files_tool, search_drive_files_tool, download_drive_file_tool,
-            upload_drive_file_tool, semantic_search_tool,
-            read_drive_document_tool,
-            validate_reimbursement_tool
+            upload_drive_file_tool, upload_drive_files_tool, download_drive_files_tool,
+            semantic_search_tool,
+            read_drive_document_tool, index_drive_document_tool, drive_indexer_status_tool,
+            document_cache_stats_tool, prescreen_stats_tool,
+            validate_reimbursement_tool, validate_reimbursements_tool
         ],
-        system_instruction="You are an AI agent with access to tools. Call tools only with valid arguments as defined. For upload_drive_file_tool, require 'filepath' (local path) and optional 'folder_id'. If args are missing from request, ask for clarification instead of guessing. If the request includes 'Attached files:' followed by comma-separated file paths, treat those as the local 'filepath' arguments for upload (call the tool separately for each file if multiple). For expense reimbursement requests, use validate_reimbursement_tool with the receipt filepath from attached files (assume one file is the receipt; deny if no file)."
+        system_instruction="You are an AI agent with access to tools. Call tools only with valid arguments as defined. For upload_drive_file_tool, require 'filepath' (local path) and optional 'folder_id'. If args are missing from request, ask for clarification instead of guessing. When list_drive_files_tool reports a 'Next page token', pass it back as 'page_token' to fetch the next page if the user wants more files. If the request includes 'Attached files:' followed by comma-separated file paths, treat those as the local 'filepath' arguments for upload (for multiple files, call upload_drive_files_tool once with all of them as 'paths'; likewise use download_drive_files_tool to download several file IDs at once). For large documents, call read_drive_document_tool with 'locate' (a query) or 'pages' (e.g. '1-3') and 'max_chars' to read only the relevant part instead of the whole file. For expense reimbursement requests, use validate_reimbursement_tool with the receipt filepath from attached files (assume one file is the receipt; deny if no file). If several receipts are attached, call validate_reimbursements_tool once with all of them as 'receipt_paths' and return its verdict table."
     )
     
     chat = model.start_chat(enable_automatic_function_calling=False)
     
-    try:
-        response = chat.send_message(request)
+    # Drive metadata looked up during this request is fetched once and shared by every tool call;
+    # the cancel token is checked between turns and by cancellable tools
+    with metadata_scope(), cancellation.request_scope(request_id) as token:
+        step = 0
+        try:
+            # Gemini calls and tools block, so they run in worker threads (which inherit the
+            # metadata scope) while the server keeps serving other requests
+            await report_progress(ctx, 0, "Thinking")
+            response = await stream_call(ctx, 0, chat.send_message, request)
         
-        for _ in range(10):
-            if not response.candidates or not response.candidates[0].content.parts:
-                break
+            for step in range(1, AGENT_MAX_STEPS + 1):
+                if not response.candidates or not response.candidates[0].content.parts:
+                    break
                 
-            part = response.candidates[0].content.parts[0]
+                # A turn may narrate before its function call; the call decides what happens next
+                parts = response.candidates[0].content.parts
+                part = next((p for p in parts if p.function_call), parts[0])
             
-            if part.function_call:
-                fc = part.function_call
-                tool_name = fc.name
-                args = dict(fc.args)
+                if part.function_call:
+                    fc = part.function_call
+                    tool_name = fc.name
+                    args = plain_args(fc.args)
+                    if token.cancelled:
+                        cancellation.stats.record("tool_calls_skipped")
+                        token.check()
                 
-                logger.log_tool_call(tool_name, args)
+                    logger.log_tool_call(tool_name, args)
+                    await report_progress(ctx, step, f"Running {tool_name}")
                 
-                tool_result = "Error: Tool not found"
-                if tool_name in tools_map:
-                    try:
-                        tool_result = tools_map[tool_name](**args)
-                    except Exception as e:
-                        tool_result = f"Error executing {tool_name}: {str(e)}"
+                    tool_result = "Error: Tool not found"
+                    if tool_name in tools_map:
+                        try:
+                            tool_result = await asyncio.to_thread(tools_map[tool_name], **args)
+                        except Exception as e:
+                            tool_result = f"Error executing {tool_name}: {str(e)}"
                 
-                response = chat.send_message(
-                    {
-                        "role": "function",
-                        "parts": [
-                            {
-                                "function_response": {
-                                    "name": tool_name,
-                                    "response": {"result": tool_result}
+                    await report_progress(ctx, step, f"Finished {tool_name}")
+                    token.check()
+                    # Streamed so the final answer reaches the client as it is written
+                    response = await stream_call(
+                        ctx,
+                        step,
+                        chat.send_message,
+                        {
+                            "role": "function",
+                            "parts": [
+                                {
+                                    "function_response": {
+                                        "name": tool_name,
+                                        "response": {"result": tool_result}
+                                    }
                                 }
-                            }
-                        ]
-                    }
-                )
-            else:
-                # Try to extract text safely
-                try:
-                    if response.text:
-                        result_text = response.text
-                        logger.log_model_response(
-                            model_name="gemini-2.5-flash (agent_action)",
-                            prompt=request,
-                            response=result_text
-                        )
-                        return result_text
-                except Exception:
-                    # No valid text in response
-                    pass
-                break
+                            ]
+                        }
+                    )
+                else:
+                    # Try to extract text safely
+                    try:
+                        if response.text:
+                            result_text = response.text
+                            logger.log_model_response(
+                                model_name="gemini-2.5-flash (agent_action)",
+                                prompt=request,
+                                response=result_text
+                            )
+                            return result_text
+                    except Exception:
+                        # No valid text in response
+                        pass
+                    break
                 
-        # Try to extract final text safely
-        try:
-            if response.text:
-                return response.text
-        except Exception:
-            pass
+            # Try to extract final text safely
+            try:
+                if response.text:
+                    return response.text
+            except Exception:
+                pass
             
-        return "No final response generated after tool calls."
+            return "No final response generated after tool calls."
+
+        except asyncio.CancelledError:
+            # The client sent an MCP cancellation; stop tool threads at their next checkpoint
+            token.cancel("cancelled by MCP notification")
+            cancellation.stats.record("requests_cancelled")
+            _record_stopped_loop(step)
+            raise
+        except cancellation.RequestCancelled as e:
+            cancellation.stats.record("requests_cancelled")
+            _record_stopped_loop(step)
+            logger.log_error(
+                error_type="agent_action_cancelled",
+                error_message=str(e),
+                context=f"agent_action step {step}"
+            )
+            return "Request cancelled."
+        except Exception as e:
+            error_msg = f"Agent Error: {str(e)}"
+            logger.log_error(
+                error_type="agent_action_exception",
+                error_message=str(e),
+                context="agent_action"
+            )
+            return error_msg
+
+def _record_stopped_loop(step: int):
+    """Count an agent loop stopped early and the model turns it will no longer make (at most)."""
+    cancellation.stats.record("agent_loops_stopped")
+    cancellation.stats.record("model_turns_skipped", AGENT_MAX_STEPS - step)
 
-    except Exception as e:
-        error_msg = f"Agent Error: {str(e)}"
-        logger.log_error(
-            error_type="agent_action_exception",
-            error_message=str(e),
-            context="agent_action"
-        )
-        return error_msg
 
 @mcp.tool()
-def ask_gemini(prompt: str) -> str:
+async def ask_gemini(prompt: str, request_id: str = None, ctx: Context = None) -> str:
     """Ask Gemini a general question (no tools)."""
     if not API_KEY: return "Error: GEMINI_API_KEY not set."
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"Error: {e}"
+    with cancellation.request_scope(request_id or uuid.uuid4().hex) as token:
+        try:
+            model = get_genai().GenerativeModel('gemini-2.5-flash')
+            response = await stream_call(ctx, 0, model.generate_content, prompt)
+            return response.text
+        except asyncio.CancelledError:
+            token.cancel("cancelled by MCP notification")
+            cancellation.stats.record("requests_cancelled")
+            raise
+        except cancellation.RequestCancelled:
+            cancellation.stats.record("requests_cancelled")
+            return "Request cancelled."
+        except Exception as e:
+            return f"Error: {e}"
+
+@mcp.tool()
+def cancel_request(request_id: str) -> str:
+    """
+    Cancel a running agent_action or ask_gemini request.
+    
+    Args:
+        request_id: The request_id the request was started with
+    """
+    if cancellation.cancel(request_id):
+        return f"Cancellation requested for {request_id}."
+    return f"No running request with id {request_id}."
+
+@mcp.tool()
+def document_cache_stats() -> str:
+    """Report hit/miss metrics of the read_drive_document text cache."""
+    return document_cache_stats_tool()
+
+@mcp.tool()
+def prescreen_stats() -> str:
+    """Report how many receipts were resolved by the local expense rules and the verdict cache without Gemini."""
+    return prescreen_stats_tool()
+
+@mcp.tool()
+def cancellation_stats() -> str:
+    """Report requests cancelled and the work that was skipped because of it."""
+    counts = cancellation.stats.snapshot()
+    return "\n".join(f"{name}: {value}" for name, value in counts.items())
+
+# MCP tools the orchestrator calls; the server is not ready until all are registered
+REQUIRED_TOOLS = ("agent_action", "ask_gemini", "cancel_request")
+# Packages the agent tools import on first use. Readiness only resolves them (importing them
+# here would pay the startup cost the lazy imports avoid), so a missing dependency fails the
+# probe instead of the first request that needs it
+TOOL_DEPENDENCIES = ("google.generativeai", "googleapiclient", "google_auth_oauthlib", "fitz", "resend")
+STARTED_AT = time.time()
+# None once every tool dependency resolved; otherwise the ones that are missing
+_dependency_error = "not checked yet"
+
+def missing_tool_dependencies() -> Optional[str]:
+    """Find the tools' lazy dependencies without importing them; returns the missing ones, or None."""
+    missing = []
+    for name in TOOL_DEPENDENCIES:
+        try:
+            found = importlib.util.find_spec(name) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            missing.append(name)
+    return f"missing {', '.join(missing)}" if missing else None
+
+async def readiness_checks() -> dict:
+    """Check that the tool registry is loaded, the tools' dependencies are installed and Gemini is configured."""
+    global _dependency_error
+    registered = {tool.name for tool in await mcp.list_tools()}
+    if _dependency_error is not None:
+        # Resolved once; finding a spec reads the filesystem but loads no module code
+        _dependency_error = missing_tool_dependencies()
+    return {
+        "tools_registered": all(name in registered for name in REQUIRED_TOOLS),
+        "agent_tools_loaded": _dependency_error is None,
+        "gemini_api_key": bool(API_KEY)
+    }
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request: Request) -> JSONResponse:
+    """Liveness probe: the process is up and serving HTTP."""
+    return JSONResponse({
+        "status": "ok",
+        "uptime": round(time.time() - STARTED_AT, 3),
+        "in_flight": cancellation.active()
+    })
+
+@mcp.custom_route("/ready", methods=["GET"])
+async def ready(request: Request) -> JSONResponse:
+    """Readiness probe: 200 once requests can be served, 503 with the failing checks otherwise."""
+    checks = await readiness_checks()
+    ok = all(checks.values())
+    body = {"status": "ready" if ok else "not ready", "checks": checks, "uptime": round(time.time() - STARTED_AT, 3)}
+    if _dependency_error:
+        body["error"] = _dependency_error
+    return JSONResponse(body, status_code=200 if ok else 503)
 
 if __name__ == "__main__":
-    mcp_port = int(os.environ.get('MCP_PORT', 8000))
+    # Keep the semantic index fresh in the background when enabled
+    if os.getenv("DRIVE_INDEXER_ENABLED", "").lower() in ("1", "true", "yes"):
+        from drive_indexer import get_indexer
+        get_indexer().start()
+    # Each worker started by start.py listens on its own port
+    mcp.settings.port = int(os.environ.get('MCP_PORT', 8000))
+    mcp.settings.host = os.environ.get('MCP_HOST', mcp.settings.host)
     mcp.run(transport="sse")
@@ -0,0 +1,285 @@
+"""
+Background job queue for UI submissions.
+Requests run on a bounded asyncio priority queue served by a fixed number of workers.
+Each job has an id, records stage-level progress and keeps its result for a while so a
+client that disconnects can come back for it.
+"""
+import os
+import time
+import uuid
+import asyncio
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Jobs run at once; each one mostly waits on Gemini and MCP
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+# Jobs waiting to run before new submissions are refused
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 100))
+# Seconds finished jobs are kept for reconnecting clients
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 3600))
+# Seconds a job keeps running after its last watching client disconnects
+JOB_DISCONNECT_GRACE = float(os.getenv("JOB_DISCONNECT_GRACE", 30))
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue is at capacity and the submission should be retried later."""
+
+
+class JobQueueClosed(Exception):
+    """Raised when the server is shutting down and takes no new jobs."""
+
+
+@dataclass
+class ProgressEvent:
+    time: float
+    stage: str
+    detail: str = ""
+
+
+@dataclass
+class Job:
+    id: str
+    description: str
+    priority: int
+    run: Callable[["Job"], Awaitable[Any]]
+    status: str = "queued"  # queued, running, done, failed, cancelled
+    events: List[ProgressEvent] = field(default_factory=list)
+    # Answer text streamed so far; superseded by result when the job finishes
+    partial: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    listeners: List[Callable[["Job", ProgressEvent], None]] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+    # Run once when the job ends, however it ends (e.g. releasing its files)
+    finalizers: List[Callable[["Job"], None]] = field(default_factory=list)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def stage(self) -> str:
+        return self.events[-1].stage if self.events else self.status
+
+    def report(self, stage: str, detail: str = ""):
+        """Record a progress event and push it to every subscriber."""
+        event = ProgressEvent(time.time(), stage, detail)
+        self.events.append(event)
+        self._notify(event)
+
+    def stream_text(self, text: Optional[str]):
+        """
+        Append streamed answer text and push it to subscribers as a 'text' event (not recorded).
+        None discards the text streamed so far (it was narration before a tool call).
+        """
+        self.partial = "" if text is None else self.partial + text
+        self._notify(ProgressEvent(time.time(), "text", text or ""))
+
+    def _notify(self, event: ProgressEvent):
+        for listener in list(self.listeners):
+            try:
+                listener(self, event)
+            except Exception:
+                # The subscriber's page is gone; the job carries on for a later reconnect
+                self.unsubscribe(listener)
+
+    def subscribe(self, listener: Callable[["Job", ProgressEvent], None]) -> Callable[[], None]:
+        """Call listener on every progress event; returns a function that unsubscribes it."""
+        self.listeners.append(listener)
+        return lambda: self.unsubscribe(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def on_finish(self, finalizer: Callable[["Job"], None]):
+        self.finalizers.append(finalizer)
+
+    def _finalize(self):
+        for finalizer in self.finalizers:
+            finalizer(self)
+        self.finalizers.clear()
+
+
+class JobQueue:
+    """
+    Bounded priority queue of jobs with a fixed worker pool.
+    Must be used from the event loop that runs the workers.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE,
+                 result_ttl: int = JOB_RESULT_TTL):
+        """
+        Initialize the queue; workers start on the first submission.
+
+        Args:
+            workers: Number of jobs run concurrently
+            max_queued: Queued jobs allowed before submit() raises JobQueueFull
+            result_ttl: Seconds finished jobs remain retrievable
+        """
+        self.worker_count = workers
+        self.result_ttl = result_ttl
+        self.max_queued = max_queued
+        # Unbounded: cancelled jobs stay in it until a worker skips them, so capacity is
+        # checked against pending (live queued jobs) instead
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.pending = 0
+        self.jobs: Dict[str, Job] = {}
+        self.workers: List[asyncio.Task] = []
+        self.sequence = itertools.count()
+        # Set on shutdown; submissions are refused while accepted jobs finish
+        self.closed = False
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0,
+                      "cancelled": 0, "cancelled_while_queued": 0, "running_seconds_cancelled": 0.0}
+
+    def start(self):
+        while len(self.workers) < self.worker_count:
+            self.workers.append(asyncio.create_task(self._worker(), name=f"job-worker-{len(self.workers)}"))
+
+    def submit(self, run: Callable[[Job], Awaitable[Any]], description: str = "",
+               priority: int = PRIORITY_INTERACTIVE) -> Job:
+        """
+        Queue a job.
+
+        Args:
+            run: Coroutine function called with the job; its return value becomes the result
+            description: Short text shown on the job page
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH (lower runs first)
+
+        Raises:
+            JobQueueFull: If max_queued jobs are already waiting
+            JobQueueClosed: If the queue was closed for shutdown
+        """
+        if self.closed:
+            self.stats["rejected"] += 1
+            raise JobQueueClosed("shutting down")
+        self.start()
+        self._expire()
+        if self.pending >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise JobQueueFull(f"{self.pending} jobs already waiting")
+        job = Job(id=uuid.uuid4().hex[:12], description=description, priority=priority, run=run)
+        self.queue.put_nowait((priority, next(self.sequence), job))
+        self.pending += 1
+        self.jobs[job.id] = job
+        self.stats["submitted"] += 1
+        job.report("queued", f"position {self.pending}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job: Job, reason: str = "cancelled by user") -> bool:
+        """
+        Cancel a job. Queued jobs never start; running jobs have their task cancelled, which
+        propagates through the orchestrator to the MCP server.
+
+        Returns:
+            False if the job had already finished
+        """
+        if job.done:
+            return False
+        job.error = reason
+        if job.task is None:
+            # Still queued; the worker drops it when it comes up, but it no longer takes a slot
+            self.pending -= 1
+            job.status = "cancelled"
+            job.finished = time.time()
+            self.stats["cancelled"] += 1
+            self.stats["cancelled_while_queued"] += 1
+            job._finalize()
+            job.report("cancelled", reason)
+        else:
+            job.task.cancel()
+        return True
+
+    def close(self):
+        """Stop accepting jobs; queued and running jobs carry on."""
+        self.closed = True
+
+    def active(self) -> int:
+        """Jobs queued or running."""
+        return sum(1 for job in self.jobs.values() if not job.done)
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Close the queue and wait for every queued and running job to finish.
+
+        Returns:
+            False if jobs were still unfinished after timeout seconds
+        """
+        self.close()
+        deadline = time.monotonic() + timeout
+        while self.active():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def release(self, job: Job, grace: float = JOB_DISCONNECT_GRACE):
+        """Cancel the job if no client is watching it grace seconds after its last one left."""
+        def check():
+            if not job.listeners:
+                self.cancel(job, "cancelled after client disconnect")
+        if not job.done:
+            asyncio.get_running_loop().call_later(grace, check)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job.done:
+                self.queue.task_done()
+                continue
+            self.pending -= 1
+            job.status = "running"
+            job.started = time.time()
+            job.report("started")
+            job.task = asyncio.create_task(job.run(job))
+            try:
+                # wait() does not raise when the job task itself is cancelled
+                await asyncio.wait([job.task])
+                if job.task.cancelled():
+                    job.status = "cancelled"
+                    self.stats["cancelled"] += 1
+                    self.stats["running_seconds_cancelled"] += time.time() - job.started
+                elif job.task.exception() is not None:
+                    job.status = "failed"
+                    job.error = str(job.task.exception())
+                    self.stats["failed"] += 1
+                else:
+                    job.result = job.task.result()
+                    job.status = "done"
+                    self.stats["completed"] += 1
+            finally:
+                job.finished = time.time()
+                self.queue.task_done()
+                job._finalize()
+            job.report(job.status, job.error or "")
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [j.id for j in self.jobs.values() if j.done and j.finished < cutoff]:
+            del self.jobs[job_id]
+
+    def snapshot(self) -> Dict[str, int]:
+        running = sum(1 for job in self.jobs.values() if job.status == "running")
+        return dict(self.stats, queued=self.pending, running=running)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get or create the shared job queue (call from the event loop)."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
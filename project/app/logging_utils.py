@@ -1,5 +1,7 @@
 import os
 import json
+import uuid
+import contextvars
 from datetime import datetime
 from typing import Any, Dict, Optional
 import threading
@@ -23,7 +25,8 @@ class SessionLogger:
         os.makedirs(self.log_dir, exist_ok=True)
         
         # Create timestamp-based filenames
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Sessions from concurrent clients can start within the same second
+        timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
         self.session_id = timestamp
         
         # Paths for both formats
@@ -63,9 +66,10 @@ class SessionLogger:
             # Add new entry
             entries.append(entry)
             
-            # Write back
+            # Serialize before truncating the file, so a bad entry cannot wipe the log
+            text = json.dumps(entries, indent=2, ensure_ascii=False, default=str)
             with open(self.json_path, 'w', encoding='utf-8') as f:
-                json.dump(entries, f, indent=2, ensure_ascii=False)
+                f.write(text)
     
     def _append_readable(self, text: str):
         """Append text to the human-readable log and optionally to stdout."""
@@ -188,7 +192,7 @@ class SessionLogger:
         readable = [
             f"\n[{timestamp}] TOOL CALL",
             f"Tool: {tool_name}",
-            f"Parameters: {json.dumps(parameters, indent=2)}"
+            f"Parameters: {json.dumps(parameters, indent=2, default=str)}"
         ]
         if result is not None:
             result_str = str(result)
@@ -309,14 +313,19 @@ class SessionLogger:
         self._append_readable("\n".join(readable))
 
 
-# Global logger instance (will be initialized per session)
-_current_logger: Optional[SessionLogger] = None
+# Logger of the session running in the current context (asyncio task or copied thread context),
+# so concurrent UI requests each log to their own session
+_session_logger: contextvars.ContextVar[Optional[SessionLogger]] = contextvars.ContextVar(
+    "session_logger", default=None
+)
+# Process-wide fallback for code running outside any session (e.g. the MCP server)
+_default_logger: Optional[SessionLogger] = None
 _logger_lock = threading.Lock()
 
 
 def get_logger(log_dir: str = "logs") -> SessionLogger:
     """
-    Get or create the current session logger.
+    Get the current session logger, or the process-wide logger outside a session.
     
     Args:
         log_dir: Directory for log files
@@ -324,16 +333,20 @@ def get_logger(log_dir: str = "logs") -> SessionLogger:
     Returns:
         SessionLogger instance
     """
-    global _current_logger
+    logger = _session_logger.get()
+    if logger is not None:
+        return logger
+    global _default_logger
     with _logger_lock:
-        if _current_logger is None:
-            _current_logger = SessionLogger(log_dir)
-        return _current_logger
+        if _default_logger is None:
+            _default_logger = SessionLogger(log_dir)
+        return _default_logger
 
 
 def new_session(log_dir: str = "logs") -> SessionLogger:
     """
-    Start a new logging session.
+    Start a new logging session for the current context.
+    Only the session previously started in this same context is ended.
     
     Args:
         log_dir: Directory for log files
@@ -341,9 +354,9 @@ def new_session(log_dir: str = "logs") -> SessionLogger:
     Returns:
         New SessionLogger instance
     """
-    global _current_logger
-    with _logger_lock:
-        if _current_logger is not None:
-            _current_logger.log_session_end()
-        _current_logger = SessionLogger(log_dir)
-        return _current_logger
+    previous = _session_logger.get()
+    if previous is not None:
+        previous.log_session_end()
+    logger = SessionLogger(log_dir)
+    _session_logger.set(logger)
+    return logger
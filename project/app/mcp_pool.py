@@ -0,0 +1,77 @@
+"""
+MCP worker selection for the orchestrator.
+start.py runs several MCP server processes; each call goes to the worker with the fewest
+calls in flight from this process (ties rotate), and a worker that refuses connections is
+skipped for a short cooldown while the supervisor restarts it.
+"""
+import os
+import time
+import itertools
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Seconds a worker that refused a connection is skipped
+MCP_WORKER_COOLDOWN = float(os.getenv("MCP_WORKER_COOLDOWN", 5))
+
+
+def parse_urls(value: str) -> List[str]:
+    """Split a comma-separated MCP_URLS value."""
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+class McpPool:
+    """
+    Least-busy selection over a fixed set of MCP server URLs.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, urls: List[str], cooldown: float = MCP_WORKER_COOLDOWN):
+        """
+        Args:
+            urls: SSE URLs of the MCP workers
+            cooldown: Seconds a worker marked down is skipped
+        """
+        if not urls:
+            raise ValueError("At least one MCP URL is required")
+        self.urls = list(dict.fromkeys(urls))
+        self.cooldown = cooldown
+        self.in_flight: Dict[str, int] = {url: 0 for url in self.urls}
+        self.down_until: Dict[str, float] = {url: 0.0 for url in self.urls}
+        self.calls: Dict[str, int] = {url: 0 for url in self.urls}
+        self.failures: Dict[str, int] = {url: 0 for url in self.urls}
+        self.rotation = itertools.count()
+
+    def pick(self) -> str:
+        """Return the least busy worker that is not cooling down (any worker if all are)."""
+        now = time.monotonic()
+        up = [url for url in self.urls if self.down_until[url] <= now] or self.urls
+        start = next(self.rotation) % len(up)
+        return min(up[start:] + up[:start], key=lambda url: self.in_flight[url])
+
+    @contextmanager
+    def lease(self) -> Iterator[str]:
+        """Pick a worker and count the call against it until the block exits."""
+        url = self.pick()
+        self.in_flight[url] += 1
+        self.calls[url] += 1
+        try:
+            yield url
+        finally:
+            self.in_flight[url] -= 1
+
+    def mark_down(self, url: str):
+        """Skip a worker that could not be reached for the cooldown period."""
+        self.failures[url] += 1
+        self.down_until[url] = time.monotonic() + self.cooldown
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        now = time.monotonic()
+        return {
+            url: {
+                "in_flight": self.in_flight[url],
+                "calls": self.calls[url],
+                "failures": self.failures[url],
+                "down": int(self.down_until[url] > now)
+            }
+            for url in self.urls
+        }
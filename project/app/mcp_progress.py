@@ -0,0 +1,28 @@
+"""
+Message format of MCP progress notifications shared by the server and the orchestrator.
+Stage updates ("Running list_drive_files_tool") are sent as plain text; streamed answer
+text is sent with a prefix so the client can tell the two apart. When a turn whose text was
+already streamed turns out to be a tool call, a reset message tells the client to discard it.
+"""
+from typing import Optional, Tuple
+
+PARTIAL_TEXT_PREFIX = "\x02text:"
+RESET_TEXT = "\x02reset"
+
+
+def partial_text(text: str) -> str:
+    """Encode a chunk of streamed answer text as a progress message."""
+    return PARTIAL_TEXT_PREFIX + text
+
+
+def parse(message: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Return (is_partial_text, payload) for a progress message.
+    The payload of a reset message is None: the text streamed so far must be discarded.
+    """
+    message = message or ""
+    if message == RESET_TEXT:
+        return True, None
+    if message.startswith(PARTIAL_TEXT_PREFIX):
+        return True, message[len(PARTIAL_TEXT_PREFIX):]
+    return False, message
@@ -1,59 +1,130 @@
 import os
+import uuid
+import asyncio
+from contextlib import AsyncExitStack
+from typing import Callable, Optional
 from dotenv import load_dotenv
-import google.generativeai as genai
 from fastmcp import Client  # Correct import per library docs
 from logging_utils import get_logger  # Import logging utilities
+import mcp_progress
+from mcp_pool import McpPool, parse_urls
+from gemini_client import get_genai
+# Gmail, Drive and expense work all happens on the MCP server; nothing here imports those agents
 
-# Import Gmail tools (local if needed, but route via MCP)
-from gmail_agent import list_emails as gmail_list_emails
-from gmail_agent import read_email as gmail_read_email
-from gmail_agent import send_email as gmail_send_email
-from gmail_agent import create_label as gmail_create_label
-from gmail_agent import apply_label as gmail_apply_label
-
-# Expense validation (local)
-import fitz  # PyMuPDF
-from datetime import datetime
 AI_MODEL = "gemini-2.5-flash"
 
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini locally for classification/routing
+# Gemini is used locally for classification/routing; the SDK loads on the first request
 API_KEY = os.getenv("GEMINI_API_KEY")
-if API_KEY:
-    genai.configure(api_key=API_KEY)
 
-async def route_to_mcp(request: str) -> str:
+MCP_URL = os.getenv("MCP_URL", "http://localhost:8000/sse")
+# Comma-separated SSE URLs of all MCP workers (set by start.py); defaults to MCP_URL alone
+MCP_URLS = parse_urls(os.getenv("MCP_URLS", MCP_URL))
+mcp_pool = McpPool(MCP_URLS)
+# Seconds allowed for telling the MCP server to stop a cancelled request
+CANCEL_TIMEOUT = float(os.getenv("MCP_CANCEL_TIMEOUT", 5))
+
+# (stage, detail) progress callback supplied by the job running the request
+ProgressCallback = Callable[[str, str], None]
+# Receives chunks of the answer text as the model streams it; None discards the text so far
+TextCallback = Callable[[Optional[str]], None]
+
+
+def _progress_handler(progress: Optional[ProgressCallback], on_text: Optional[TextCallback] = None):
+    """
+    Split MCP progress notifications into stage updates (e.g. 'Running list_drive_files_tool'),
+    forwarded to progress, and streamed answer text, forwarded to on_text.
+    """
+    if progress is None and on_text is None:
+        return None
+
+    async def handler(value: float, total: Optional[float], message: Optional[str]):
+        is_text, payload = mcp_progress.parse(message)
+        if is_text:
+            if on_text:
+                on_text(payload)
+        elif progress:
+            progress("tool", payload or f"step {value:g}")
+    return handler
+
+
+async def cancel_remote(request_id: str, url: str = MCP_URL):
+    """Ask the MCP worker running a request to stop it because its caller has gone away."""
+    logger = get_logger()
+    try:
+        async with Client(url) as client:
+            result = await asyncio.wait_for(
+                client.call_tool('cancel_request', {'request_id': request_id}), CANCEL_TIMEOUT
+            )
+        logger.log_tool_call("cancel_request", {"request_id": request_id}, result)
+    except Exception as e:
+        logger.log_error(
+            error_type="mcp_cancel_error",
+            error_message=str(e),
+            context="cancel_remote"
+        )
+
+
+async def _call_mcp(tool: str, arguments: dict, request_id: str, progress, on_text):
+    """
+    Call an MCP tool on the least busy worker, propagating cancellation of the calling task to
+    the server-side request. Workers that refuse the connection are skipped; once connected
+    the call is never retried, since tools may already have had side effects.
+    """
+    last_error = None
+    for _ in mcp_pool.urls:
+        with mcp_pool.lease() as url:
+            async with AsyncExitStack() as stack:
+                try:
+                    client = await stack.enter_async_context(Client(url))
+                except Exception as e:
+                    # Worker down or restarting; nothing ran there yet
+                    mcp_pool.mark_down(url)
+                    last_error = e
+                    continue
+                try:
+                    return await client.call_tool(tool, dict(arguments, request_id=request_id),
+                                                  progress_handler=_progress_handler(progress, on_text))
+                except asyncio.CancelledError:
+                    # Shielded so the cancel message is still sent while this task unwinds
+                    await asyncio.shield(cancel_remote(request_id, url))
+                    raise
+    raise last_error
+
+
+async def route_to_mcp(request: str, progress: Optional[ProgressCallback] = None,
+                       on_text: Optional[TextCallback] = None, request_id: Optional[str] = None) -> str:
     logger = get_logger()
     logger.log_routing("MCP Server", "agent_action")
     
     try:
-        async with Client("http://localhost:8000/sse") as client:
-            result = await client.call_tool('agent_action', {'request': request})
-            # Improved extraction to avoid repeats
-            if hasattr(result, 'content') and isinstance(result.content, list) and len(result.content) > 0 and hasattr(result.content[0], 'text'):
-                response = result.content[0].text.replace('\\n', '\n')
-            elif hasattr(result, 'structured_content') and 'result' in result.structured_content:
-                response = result.structured_content['result'].replace('\\n', '\n')
-            elif hasattr(result, 'text'):
-                response = result.text.replace('\\n', '\n')
-            elif isinstance(result, str) and 'text=' in result:
-                # Parse from string like "type='text' text='content'"
-                start = result.find("text='") + 6
-                end = result.find("'", start)
-                text = result[start:end]
-                response = text.replace('\\n', '\n')
-            else:
-                response = str(result).replace('\\n', '\n')
-            
-            logger.log_model_response(
-                model_name="MCP agent_action",
-                prompt=request,
-                response=response
-            )
-            return response
+        result = await _call_mcp('agent_action', {'request': request}, request_id or uuid.uuid4().hex,
+                                 progress, on_text)
+        # Improved extraction to avoid repeats
+        if hasattr(result, 'content') and isinstance(result.content, list) and len(result.content) > 0 and hasattr(result.content[0], 'text'):
+            response = result.content[0].text.replace('\\n', '\n')
+        elif hasattr(result, 'structured_content') and 'result' in result.structured_content:
+            response = result.structured_content['result'].replace('\\n', '\n')
+        elif hasattr(result, 'text'):
+            response = result.text.replace('\\n', '\n')
+        elif isinstance(result, str) and 'text=' in result:
+            # Parse from string like "type='text' text='content'"
+            start = result.find("text='") + 6
+            end = result.find("'", start)
+            text = result[start:end]
+            response = text.replace('\\n', '\n')
+        else:
+            response = str(result).replace('\\n', '\n')
+        
+        logger.log_model_response(
+            model_name="MCP agent_action",
+            prompt=request,
+            response=response
+        )
+        return response
     except Exception as e:
         error_msg = f"MCP Error: {str(e)}"
         logger.log_error(
@@ -63,34 +134,35 @@ async def route_to_mcp(request: str) -> str:
         )
         return error_msg
 
-async def route_to_mcp_general(prompt: str) -> str:
+async def route_to_mcp_general(prompt: str, progress: Optional[ProgressCallback] = None,
+                               on_text: Optional[TextCallback] = None, request_id: Optional[str] = None) -> str:
     logger = get_logger()
     logger.log_routing("MCP Server", "ask_gemini")
     
     try:
-        async with Client("http://localhost:8000/sse") as client:
-            result = await client.call_tool('ask_gemini', {'prompt': prompt})
-            # Improved extraction to avoid repeats
-            if hasattr(result, 'content') and isinstance(result.content, list) and len(result.content) > 0 and hasattr(result.content[0], 'text'):
-                response = result.content[0].text.replace('\\n', '\n')
-            elif hasattr(result, 'structured_content') and 'result' in result.structured_content:
-                response = result.structured_content['result'].replace('\\n', '\n')
-            elif hasattr(result, 'text'):
-                response = result.text.replace('\\n', '\n')
-            elif isinstance(result, str) and 'text=' in result:
-                start = result.find("text='") + 6
-                end = result.find("'", start)
-                text = result[start:end]
-                response = text.replace('\\n', '\n')
-            else:
-                response = str(result).replace('\\n', '\n')
-            
-            logger.log_model_response(
-                model_name="MCP ask_gemini",
-                prompt=prompt,
-                response=response
-            )
-            return response
+        result = await _call_mcp('ask_gemini', {'prompt': prompt}, request_id or uuid.uuid4().hex,
+                                 progress, on_text)
+        # Improved extraction to avoid repeats
+        if hasattr(result, 'content') and isinstance(result.content, list) and len(result.content) > 0 and hasattr(result.content[0], 'text'):
+            response = result.content[0].text.replace('\\n', '\n')
+        elif hasattr(result, 'structured_content') and 'result' in result.structured_content:
+            response = result.structured_content['result'].replace('\\n', '\n')
+        elif hasattr(result, 'text'):
+            response = result.text.replace('\\n', '\n')
+        elif isinstance(result, str) and 'text=' in result:
+            start = result.find("text='") + 6
+            end = result.find("'", start)
+            text = result[start:end]
+            response = text.replace('\\n', '\n')
+        else:
+            response = str(result).replace('\\n', '\n')
+        
+        logger.log_model_response(
+            model_name="MCP ask_gemini",
+            prompt=prompt,
+            response=response
+        )
+        return response
     except Exception as e:
         error_msg = f"MCP General Error: {str(e)}"
         logger.log_error(
@@ -101,7 +173,10 @@ async def route_to_mcp_general(prompt: str) -> str:
         return error_msg
 
 # Make handle_request async
-async def handle_request(user_input: str, file_paths: list[str] = None) -> str:
+async def handle_request(user_input: str, file_paths: list[str] = None,
+                         progress: Optional[ProgressCallback] = None,
+                         on_text: Optional[TextCallback] = None,
+                         request_id: Optional[str] = None) -> str:
     """
     Handle a user request by routing to the appropriate agent (Gmail/Drive via MCP, or Expense locally).
     Use natural language to describe the request. If files are involved, upload them to Gemini.
@@ -109,9 +184,13 @@ async def handle_request(user_input: str, file_paths: list[str] = None) -> str:
     Args:
         user_input: The user's instructions (e.g., "Email john@gmail.com that I hate him").
         file_paths: Optional list of uploaded file paths (e.g., for expense validation).
+        progress: Optional callback receiving (stage, detail) as the request is classified, routed and run.
+        on_text: Optional callback receiving the answer text in chunks while it is generated.
+        request_id: Optional id for the MCP request; cancelling this task cancels it server-side too.
     """
     if not API_KEY:
         return "Error: GEMINI_API_KEY not set."
+    progress = progress or (lambda stage, detail="": None)
 
     # Get logger for this session
     logger = get_logger()
@@ -121,7 +200,8 @@ async def handle_request(user_input: str, file_paths: list[str] = None) -> str:
     if file_paths:
         full_request += "\n\nAttached files: " + ', '.join(file_paths)
 
-    # Use local Gemini to classify the request type (sync)
+    # Use local Gemini to classify the request type; the first call imports the SDK off the event loop
+    genai = await asyncio.to_thread(get_genai)
     model = genai.GenerativeModel(model_name=AI_MODEL)
     classification_prompt = f"""
     Classify this request into one category: 'gmail', 'drive', 'expense', or 'general'.
@@ -129,7 +209,9 @@ async def handle_request(user_input: str, file_paths: list[str] = None) -> str:
     Output only the category.
     """
     chat = model.start_chat()
-    category_response = chat.send_message(classification_prompt)
+    progress("classifying", "")
+    # Blocking SDK call; keep the event loop free for other clients
+    category_response = await asyncio.to_thread(chat.send_message, classification_prompt)
     # Safe extract category if response is list or multi-part
     if isinstance(category_response, list):
         category_text = category_response[0].text if hasattr(category_response[0], 'text') else str(category_response[0])
@@ -141,12 +223,16 @@ async def handle_request(user_input: str, file_paths: list[str] = None) -> str:
     
     # Log classification result
     logger.log_classification(category, full_request)
+    progress("classified", category)
 
     if category == 'expense':
-        return await route_to_mcp(full_request)
+        progress("routed", "MCP agent_action")
+        return await route_to_mcp(full_request, progress, on_text, request_id)
     elif category in ['gmail', 'drive']:
         # Route to MCP server async
-        return await route_to_mcp(full_request)
+        progress("routed", "MCP agent_action")
+        return await route_to_mcp(full_request, progress, on_text, request_id)
     else:
         # General: Use MCP's ask_gemini async
-        return await route_to_mcp_general(full_request)
\ No newline at end of file
+        progress("routed", "MCP ask_gemini")
+        return await route_to_mcp_general(full_request, progress, on_text, request_id)
@@ -0,0 +1,178 @@
+"""
+PDF Text Extraction
+Shared PyMuPDF-based extraction used by the drive and expense agents.
+Pages are streamed as a generator and joined once; large documents are split across a process pool.
+"""
+import os
+import re
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Union
+
+# Documents with at least this many pages are extracted in parallel
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+
+PageSpec = Union[str, Sequence[int], None]
+# One part of a page spec: "7", "1-3", "10-" or "-5"
+PAGE_PART_RE = re.compile(r"^(\d+)$|^(\d*)-(\d*)$")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _open(source: Union[str, bytes]):
+    """Open a PDF from a path or from raw bytes."""
+    import fitz  # PyMuPDF, imported on first use to keep module import cheap
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def parse_page_range(spec: str, page_count: int) -> List[int]:
+    """
+    Convert a 1-based page spec such as "1-3,7,10-" into sorted 0-based page indexes.
+
+    Raises:
+        ValueError: If the spec is malformed or selects no pages
+    """
+    indexes = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        match = PAGE_PART_RE.match(part)
+        if not match:
+            raise ValueError(f"Invalid page range '{part}': use page numbers such as '1-3,7' or '10-'")
+        single, start, end = match.groups()
+        if single:
+            first = last = int(single)
+        else:
+            first = int(start) if start else 1
+            last = int(end) if end else max(page_count, first)
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range '{part}': pages start at 1 and ranges must not run backwards")
+        indexes.update(range(first - 1, min(last, page_count)))
+    if not indexes:
+        raise ValueError(f"No pages selected by '{spec}' (document has {page_count} pages)")
+    return sorted(indexes)
+
+
+def resolve_pages(pages: PageSpec, page_count: int) -> List[int]:
+    """Normalize a page spec (string, 0-based indexes or None for all) against a page count."""
+    if pages is None:
+        return list(range(page_count))
+    if isinstance(pages, str):
+        return parse_page_range(pages, page_count)
+    return [p for p in pages if 0 <= p < page_count]
+
+
+def page_count(source: Union[str, bytes]) -> int:
+    """Return the number of pages in a PDF."""
+    with _open(source) as doc:
+        return doc.page_count
+
+
+def iter_pages(source: Union[str, bytes], pages: PageSpec = None) -> Iterator[str]:
+    """
+    Yield the text of each selected page in order.
+    Only one page's text is held at a time, so callers can stop early.
+    """
+    with _open(source) as doc:
+        for index in resolve_pages(pages, doc.page_count):
+            yield doc[index].get_text()
+
+
+def _extract_slice(path: str, indexes: List[int]) -> List[str]:
+    """Process pool worker: extract a contiguous run of pages."""
+    return list(iter_pages(path, indexes))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: the pool is created from worker threads of a multi-threaded
+            # server, and a forked child could inherit locks held by other threads
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    """Stop the worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def extract_pages(source: Union[str, bytes], pages: PageSpec = None, parallel: bool = True) -> List[str]:
+    """
+    Return the text of each selected page.
+
+    Args:
+        source: Path to the PDF or its raw bytes
+        pages: Optional page spec ("1-3,7") or 0-based page indexes; None for all pages
+        parallel: Allow fanning large documents out across the process pool
+    """
+    if parallel and PDF_WORKERS > 1 and isinstance(source, str):
+        with _open(source) as doc:
+            indexes = resolve_pages(pages, doc.page_count)
+        if len(indexes) >= PARALLEL_MIN_PAGES:
+            # Contiguous slices keep each worker's reads local within the file
+            size = -(-len(indexes) // PDF_WORKERS)
+            slices = [indexes[i:i + size] for i in range(0, len(indexes), size)]
+            pool = _get_pool()
+            return [text for chunk in pool.map(_extract_slice, [source] * len(slices), slices) for text in chunk]
+        pages = indexes
+    return list(iter_pages(source, pages))
+
+
+def extract_text(source: Union[str, bytes], pages: PageSpec = None,
+                 max_chars: Optional[int] = None, parallel: bool = True) -> str:
+    """
+    Extract text from a PDF.
+
+    Args:
+        source: Path to the PDF or its raw bytes
+        pages: Optional page spec ("1-3,7") or 0-based page indexes; None for all pages
+        max_chars: Optional character budget; extraction stops at the first page that exhausts it
+        parallel: Allow fanning large documents out across the process pool (ignored with a budget)
+
+    Returns:
+        Page texts joined by newlines, truncated to max_chars
+    """
+    if max_chars is None:
+        return "\n".join(extract_pages(source, pages, parallel)).strip()
+
+    parts = []
+    remaining = max_chars
+    for text in iter_pages(source, pages):
+        if len(text) >= remaining:
+            parts.append(text[:remaining])
+            break
+        remaining -= len(text) + 1
+        parts.append(text)
+    return "\n".join(parts).strip()
+
+
+def extract_many(paths: List[str]) -> List[Union[str, Exception]]:
+    """
+    Extract the full text of several PDFs, one per process-pool worker.
+    Failures are returned in place of the text so one bad file does not sink the batch.
+    """
+    if len(paths) <= 1 or PDF_WORKERS <= 1:
+        futures = None
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(extract_text, path, None, None, False) for path in paths]
+    results = []
+    for i, path in enumerate(paths):
+        try:
+            results.append(futures[i].result() if futures else extract_text(path))
+        except Exception as e:
+            results.append(e)
+    return results
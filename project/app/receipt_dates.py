@@ -0,0 +1,155 @@
+"""
+Local Receipt Date Extraction
+Finds dates in receipt text across common numeric and month-name formats (English, Spanish,
+French, German) and picks the most plausible transaction date among them.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+MONTHS = {
+    # English
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8, "sep": 9,
+    "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+    # Spanish
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+    "ene": 1, "abr": 4, "ago": 8, "dic": 12,
+    # French
+    "janvier": 1, "février": 2, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "août": 8, "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11, "décembre": 12,
+    "decembre": 12, "janv": 1, "févr": 2, "fevr": 2, "avr": 4, "juil": 7,
+    # German
+    "januar": 1, "februar": 2, "märz": 3, "maerz": 3, "juni": 6, "juli": 7, "oktober": 10,
+    "dezember": 12, "mär": 3, "okt": 10, "dez": 12,
+}
+MONTH_NAME = r"(?P<month_name>" + "|".join(sorted(map(re.escape, MONTHS), key=len, reverse=True)) + r")\.?"
+
+# (pattern, day-first) — numeric formats; dotted dates are day-first in the locales we see
+NUMERIC_PATTERNS = [
+    (re.compile(r"(?<!\d)(?P<y>\d{4})[-/.](?P<m>\d{1,2})[-/.](?P<d>\d{1,2})(?!\d)"), False),
+    (re.compile(r"(?<!\d)(?P<a>\d{1,2})/(?P<b>\d{1,2})/(?P<y>\d{4}|\d{2})(?!\d)"), False),
+    (re.compile(r"(?<!\d)(?P<a>\d{1,2})-(?P<b>\d{1,2})-(?P<y>\d{4}|\d{2})(?!\d)"), False),
+    (re.compile(r"(?<!\d)(?P<a>\d{1,2})\.(?P<b>\d{1,2})\.(?P<y>\d{4}|\d{2})(?!\d)"), True),
+]
+NAMED_PATTERNS = [
+    # Nov 21, 2025 / November 21st 2025
+    re.compile(MONTH_NAME + r"\s+(?P<d>\d{1,2})(?:st|nd|rd|th)?,?\s+(?P<y>\d{4})\b", re.IGNORECASE),
+    # 21 Nov 2025 / 21-Nov-2025 / 21 de noviembre de 2025 / 21. November 2025
+    re.compile(r"\b(?P<d>\d{1,2})(?:st|nd|rd|th|er)?\.?[\s\-]+(?:de\s+)?" + MONTH_NAME
+               + r"[\s\-,]+(?:de\s+)?(?P<y>\d{4}|\d{2})\b", re.IGNORECASE),
+]
+
+# Labels that make a nearby date more or less likely to be the transaction date
+POSITIVE_CONTEXT = re.compile(
+    r"\b(date|purchased?|transaction|sale|sold|order(ed)?|invoice date|issued|paid|fecha|datum|achat)\b",
+    re.IGNORECASE
+)
+NEGATIVE_CONTEXT = re.compile(
+    r"\b(due|expir\w*|exp|valid|until|return(s)? by|refund|print(ed)?|birth|dob|member since|since|next)\b",
+    re.IGNORECASE
+)
+CONTEXT_CHARS = 40
+# Receipts older than this are implausible as the transaction date of a new submission
+MAX_PLAUSIBLE_AGE_DAYS = 5 * 365
+
+
+@dataclass
+class DateCandidate:
+    date: datetime
+    position: int
+    text: str
+    score: float = 0.0
+    # "positive", "neutral" or "negative", from the label printed before the date
+    context: str = "neutral"
+
+
+def _year(value: str) -> int:
+    year = int(value)
+    return year + 2000 if year < 100 else year
+
+
+def _numeric_date(match: re.Match, day_first: bool) -> Optional[datetime]:
+    groups = match.groupdict()
+    year = _year(groups["y"])
+    if "m" in groups and groups.get("m") is not None:
+        month, day = int(groups["m"]), int(groups["d"])
+    else:
+        a, b = int(groups["a"]), int(groups["b"])
+        # Month-first (US) unless the locale is day-first or the first field cannot be a month
+        if day_first or a > 12:
+            day, month = a, b
+        else:
+            month, day = a, b
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def find_candidates(text: str) -> List[DateCandidate]:
+    """Return every date found in the text, ordered by position, without scores."""
+    candidates = {}
+    for pattern, day_first in NUMERIC_PATTERNS:
+        for match in pattern.finditer(text):
+            date = _numeric_date(match, day_first)
+            if date and match.start() not in candidates:
+                candidates[match.start()] = DateCandidate(date, match.start(), match.group(0))
+    for pattern in NAMED_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                date = datetime(_year(match.group("y")), MONTHS[match.group("month_name").lower()],
+                                int(match.group("d")))
+            except ValueError:
+                continue
+            # Named formats win over a numeric match starting at the same place
+            candidates[match.start()] = DateCandidate(date, match.start(), match.group(0))
+    return [candidates[position] for position in sorted(candidates)]
+
+
+def score_candidates(text: str, candidates: List[DateCandidate], today: Optional[datetime] = None) -> List[DateCandidate]:
+    """
+    Score candidates by surrounding labels and plausibility; higher is more likely the transaction date.
+    A score below zero means the date is unlikely to be the transaction date at all.
+    """
+    today = today or datetime.now()
+    for candidate in candidates:
+        line_start = text.rfind("\n", 0, candidate.position) + 1
+        before = text[max(line_start, candidate.position - CONTEXT_CHARS):candidate.position]
+        score = 0.0
+        if NEGATIVE_CONTEXT.search(before):
+            candidate.context = "negative"
+            score -= 4
+        elif POSITIVE_CONTEXT.search(before):
+            candidate.context = "positive"
+            score += 3
+        if candidate.date > today:
+            score -= 5
+        elif (today - candidate.date).days > MAX_PLAUSIBLE_AGE_DAYS:
+            score -= 3
+        candidate.score = score
+    return candidates
+
+
+def best_candidate(text: str, today: Optional[datetime] = None) -> Optional[DateCandidate]:
+    """
+    Return the most plausible transaction date candidate, or None if no date qualifies.
+    Dates with a negative label ("Member since", "Return by") or a negative score are never
+    chosen; ties go to the date printed first, since transaction dates are usually near the top.
+    """
+    candidates = [
+        candidate for candidate in score_candidates(text, find_candidates(text), today)
+        if candidate.context != "negative" and candidate.score >= 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: (candidate.score, -candidate.position))
+
+
+def extract_receipt_date(text: str, today: Optional[datetime] = None) -> Optional[datetime]:
+    """Return the most plausible transaction date in the receipt text, or None if no date qualifies."""
+    candidate = best_candidate(text, today)
+    return candidate.date if candidate else None
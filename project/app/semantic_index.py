@@ -0,0 +1,217 @@
+"""
+Local Vector Index for Drive Documents
+Chunks document text, embeds it on CPU with sentence-transformers and stores it in a persistent chromadb collection.
+
+An embedded PersistentClient is only safe in a single process. When several MCP workers share
+the index, start.py runs a chroma server over INDEX_PATH and sets DRIVE_INDEX_URL so every
+worker goes through it.
+"""
+import os
+import hashlib
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.getenv("DRIVE_INDEX_PATH", os.path.join(SCRIPT_DIR, "cache", "chroma"))
+# URL of a chroma server holding the index (e.g. http://127.0.0.1:8100); unset for an embedded index
+INDEX_URL = os.getenv("DRIVE_INDEX_URL")
+EMBEDDING_MODEL = os.getenv("DRIVE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+COLLECTION_NAME = "drive_chunks"
+
+# Chunk size in characters; the overlap keeps sentences that straddle a boundary searchable
+CHUNK_CHARS = 1000
+CHUNK_OVERLAP = 200
+EMBED_BATCH_SIZE = 64
+
+_collection = None
+_model = None
+_init_lock = threading.Lock()
+# Separate lock so loading the model (seconds) never blocks collection access
+_model_lock = threading.Lock()
+
+
+def get_collection():
+    """Get or create the persistent chromadb collection (cosine distance)."""
+    global _collection
+    with _init_lock:
+        if _collection is None:
+            import chromadb
+            if INDEX_URL:
+                url = urlparse(INDEX_URL)
+                client = chromadb.HttpClient(host=url.hostname, port=url.port or 8000,
+                                             ssl=url.scheme == "https")
+            else:
+                client = chromadb.PersistentClient(path=INDEX_PATH)
+            _collection = client.get_or_create_collection(
+                COLLECTION_NAME, metadata={"hnsw:space": "cosine"}
+            )
+        return _collection
+
+
+def get_model():
+    """Load the sentence-transformers model on CPU on first use."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+        return _model
+
+
+def embed(texts: List[str]) -> List[List[float]]:
+    """Embed texts in batches; vectors are normalized so cosine distance is 1 - dot product."""
+    if not texts:
+        return []
+    vectors = get_model().encode(
+        texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True
+    )
+    return vectors.tolist()
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into overlapping chunks of roughly `size` characters.
+    Chunks end on whitespace where possible so words are not cut in half.
+    """
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            split = text.rfind(" ", start + size // 2, end)
+            if split != -1:
+                end = split
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(file_id: str, chunks: List[str]) -> List[str]:
+    """
+    Content-addressed ids for a file's chunks, so inserting text near the top of a document
+    does not change the ids (and embeddings) of every chunk after it. Repeated identical
+    chunks get an occurrence suffix.
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for chunk in chunks:
+        digest = chunk_hash(chunk)
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{file_id}:{digest}" + (f":{occurrence}" if occurrence else ""))
+    return ids
+
+
+def plan_update(file_id: str, chunks: List[str]) -> Tuple[List[int], List[int], List[str]]:
+    """
+    Compare new chunks against what is stored for a file.
+
+    Returns:
+        (changed chunk indexes, unchanged chunk indexes, stale ids to delete)
+    """
+    stored = set(get_collection().get(where={"file_id": file_id}, include=["metadatas"])["ids"])
+    ids = chunk_ids(file_id, chunks)
+    changed = [i for i, cid in enumerate(ids) if cid not in stored]
+    unchanged = [i for i, cid in enumerate(ids) if cid in stored]
+    current = set(ids)
+    stale = [cid for cid in stored if cid not in current]
+    return changed, unchanged, stale
+
+
+def write_chunks(file_id: str, name: str, version: str, chunks: List[str],
+                 changed: List[int], unchanged: List[int], stale: List[str],
+                 embeddings: List[List[float]]):
+    """Upsert changed chunks with their embeddings, refresh metadata of unchanged ones and drop stale ids."""
+    collection = get_collection()
+    ids = chunk_ids(file_id, chunks)
+
+    def metadata(i):
+        return {"file_id": file_id, "name": name, "version": version,
+                "chunk": i, "hash": chunk_hash(chunks[i])}
+
+    if changed:
+        collection.upsert(
+            ids=[ids[i] for i in changed],
+            documents=[chunks[i] for i in changed],
+            embeddings=embeddings,
+            metadatas=[metadata(i) for i in changed]
+        )
+    if unchanged:
+        # Metadata-only update (the chunk may have moved): no re-embedding for text already stored
+        collection.update(
+            ids=[ids[i] for i in unchanged],
+            metadatas=[metadata(i) for i in unchanged]
+        )
+    if stale:
+        collection.delete(ids=stale)
+
+
+def index_document(file_id: str, name: str, version: str, text: str) -> int:
+    """
+    Index (or re-index) a document's text, embedding only chunks that changed.
+
+    Returns:
+        Number of chunks embedded
+    """
+    chunks = chunk_text(text)
+    changed, unchanged, stale = plan_update(file_id, chunks)
+    embeddings = embed([chunks[i] for i in changed])
+    write_chunks(file_id, name, version, chunks, changed, unchanged, stale, embeddings)
+    return len(changed)
+
+
+def remove_document(file_id: str):
+    """Remove every chunk of a file from the index."""
+    get_collection().delete(where={"file_id": file_id})
+
+
+def indexed_version(file_id: str) -> Optional[str]:
+    """Return the version a file was last indexed at, or None if it is not indexed."""
+    result = get_collection().get(where={"file_id": file_id}, limit=1, include=["metadatas"])
+    if not result["ids"]:
+        return None
+    return result["metadatas"][0].get("version")
+
+
+def indexed_file_ids(file_ids: List[str]) -> Set[str]:
+    """Return the subset of file_ids that have at least one chunk in the index."""
+    if not file_ids:
+        return set()
+    result = get_collection().get(where={"file_id": {"$in": list(file_ids)}}, include=["metadatas"])
+    return {meta["file_id"] for meta in result["metadatas"]}
+
+
+def search(query: str, n_results: int = 10) -> List[Dict]:
+    """
+    Return the chunks closest to the query, best first.
+
+    Each hit has file_id, name, chunk, text and score (cosine similarity).
+    """
+    collection = get_collection()
+    if collection.count() == 0:
+        return []
+    result = collection.query(
+        query_embeddings=embed([query]),
+        n_results=min(int(n_results), collection.count()),
+        include=["documents", "metadatas", "distances"]
+    )
+    hits = []
+    for text, meta, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0]):
+        hits.append({
+            "file_id": meta["file_id"],
+            "name": meta.get("name", ""),
+            "chunk": meta.get("chunk", 0),
+            "text": text,
+            "score": 1.0 - distance
+        })
+    return hits
@@ -1,95 +1,336 @@
 """
 Start script for running both MCP server and UI app
 Works on Windows and Unix systems
+
+Acts as a small supervisor: runs MCP_WORKERS MCP server processes on consecutive ports
+from MCP_BASE_PORT (the orchestrator spreads requests across them via MCP_URLS), restarts
+any process that exits with exponential backoff, and drains on SIGTERM/Ctrl+C: the UI stops
+accepting jobs, queued and running jobs and in-flight MCP requests get up to SHUTDOWN_GRACE
+seconds to finish, then the MCP workers are stopped, then the UI.
+With more than one worker, the Drive vector index is served by a chroma server on
+INDEX_PORT (an embedded chromadb index must not be written by several processes).
 """
+import json
+import secrets
+import shutil
+import signal
 import subprocess
 import sys
 import time
 import os
+import urllib.request
+import urllib.error
+
+# MCP server processes; requests are spread across them
+MCP_WORKERS = max(1, int(os.getenv("MCP_WORKERS", min(4, os.cpu_count() or 1))))
+# Worker i listens on MCP_BASE_PORT + i
+MCP_BASE_PORT = int(os.getenv("MCP_BASE_PORT", 8000))
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+# Seconds to wait for each service before giving up
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", 60))
+# Seconds in-flight requests get to finish on shutdown before processes are killed
+SHUTDOWN_GRACE = float(os.getenv("SHUTDOWN_GRACE", 30))
+# Probe backoff: first delay, doubling up to the cap
+PROBE_INITIAL_DELAY = 0.05
+PROBE_MAX_DELAY = 1.0
+# Restart backoff: first delay, doubling per consecutive crash up to the cap
+RESTART_INITIAL_DELAY = 1.0
+RESTART_MAX_DELAY = 60.0
+# A process that stayed up this long is considered healthy again
+RESTART_RESET_AFTER = 60.0
+
+# Chroma server for the shared vector index
+INDEX_PORT = int(os.getenv("INDEX_PORT", 8100))
+INDEX_PATH = os.getenv("DRIVE_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "chroma"))
 
+WORKER_PORTS = [MCP_BASE_PORT + i for i in range(MCP_WORKERS)]
+# Several workers share the index through one chroma server unless one is configured already
+SHARED_INDEX = MCP_WORKERS > 1 and "DRIVE_INDEX_URL" not in os.environ
+if SHARED_INDEX:
+    os.environ["DRIVE_INDEX_URL"] = "http://127.0.0.1:{}".format(INDEX_PORT)
+
+# Point the orchestrator at every worker unless configured otherwise
+if "MCP_URLS" not in os.environ:
+    os.environ["MCP_URLS"] = ",".join("http://127.0.0.1:{}/sse".format(port) for port in WORKER_PORTS)
 # Set default MCP_URL if not provided
 if "MCP_URL" not in os.environ:
-    os.environ["MCP_URL"] = "http://127.0.0.1:8000/sse"
+    os.environ["MCP_URL"] = "http://127.0.0.1:{}/sse".format(MCP_BASE_PORT)
 
-def start_services():
-    print("="*60)
-    print("Starting Orchestration Agent Multi-Service Deployment")
-    print("="*60)
-    
-    print("\n[1/2] Starting MCP server on port 8000...")
-    
-    # Create a copy of environment variables
-    mcp_env = os.environ.copy()
-    
-    # Force uvicorn (used by fastmcp) to use port 8000 and bind to 0.0.0.0
-    # This overrides Render's PORT variable for the MCP process only
-    mcp_env["PORT"] = "8000"
-    mcp_env["HOST"] = "0.0.0.0"
-    
-    # Start MCP server as subprocess - let it output to console
-    mcp_process = subprocess.Popen(
-        [sys.executable, "gemini_mcp.py"],
-        # Don't capture output - let it print to console for debugging
-        stdout=None,
-        stderr=None,
-        env=mcp_env  # Pass the modified environment
-    )
-    
-    # Wait for MCP server to initialize
-    print("[1/2] Waiting 5 seconds for MCP server to initialize...")
-    time.sleep(5)
-    
-    # Check if MCP server is still running
-    if mcp_process.poll() is not None:
-        print("\n" + "="*60)
-        print("ERROR: MCP server failed to start!")
+
+def wait_until_ready(url, process, timeout=STARTUP_TIMEOUT, stop=None):
+    """
+    Poll url until it answers 200, backing off between probes.
+
+    Args:
+        url: Readiness URL to probe
+        process: The service's process; waiting stops if it exits
+        timeout: Seconds to wait before giving up
+        stop: Optional callable; waiting stops when it returns True
+
+    Returns:
+        (ready, probes, last_error)
+    """
+    deadline = time.monotonic() + timeout
+    delay = PROBE_INITIAL_DELAY
+    probes = 0
+    last_error = None
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False, probes, "process exited with code {}".format(process.returncode)
+        if stop is not None and stop():
+            return False, probes, "shutting down"
+        probes += 1
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return True, probes, None
+        except urllib.error.HTTPError as e:
+            # 503 from /ready: serving, but a check is failing
+            last_error = "{} {}".format(e.code, e.read().decode(errors="replace"))
+        except (urllib.error.URLError, OSError) as e:
+            last_error = str(e)
+        time.sleep(min(delay, max(0, deadline - time.monotonic())))
+        delay = min(delay * 2, PROBE_MAX_DELAY)
+    return False, probes, last_error or "timed out"
+
+
+class Service:
+    """One supervised child process."""
+
+    def __init__(self, name, command, env, ready_url):
+        self.name = name
+        self.command = command
+        self.env = env
+        self.ready_url = ready_url
+        self.process = None
+        self.launched = 0.0
+        self.crashes = 0
+        self.restart_at = None
+        self.restarts = 0
+
+    def start(self):
+        # Own process group, so a terminal Ctrl+C reaches only the supervisor, which drains first
+        group = ({"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt"
+                 else {"start_new_session": True})
+        self.process = subprocess.Popen(self.command, stdout=None, stderr=None, env=self.env, **group)
+        self.launched = time.monotonic()
+        self.restart_at = None
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def check(self, now):
+        """Schedule a restart with backoff if the process exited; start it when due."""
+        if self.restart_at is None:
+            if self.running():
+                return
+            if now - self.launched >= RESTART_RESET_AFTER:
+                self.crashes = 0
+            delay = min(RESTART_INITIAL_DELAY * 2 ** self.crashes, RESTART_MAX_DELAY)
+            self.crashes += 1
+            self.restart_at = now + delay
+            print("! {} exited with code {}; restarting in {:.0f}s".format(
+                self.name, self.process.returncode, delay))
+        elif now >= self.restart_at:
+            self.start()
+            self.restarts += 1
+            print("! {} restarted (PID: {}, restart #{})".format(self.name, self.process.pid, self.restarts))
+
+    def in_flight(self):
+        """Requests the worker reports as running, or None if it cannot be asked."""
+        url = self.ready_url.rsplit("/", 1)[0] + "/health"
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return json.load(response).get("in_flight")
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def terminate(self):
+        if self.running():
+            self.process.terminate()
+
+
+class Supervisor:
+    """Starts the MCP workers and the UI, keeps them running and shuts them down in order."""
+
+    def __init__(self):
+        self.stopping = False
+        self.workers = []
+        for i, port in enumerate(WORKER_PORTS):
+            env = os.environ.copy()
+            # Each worker binds its own port; this overrides Render's PORT for MCP processes only
+            env["MCP_PORT"] = str(port)
+            env["MCP_HOST"] = MCP_HOST
+            env["PORT"] = str(port)
+            env["HOST"] = MCP_HOST
+            if i > 0:
+                # One background Drive indexer is enough
+                env["DRIVE_INDEXER_ENABLED"] = "false"
+            self.workers.append(Service("MCP worker {} (port {})".format(i, port), [sys.executable, "gemini_mcp.py"],
+                                        env, "http://127.0.0.1:{}/ready".format(port)))
+        ui_env = os.environ.copy()
+        # Lets only this supervisor tell the UI to stop accepting jobs
+        self.drain_token = ui_env["UI_DRAIN_TOKEN"] = secrets.token_hex(16)
+        self.ui = Service("UI app", [sys.executable, "ui_app.py"], ui_env,
+                          "http://127.0.0.1:{}/".format(os.environ.get('PORT', 8080)))
+        self.index = None
+        if SHARED_INDEX:
+            chroma = shutil.which("chroma")
+            if chroma is None:
+                print("ERROR: {} MCP workers need the chroma CLI (pip install chromadb) to share the vector index.".format(MCP_WORKERS))
+                print("Set MCP_WORKERS=1, or DRIVE_INDEX_URL to an existing chroma server.")
+                sys.exit(1)
+            self.index = Service("Vector index (port {})".format(INDEX_PORT),
+                                 [chroma, "run", "--path", INDEX_PATH,
+                                  "--host", "127.0.0.1", "--port", str(INDEX_PORT)],
+                                 os.environ.copy(), "http://127.0.0.1:{}/api/v2/heartbeat".format(INDEX_PORT))
+
+    def services(self):
+        return ([self.index] if self.index else []) + self.workers + [self.ui]
+
+    def request_stop(self, signum, frame):
+        if not self.stopping:
+            print("\n\nReceived shutdown signal...")
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+        print("="*60)
+        print("Starting Orchestration Agent Multi-Service Deployment")
         print("="*60)
-        print("Exit code:", mcp_process.returncode)
-        print("\nPossible causes:")
-        print("- Missing dependencies (check requirements.txt installed)")
-        print("- Port 8000 already in use")
-        print("- Missing environment variables (GEMINI_API_KEY)")
-        print("\nCheck logs above for more details.")
-        sys.exit(1)
-    
-    print("[1/2] ✓ MCP server started successfully (PID: {})".format(mcp_process.pid))
-    print("\n[2/2] Starting UI app...")
-    
-    # Start UI app (this blocks)
-    try:
-        ui_process = subprocess.Popen(
-            [sys.executable, "ui_app.py"],
-            stdout=None,
-            stderr=None
-        )
-        print("[2/2] ✓ UI app started (PID: {})".format(ui_process.pid))
+
+        print("\n[1/2] Starting {} MCP worker(s) on ports {}...".format(
+            len(self.workers), ", ".join(str(port) for port in WORKER_PORTS)))
+        launch_started = time.monotonic()
+        if self.index:
+            # Workers only reach the index on first use, so it starts alongside them
+            self.index.start()
+        for worker in self.workers:
+            worker.start()
+
+        failed = []
+        for worker in self.workers:
+            ready, probes, error = wait_until_ready(worker.ready_url, worker.process, stop=lambda: self.stopping)
+            if ready:
+                print("[1/2] ✓ {} ready in {:.2f}s after {} probes (PID: {})".format(
+                    worker.name, time.monotonic() - worker.launched, probes, worker.process.pid))
+            else:
+                failed.append(worker)
+                print("[1/2] ✗ {} not ready: {}".format(worker.name, error))
+        mcp_startup = time.monotonic() - launch_started
+        if self.index:
+            ready, probes, error = wait_until_ready(self.index.ready_url, self.index.process, stop=lambda: self.stopping)
+            if ready:
+                print("[1/2] ✓ {} ready (PID: {})".format(self.index.name, self.index.process.pid))
+            else:
+                print("[1/2] ✗ {} not ready: {} (semantic search unavailable until it is)".format(self.index.name, error))
+
+        if self.stopping or len(failed) == len(self.workers):
+            if not self.stopping:
+                print("\n" + "="*60)
+                print("ERROR: MCP server failed to start!")
+                print("="*60)
+                print("\nPossible causes:")
+                print("- Missing dependencies (check requirements.txt installed)")
+                print("- Ports {} already in use".format(", ".join(str(port) for port in WORKER_PORTS)))
+                print("- Missing environment variables (GEMINI_API_KEY)")
+                print("\nCheck logs above for more details.")
+            self.shutdown()
+            sys.exit(0 if self.stopping else 1)
+
+        print("\n[2/2] Starting UI app...")
+        self.ui.start()
+        ready, probes, error = wait_until_ready(self.ui.ready_url, self.ui.process, stop=lambda: self.stopping)
+        now = time.monotonic()
+        if ready:
+            print("[2/2] ✓ UI app ready in {:.2f}s (PID: {})".format(now - self.ui.launched, self.ui.process.pid))
+            print("Startup: MCP {:.2f}s + UI {:.2f}s = {:.2f}s total".format(
+                mcp_startup, now - self.ui.launched, now - launch_started))
+        else:
+            print("[2/2] UI app not answering yet: {} (PID: {})".format(error, self.ui.process.pid))
+
         print("\n" + "="*60)
-        print("Both services running!")
-        print("MCP Server: http://localhost:8000")
+        print("All services running!")
+        print("MCP Workers: {}".format(os.environ["MCP_URLS"]))
         print("UI App: http://0.0.0.0:{}".format(os.environ.get('PORT', 8080)))
         print("="*60)
-        print("\nPress Ctrl+C to stop both services.")
-        
-        # Wait for UI app to finish
-        ui_process.wait()
-        
-    except KeyboardInterrupt:
-        print("\n\nReceived shutdown signal...")
-    except Exception as e:
-        print("\n\nError running UI app:", e)
-    # finally:
-    #     # Cleanup: terminate MCP server
-    #     print("\nShutting down services...")
-    #     print("- Terminating MCP server...")
-    #     mcp_process.terminate()
-    #     try:
-    #         mcp_process.wait(timeout=5)
-    #         print("- MCP server stopped")
-    #     except:
-    #         print("- Force killing MCP server...")
-    #         mcp_process.kill()
-    #         mcp_process.wait()
-    #     print("\n✓ All services stopped.\n")
+        print("\nPress Ctrl+C to stop all services.")
+
+        # Supervise: restart anything that exits until asked to stop
+        while not self.stopping:
+            now = time.monotonic()
+            for service in self.services():
+                service.check(now)
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """Stop the UI taking jobs, let accepted work finish, then stop the workers, the UI and the index."""
+        print("\nShutting down services...")
+        self.drain(time.monotonic() + SHUTDOWN_GRACE)
+        self.stop_services(self.workers)
+        self.stop_services([self.ui])
+        if self.index:
+            self.stop_services([self.index])
+        print("\n✓ All services stopped.\n")
+
+    def ui_active_jobs(self):
+        """Close the UI's job queue; returns its unfinished jobs, or None if it cannot be asked."""
+        request = urllib.request.Request(self.ui.ready_url + "drain", data=b"", method="POST",
+                                         headers={"X-Drain-Token": self.drain_token})
+        try:
+            with urllib.request.urlopen(request, timeout=1) as response:
+                return json.load(response).get("active")
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def drain(self, deadline):
+        """Wait until the UI has no queued or running jobs and no worker has requests in flight."""
+        delay = PROBE_INITIAL_DELAY
+        reported = False
+        while True:
+            busy = []
+            if self.ui.running():
+                active = self.ui_active_jobs()
+                if active:
+                    busy.append("{}: {} job(s)".format(self.ui.name, active))
+            for worker in self.workers:
+                in_flight = worker.in_flight() if worker.running() else None
+                if in_flight:
+                    busy.append("{}: {} in-flight request(s)".format(worker.name, in_flight))
+            if not busy:
+                return
+            if time.monotonic() >= deadline:
+                print("- Grace period over, stopping with work unfinished ({})".format("; ".join(busy)))
+                return
+            if not reported:
+                print("- Draining " + "; ".join(busy))
+                reported = True
+            time.sleep(min(delay, max(0, deadline - time.monotonic())))
+            delay = min(delay * 2, PROBE_MAX_DELAY)
+
+    def stop_services(self, services):
+        """SIGTERM the services, wait up to SHUTDOWN_GRACE for them to exit, then kill stragglers."""
+        for service in services:
+            service.terminate()
+        deadline = time.monotonic() + SHUTDOWN_GRACE
+        for service in services:
+            if service.process is None:
+                continue
+            try:
+                service.process.wait(timeout=max(0, deadline - time.monotonic()))
+                print("- {} stopped".format(service.name))
+            except subprocess.TimeoutExpired:
+                print("- Force killing {}...".format(service.name))
+                service.process.kill()
+                service.process.wait()
+
+
+def start_services():
+    Supervisor().run()
 
 if __name__ == "__main__":
     start_services()
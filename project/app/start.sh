@@ -1,14 +1,40 @@
 #!/bin/bash
 
+# Seconds to wait for the MCP server before giving up
+STARTUP_TIMEOUT=${STARTUP_TIMEOUT:-60}
+MCP_READY_URL=${MCP_READY_URL:-http://127.0.0.1:8000/ready}
+
+# Portable milliseconds (BSD/macOS date has no %N)
+now_ms() { python -c 'import time; print(int(time.time() * 1000))'; }
+
 # 1. Start MCP Server in the background
 # We explicitly set PORT=8000 and HOST=0.0.0.0 for this process only
 # The '&' puts it in the background
 echo "Starting MCP Server on port 8000..."
+started=$(now_ms)
 PORT=8000 HOST=0.0.0.0 python gemini_mcp.py &
+mcp_pid=$!
 
-# 2. Wait for it to initialize
-echo "Waiting 5 seconds for MCP to start..."
-sleep 5
+# 2. Poll the readiness endpoint, backing off from 50 ms up to 1 s between probes
+echo "Waiting for MCP readiness ($MCP_READY_URL)..."
+delay=0.05
+probes=0
+until curl -fsS -o /dev/null "$MCP_READY_URL" 2>/dev/null; do
+    probes=$((probes + 1))
+    if ! kill -0 "$mcp_pid" 2>/dev/null; then
+        echo "ERROR: MCP server exited before becoming ready"
+        exit 1
+    fi
+    if [ $(( $(now_ms) - started )) -ge $((STARTUP_TIMEOUT * 1000)) ]; then
+        echo "ERROR: MCP server not ready after ${STARTUP_TIMEOUT}s"
+        kill "$mcp_pid"
+        exit 1
+    fi
+    sleep "$delay"
+    delay=$(awk -v d="$delay" 'BEGIN { d *= 2; print (d > 1 ? 1 : d) }')
+done
+elapsed=$(( $(now_ms) - started ))
+echo "MCP server ready in $((elapsed / 1000)).$(printf '%03d' $((elapsed % 1000)))s after $((probes + 1)) probes"
 
 # 3. Start UI App in the foreground
 # This will use the Render-provided PORT automatically
@@ -0,0 +1,124 @@
+"""
+Persistent LRU cache for extracted document text.
+Entries are keyed by (file_id, version) so a changed Drive file never serves stale text.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.getenv("DRIVE_TEXT_CACHE_PATH", os.path.join(SCRIPT_DIR, "cache", "document_text.sqlite3"))
+# Total size of cached text kept on disk (default 200 MB)
+CACHE_MAX_BYTES = int(os.getenv("DRIVE_TEXT_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+
+class TextCache:
+    """
+    Size-bounded text cache backed by SQLite.
+    Thread-safe; least recently used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database file
+            max_bytes: Upper bound on the total size of cached text
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                file_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (file_id, version)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS documents_lru ON documents (last_access)")
+        self.conn.commit()
+
+    def get(self, file_id: str, version: str) -> Optional[str]:
+        """Return cached text for this file version, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content FROM documents WHERE file_id = ? AND version = ?",
+                (file_id, version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE documents SET last_access = ? WHERE file_id = ? AND version = ?",
+                (time.time(), file_id, version)
+            )
+            self.conn.commit()
+            return row[0]
+
+    def put(self, file_id: str, version: str, content: str):
+        """Store text for a file version, replacing older versions of the same file."""
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM documents WHERE file_id = ?", (file_id,))
+            self.conn.execute(
+                "INSERT INTO documents (file_id, version, content, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (file_id, version, content, size, time.time())
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes. Caller holds the lock."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT file_id, version, size FROM documents ORDER BY last_access").fetchall()
+        for file_id, version, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM documents WHERE file_id = ? AND version = ?", (file_id, version))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and current cache usage."""
+        with self.lock:
+            entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes
+            }
+
+
+_cache: Optional[TextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> TextCache:
+    """Get or create the shared document text cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TextCache()
+        return _cache
@@ -1,22 +1,89 @@
-from nicegui import ui
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from nicegui import app, background_tasks, ui
 from orchestration_agent import handle_request  # Import from your orchestrator file
 import os
-import fitz  # PyMuPDF for PDF text extraction (kept but not used in UI; can be removed if not needed here)
-import io  # For handling file streams (kept for potential future use, but not needed here)
-from logging_utils import new_session, get_logger  # Import logging utilities
-
-# Ensure uploads directory exists
-os.makedirs('uploads', exist_ok=True)
+from ui_state import ClientUploads, submit_request
+from upload_store import gc_loop, get_upload_store, iter_upload
+from job_queue import Job, JobQueueClosed, JobQueueFull, ProgressEvent, PRIORITY_BATCH, PRIORITY_INTERACTIVE, get_job_queue
 
 # Ensure logs directory exists
 LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# Global list to store uploaded file paths (strings)
-uploaded_files = []
+# Submissions with more attachments than this queue behind interactive requests
+JOB_BATCH_FILES = int(os.getenv('JOB_BATCH_FILES', 3))
+# Seconds queued and running jobs get to finish when the process is stopped
+SHUTDOWN_GRACE = float(os.getenv('SHUTDOWN_GRACE', 30))
+# Shared secret start.py sends to /drain; the endpoint is disabled without it
+DRAIN_TOKEN = os.getenv('UI_DRAIN_TOKEN')
+
+
+def show_job(job: Job):
+    """Render a job's progress and result, updating live over the websocket while it runs."""
+    with ui.card().classes('w-full'):
+        with ui.row().classes('items-center'):
+            ui.label(f'Job {job.id}').classes('text-h6')
+            ui.link('(reopen later)', f'/job/{job.id}', new_tab=True)
+            cancel_button = ui.button('Cancel', on_click=lambda: get_job_queue().cancel(job)).props('flat color=negative')
+        status = ui.label()
+        steps = ui.column().classes('gap-0')
+        # Answer rendered incrementally while the model streams it
+        preview = ui.markdown(job.partial).classes('w-full')
+        output = ui.column().classes('w-full')
+        spinner = ui.spinner(size='lg')
+
+    def render_event(event: ProgressEvent):
+        if event.stage == 'text':
+            preview.set_content(job.partial)
+            return
+        status.text = f'Status: {job.status} ({event.stage})'
+        with steps:
+            ui.label(f'{event.stage}: {event.detail}' if event.detail else event.stage).classes('text-caption')
+
+    def render_result():
+        spinner.set_visibility(False)
+        preview.set_visibility(False)
+        cancel_button.set_visibility(False)
+        with output:
+            result = job.result
+            if job.status == 'cancelled':
+                ui.label(f'Cancelled: {job.error}').classes('text-negative')
+            elif job.status == 'done' and result.ok:
+                ui.label('Output:').classes('text-h6')
+                ui.markdown(result.output)
+            else:
+                ui.label(result.output if result is not None else f'Error: {job.error}').classes('text-negative')
+
+    for event in job.events:
+        render_event(event)
+    if job.done:
+        render_result()
+        return
+
+    def on_event(job: Job, event: ProgressEvent):
+        render_event(event)
+        if job.done:
+            render_result()
+            unsubscribe()
+
+    def on_disconnect():
+        unsubscribe()
+        # Reconnecting at /job/<id> within the grace period keeps the job alive; otherwise
+        # it is cancelled so nobody pays for a result that will never be seen
+        get_job_queue().release(job)
+
+    unsubscribe = job.subscribe(on_event)
+    ui.context.client.on_disconnect(on_disconnect)
 
 @ui.page('/')
 async def main_page():
+    # Page functions run once per browser client, so these uploads belong to this client only
+    uploads = ClientUploads()
+    client_id = ui.context.client.id
+    # Pending uploads stay protected from garbage collection while the client is connected
+    ui.context.client.on_disconnect(lambda: get_upload_store().release(client_id))
+
     ui.label('Orchestrator Agent UI').classes('text-h4')
     ui.label('Type instructions and optionally upload PDFs. The agent will process them.')
 
@@ -25,77 +92,76 @@ async def main_page():
 
     # PDF upload (multiple)
     async def handle_upload(event):
-        # Read as bytes and save to disk
-        content = await event.file.read()
-        file_path = os.path.join('uploads', event.file.name)
-        with open(file_path, 'wb') as f:
-            f.write(content)
-        uploaded_files.append(file_path)
-        ui.notify(f'File uploaded and saved: {event.file.name}')
+        # Stream to a content-addressed file; identical bytes are stored only once
+        stored = await get_upload_store().save_stream(iter_upload(event.file), event.file.name, owner=client_id)
+        uploads.add(stored.path)
+        if stored.duplicate:
+            ui.notify(f'File already stored, reusing it: {event.file.name}')
+        else:
+            ui.notify(f'File uploaded and saved: {event.file.name}')
 
     ui.upload(on_upload=handle_upload, multiple=True, label='Upload PDFs').props('accept=.pdf').classes('w-full')
 
     # Submit button
     async def submit():
-        if not instructions.value.strip():
+        text = instructions.value
+        if not text.strip():
             ui.notify('Please enter instructions.', color='negative')
             return
 
-        # Start new logging session for this request
-        logger = new_session(LOG_DIR)
-        
-        # Log user input
-        logger.log_user_input(
-            input_text=instructions.value,
-            uploaded_files=uploaded_files.copy()
-        )
-
-        with ui.dialog().props('persistent') as dialog:
-            with ui.card():
-                ui.spinner(size='lg')
-                ui.label('Processing...')
+        # Pass the list of file paths directly (no text extraction here)
+        files = uploads.snapshot()
+        priority = PRIORITY_BATCH if len(files) > JOB_BATCH_FILES else PRIORITY_INTERACTIVE
         try:
-            # Pass the list of file paths directly (no text extraction here)
-            result = await handle_request(instructions.value, uploaded_files)
-            # Handle lists: Convert to string
-            if isinstance(result, list):
-                result = '\n'.join(str(item) for item in result)  # Join list items with newlines
+            job = get_job_queue().submit(
+                lambda job: submit_request(text, uploads, handle_request, LOG_DIR, progress=job.report,
+                                           files=files, on_text=job.stream_text, request_id=job.id),
+                description=text[:80],
+                priority=priority
+            )
+        except JobQueueFull:
+            ui.notify('The server is busy, please try again in a moment.', color='negative')
+            return
+        except JobQueueClosed:
+            ui.notify('The server is restarting, please try again in a minute.', color='negative')
+            return
+        # The job holds its own references so its files outlive this client's session
+        get_upload_store().acquire(job.id, files)
+        job.on_finish(lambda job: get_upload_store().release(job.id))
+        with jobs_area:
+            show_job(job)
 
-            # Log the output
-            logger.log_output(result)
-            logger.log_session_end()
+    ui.button('Submit', on_click=submit).props('color=primary')
+    jobs_area = ui.column().classes('w-full')
 
-            # Clear for next use
-            uploaded_files.clear()
 
-            # Display output
-            try:
-                ui.label('Output:').classes('text-h6')
-                ui.markdown(result)
-            except RuntimeError:
-                # Client might have disconnected during long processing
-                print("Warning: Client disconnected, could not update UI.")
-                
-        except Exception as e:
-            error_msg = f'Error: {str(e)}'
-            logger.log_error(
-                error_type="ui_error",
-                error_message=str(e),
-                context="UI submit function"
-            )
-            logger.log_session_end()
-            try:
-                ui.notify(error_msg, color='negative')
-            except RuntimeError:
-                print(f"Could not notify client of error: {error_msg}")
-        finally:
-            try:
-                dialog.close()
-            except RuntimeError:
-                pass
+@ui.page('/job/{job_id}')
+async def job_page(job_id: str):
+    """Progress and result of one job, for clients reconnecting after a disconnect."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        ui.label('Job not found. Results are kept for a limited time.').classes('text-h6')
+        return
+    ui.label(job.description).classes('text-subtitle1')
+    show_job(job)
 
-    ui.button('Submit', on_click=submit).props('color=primary')
+@app.post('/drain')
+async def drain(request: Request):
+    """Stop accepting jobs before a shutdown (called by start.py); reports the jobs still unfinished."""
+    if not DRAIN_TOKEN or request.headers.get('X-Drain-Token') != DRAIN_TOKEN:
+        return JSONResponse({'error': 'forbidden'}, status_code=403)
+    queue = get_job_queue()
+    queue.close()
+    return {'active': queue.active()}
+
+
+async def finish_jobs():
+    # Stopped without a drain first (e.g. start.sh or a platform SIGTERM): let accepted jobs finish
+    await get_job_queue().drain(SHUTDOWN_GRACE)
+
+# Expired and over-quota uploads are cleaned up in the background
+app.on_startup(lambda: background_tasks.create(gc_loop(), name='upload_gc'))
+app.on_shutdown(finish_jobs)
 
-import os
 port = int(os.environ.get('PORT', 8080))
 ui.run(title='Orchestrator UI', dark=True, port=port, host='0.0.0.0')
\ No newline at end of file
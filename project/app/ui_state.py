@@ -0,0 +1,113 @@
+"""
+Per-client UI state and request submission.
+Each browser client keeps its own upload list, and submissions run in their own logging
+session, so concurrent users never see or clear each other's files.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from logging_utils import new_session
+
+# (stage, detail) progress callback
+ProgressCallback = Callable[[str, str], None]
+# Receives chunks of the answer while it is streamed; None discards the text so far
+TextCallback = Callable[[Optional[str]], None]
+# Called with (instructions, file paths, progress callback, text callback, request id)
+RequestHandler = Callable[[str, List[str], Optional[ProgressCallback], Optional[TextCallback], Optional[str]],
+                          Awaitable[object]]
+
+
+class ClientUploads:
+    """Files uploaded by one client that have not been submitted yet."""
+
+    def __init__(self):
+        self.paths: List[str] = []
+
+    def add(self, path: str) -> bool:
+        """Add an uploaded file; returns False if it is already pending."""
+        if path in self.paths:
+            return False
+        self.paths.append(path)
+        return True
+
+    def snapshot(self) -> List[str]:
+        return list(self.paths)
+
+    def discard(self, paths: List[str]):
+        """Remove submitted files, keeping any uploaded while the request was running."""
+        self.paths = [path for path in self.paths if path not in paths]
+
+
+@dataclass
+class SubmitResult:
+    ok: bool
+    output: str
+
+
+def format_result(result) -> str:
+    """Render a handler result (string or list of parts) as text."""
+    if isinstance(result, list):
+        return '\n'.join(str(item) for item in result)
+    return str(result)
+
+
+async def submit_request(instructions: str, uploads: ClientUploads, handler: RequestHandler,
+                         log_dir: str = "logs", progress: Optional[ProgressCallback] = None,
+                         files: Optional[List[str]] = None, on_text: Optional[TextCallback] = None,
+                         request_id: Optional[str] = None) -> SubmitResult:
+    """
+    Run one request for a client in its own logging session.
+
+    Args:
+        instructions: The user's instructions
+        uploads: The submitting client's pending uploads
+        handler: Async request handler, called with (instructions, file paths, progress, on_text)
+        log_dir: Directory for the session's log files
+        progress: Optional callback receiving (stage, detail) updates
+        files: Files to send (default: the client's pending uploads at call time)
+        on_text: Optional callback receiving the answer text in chunks as it is streamed
+        request_id: Optional id passed to the handler so the request can be cancelled downstream
+
+    Returns:
+        SubmitResult with the output text, or the error message when ok is False
+    """
+    if not instructions or not instructions.strip():
+        return SubmitResult(ok=False, output='Please enter instructions.')
+
+    files = uploads.snapshot() if files is None else files
+    # Run in a copied context so this request's session logger never leaks into the caller
+    return await asyncio.create_task(
+        _run(instructions, files, uploads, handler, log_dir, progress, on_text, request_id)
+    )
+
+
+async def _run(instructions: str, files: List[str], uploads: ClientUploads, handler: RequestHandler,
+               log_dir: str, progress: Optional[ProgressCallback], on_text: Optional[TextCallback],
+               request_id: Optional[str]) -> SubmitResult:
+    logger = new_session(log_dir)
+    logger.log_user_input(input_text=instructions, uploaded_files=files)
+    try:
+        output = format_result(await handler(instructions, files, progress, on_text, request_id))
+    except asyncio.CancelledError:
+        # Files stay pending so the client can resubmit
+        logger.log_error(
+            error_type="request_cancelled",
+            error_message="Request cancelled before completion",
+            context="UI submit function"
+        )
+        logger.log_session_end()
+        raise
+    except Exception as e:
+        logger.log_error(
+            error_type="ui_error",
+            error_message=str(e),
+            context="UI submit function"
+        )
+        logger.log_session_end()
+        return SubmitResult(ok=False, output=f'Error: {str(e)}')
+
+    logger.log_output(output)
+    logger.log_session_end()
+    uploads.discard(files)
+    return SubmitResult(ok=True, output=output)
@@ -0,0 +1,294 @@
+"""
+Content-addressed store for files uploaded through the UI.
+Uploads are streamed to disk in chunks while their SHA-256 is computed, saved as
+uploads/<sha256><ext> and deduplicated by content; original file names are kept in a
+SQLite index so tools can still show them.
+
+The index also tracks which clients and jobs reference each file. Unreferenced files are
+garbage collected after UPLOAD_TTL seconds, and least recently used ones are evicted early
+when the store grows past UPLOAD_QUOTA_BYTES, all without scanning the directory.
+"""
+import os
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(SCRIPT_DIR, "uploads"))
+INDEX_PATH = os.getenv("UPLOAD_INDEX_PATH", os.path.join(SCRIPT_DIR, "cache", "uploads.sqlite3"))
+# Extensions kept on stored files (everything else is stored without one)
+KEPT_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".txt", ".csv"}
+# Seconds an unreferenced file is kept after its last use (default 1 day)
+UPLOAD_TTL = int(os.getenv("UPLOAD_TTL", 24 * 60 * 60))
+# Disk budget for stored uploads; referenced files are never evicted to meet it (default 1 GB)
+UPLOAD_QUOTA_BYTES = int(os.getenv("UPLOAD_QUOTA_BYTES", 1024 * 1024 * 1024))
+# Seconds between garbage collection passes
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", 600))
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+    name: str
+    duplicate: bool
+
+
+def _extension(name: str) -> str:
+    ext = os.path.splitext(name)[1].lower()
+    return ext if ext in KEPT_EXTENSIONS else ""
+
+
+class UploadStore:
+    """
+    Thread-safe content-addressed upload store.
+    Memory use per upload is one chunk regardless of file size.
+    """
+
+    def __init__(self, upload_dir: str = UPLOAD_DIR, index_path: str = INDEX_PATH,
+                 ttl: int = UPLOAD_TTL, quota_bytes: int = UPLOAD_QUOTA_BYTES):
+        """
+        Initialize the store.
+
+        Args:
+            upload_dir: Directory holding the stored files
+            index_path: SQLite database mapping content hashes to original names and references
+            ttl: Seconds an unreferenced file survives after its last use
+            quota_bytes: Total size above which unreferenced files are evicted, least recently used first
+        """
+        self.upload_dir = os.path.abspath(upload_dir)
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.lock = threading.Lock()
+        self.stats = {"uploads": 0, "duplicates": 0, "bytes_saved": 0,
+                      "expired": 0, "evicted": 0, "bytes_freed": 0}
+        os.makedirs(self.upload_dir, exist_ok=True)
+        if os.path.dirname(index_path):
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS uploads (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL
+            )"""
+        )
+        # Indexes from before last_used existed gain the column. The check and the change run
+        # under one write lock so processes starting together do not both add it.
+        self.conn.execute("BEGIN IMMEDIATE")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(uploads)")}
+        if "last_used" not in columns:
+            self.conn.execute("ALTER TABLE uploads ADD COLUMN last_used REAL")
+            self.conn.execute("UPDATE uploads SET last_used = created")
+        self.conn.commit()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS uploads_lru ON uploads (last_used)")
+        # One row per (file, owner); owners are client sessions and jobs using the file
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS upload_refs (
+                sha256 TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                PRIMARY KEY (sha256, owner)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS upload_refs_owner ON upload_refs (owner)")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS upload_names (
+                sha256 TEXT NOT NULL,
+                name TEXT NOT NULL,
+                uploaded_at REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS upload_names_sha ON upload_names (sha256)")
+        self.conn.commit()
+
+    async def save_stream(self, chunks: AsyncIterator[bytes], name: str, owner: Optional[str] = None) -> StoredUpload:
+        """
+        Stream an upload to disk, hashing it as it is written.
+
+        Args:
+            chunks: Async iterator over the upload's bytes
+            name: Original file name supplied by the client
+            owner: Optional reference holder (e.g. the client id), taken in the same transaction
+                that indexes the file so it cannot be collected in between
+        """
+        temp_path = os.path.join(self.upload_dir, f".incoming-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            stored = self._commit(temp_path, digest.hexdigest(), size, name, owner)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.enforce_quota()
+        return stored
+
+    def _commit(self, temp_path: str, sha256: str, size: int, name: str, owner: Optional[str] = None) -> StoredUpload:
+        """Move a fully written temp file into place unless the content is already stored."""
+        name = os.path.basename(name) or sha256
+        path = os.path.join(self.upload_dir, sha256 + _extension(name))
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT path FROM uploads WHERE sha256 = ?", (sha256,)).fetchone()
+            duplicate = row is not None and os.path.exists(row[0])
+            if duplicate:
+                path = row[0]
+                self.conn.execute("UPDATE uploads SET last_used = ? WHERE sha256 = ?", (now, sha256))
+            else:
+                os.replace(temp_path, path)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO uploads (sha256, path, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (sha256, path, size, now, now)
+                )
+            if owner:
+                self.conn.execute("INSERT OR IGNORE INTO upload_refs (sha256, owner) VALUES (?, ?)", (sha256, owner))
+            self.conn.execute(
+                "INSERT INTO upload_names (sha256, name, uploaded_at) VALUES (?, ?, ?)",
+                (sha256, name, time.time())
+            )
+            self.conn.commit()
+            self.stats["uploads"] += 1
+            if duplicate:
+                self.stats["duplicates"] += 1
+                self.stats["bytes_saved"] += size
+        return StoredUpload(path=path, sha256=sha256, size=size, name=name, duplicate=duplicate)
+
+    def original_name(self, path: str) -> Optional[str]:
+        """Most recent original file name for a stored path, or None if the path is not in the store."""
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT n.name FROM upload_names n JOIN uploads u ON u.sha256 = n.sha256
+                   WHERE u.path = ? ORDER BY n.uploaded_at DESC LIMIT 1""",
+                (os.path.abspath(path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def acquire(self, owner: str, paths: Iterable[str]):
+        """Reference stored files for an owner (a client or job); referenced files are never collected."""
+        now = time.time()
+        with self.lock:
+            for path in paths:
+                row = self.conn.execute("SELECT sha256 FROM uploads WHERE path = ?", (os.path.abspath(path),)).fetchone()
+                if row:
+                    self.conn.execute("INSERT OR IGNORE INTO upload_refs (sha256, owner) VALUES (?, ?)", (row[0], owner))
+                    self.conn.execute("UPDATE uploads SET last_used = ? WHERE sha256 = ?", (now, row[0]))
+            self.conn.commit()
+
+    def release(self, owner: str):
+        """Drop every reference held by owner; the files become collectable after the TTL."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE uploads SET last_used = ? WHERE sha256 IN (SELECT sha256 FROM upload_refs WHERE owner = ?)",
+                (now, owner)
+            )
+            self.conn.execute("DELETE FROM upload_refs WHERE owner = ?", (owner,))
+            self.conn.commit()
+
+    def collect(self, now: Optional[float] = None) -> int:
+        """
+        Delete unreferenced files unused for longer than the TTL, then enforce the quota.
+
+        Returns:
+            Number of files removed
+        """
+        now = now or time.time()
+        with self.lock:
+            expired = self.conn.execute(
+                """SELECT sha256, path, size FROM uploads
+                   WHERE last_used < ? AND sha256 NOT IN (SELECT sha256 FROM upload_refs)""",
+                (now - self.ttl,)
+            ).fetchall()
+            self._remove(expired, "expired")
+        return len(expired) + self.enforce_quota()
+
+    def enforce_quota(self) -> int:
+        """Evict unreferenced files, least recently used first, until the store fits its quota."""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM uploads").fetchone()[0]
+            if total <= self.quota_bytes:
+                return 0
+            victims = []
+            for row in self.conn.execute(
+                """SELECT sha256, path, size FROM uploads
+                   WHERE sha256 NOT IN (SELECT sha256 FROM upload_refs) ORDER BY last_used"""
+            ):
+                if total <= self.quota_bytes:
+                    break
+                victims.append(row)
+                total -= row[2]
+            self._remove(victims, "evicted")
+            return len(victims)
+
+    def _remove(self, rows: List[tuple], reason: str):
+        """Delete files and their index rows. Caller holds the lock."""
+        for sha256, path, size in rows:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.conn.execute("DELETE FROM uploads WHERE sha256 = ?", (sha256,))
+            self.conn.execute("DELETE FROM upload_names WHERE sha256 = ?", (sha256,))
+            self.stats[reason] += 1
+            self.stats["bytes_freed"] += size
+        self.conn.commit()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            stored, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM uploads").fetchone()
+            referenced = self.conn.execute("SELECT COUNT(DISTINCT sha256) FROM upload_refs").fetchone()[0]
+            return dict(self.stats, stored_files=stored, stored_bytes=total, referenced_files=referenced)
+
+
+async def iter_upload(file, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """
+    Yield a NiceGUI upload's content in chunks.
+    Uses the upload's own iterate() when available and falls back to a single read().
+    """
+    iterate = getattr(file, "iterate", None)
+    if iterate is not None:
+        async for chunk in iterate():
+            yield chunk
+        return
+    content = await file.read()
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+async def gc_loop(store: "UploadStore" = None, interval: int = UPLOAD_GC_INTERVAL):
+    """Run garbage collection on the store every interval seconds; meant as a background task."""
+    store = store or get_upload_store()
+    while True:
+        await asyncio.to_thread(store.collect)
+        await asyncio.sleep(interval)
+
+
+_store: Optional[UploadStore] = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store() -> UploadStore:
+    """Get or create the shared upload store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UploadStore()
+        return _store
+
+
+def original_name(path: str) -> Optional[str]:
+    """Original name of an uploaded file, or None for paths outside the upload store."""
+    if not os.path.abspath(path).startswith(os.path.abspath(UPLOAD_DIR) + os.sep):
+        return None
+    return get_upload_store().original_name(path)
@@ -0,0 +1,148 @@
+"""
+Persistent cache of reimbursement verdicts.
+Entries are keyed by the SHA-256 of the receipt PDF bytes plus a hash of the policy text
+and rules version, so re-submitted receipts are answered without any LLM call until the
+policy or the deterministic rules change.
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.getenv("EXPENSE_VERDICT_CACHE_PATH", os.path.join(SCRIPT_DIR, "cache", "verdicts.sqlite3"))
+# Approvals without a receipt date cannot be tied to the date cutoff, so they are kept briefly
+UNDATED_APPROVAL_TTL = 24 * 60 * 60
+# Denials are re-evaluated after this long, so a wrong denial does not stick for good
+DENIAL_TTL = int(os.getenv("EXPENSE_DENIAL_TTL", 7 * 24 * 60 * 60))
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file's bytes without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    SQLite-backed verdict cache. Thread-safe.
+    APPROVED entries expire once the receipt would fall outside the policy's date window,
+    DENIED entries after DENIAL_TTL.
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS verdicts (
+                receipt_hash TEXT NOT NULL,
+                policy_hash TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                receipt_date TEXT,
+                created REAL NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (receipt_hash, policy_hash)
+            )"""
+        )
+        self.conn.commit()
+
+    def get(self, receipt_hash: str, policy_hash: str) -> Optional[Tuple[str, str]]:
+        """Return (verdict, reason) for this receipt under this policy, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT verdict, reason, expires_at FROM verdicts WHERE receipt_hash = ? AND policy_hash = ?",
+                (receipt_hash, policy_hash)
+            ).fetchone()
+            if row is not None and row[2] is not None and row[2] <= time.time():
+                self.conn.execute(
+                    "DELETE FROM verdicts WHERE receipt_hash = ? AND policy_hash = ?",
+                    (receipt_hash, policy_hash)
+                )
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0], row[1]
+
+    def put(self, receipt_hash: str, policy_hash: str, verdict: str, reason: str,
+            receipt_date: Optional[datetime], max_age_days: int):
+        """
+        Store a verdict.
+
+        Args:
+            receipt_hash: SHA-256 of the receipt PDF
+            policy_hash: Hash of the policy and rules version the verdict was reached under
+            verdict: 'APPROVED' or 'DENIED'
+            reason: Violated rule or explanation
+            receipt_date: Transaction date, used to expire approvals at the date cutoff
+            max_age_days: Policy's submission window in days
+        """
+        if verdict != "APPROVED":
+            expires_at = time.time() + DENIAL_TTL
+        elif receipt_date:
+            # The first day on which days_since_receipt exceeds the window
+            expires_at = (receipt_date + timedelta(days=max_age_days + 1)).timestamp()
+        else:
+            expires_at = time.time() + UNDATED_APPROVAL_TTL
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (receipt_hash, policy_hash, verdict, reason,
+                 receipt_date.strftime("%Y-%m-%d") if receipt_date else None, time.time(), expires_at)
+            )
+            self.conn.commit()
+
+    def purge_other_policies(self, policy_hash: str) -> int:
+        """Delete verdicts reached under any other policy version."""
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM verdicts WHERE policy_hash != ?", (policy_hash,))
+            self.conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries
+            }
+
+
+_cache: Optional[VerdictCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> VerdictCache:
+    """Get or create the shared verdict cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerdictCache()
+        return _cache
@@ -0,0 +1,82 @@
+"""
+Benchmark PDF text extraction on the PDFs in app/uploads/.
+Compares the old pypdf `+=` loop and the old PyMuPDF `+=` loop with the shared pdf_text engine.
+
+Usage: python scripts/bench_pdf_text.py [repeats]
+"""
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import fitz
+import pdf_text
+
+UPLOADS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app', 'uploads'))
+
+
+def pypdf_concat(path):
+    """Previous drive_agent.read_document implementation."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    content = ""
+    for page in reader.pages:
+        content += page.extract_text() + "\n"
+    return content.strip()
+
+
+def fitz_concat(path):
+    """Previous expense_agent.read_pdf_text implementation."""
+    doc = fitz.open(path)
+    text = ""
+    for page in doc:
+        text += page.get_text()
+    doc.close()
+    return text
+
+
+def best_of(fn, path, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    paths = sorted(glob.glob(os.path.join(UPLOADS_DIR, '*.pdf')))
+    if not paths:
+        print(f"No PDFs found in {UPLOADS_DIR}")
+        return
+
+    candidates = [
+        ("pdf_text serial", lambda p: pdf_text.extract_text(p, parallel=False)),
+        ("pdf_text parallel", pdf_text.extract_text),
+        ("pdf_text 2k budget", lambda p: pdf_text.extract_text(p, max_chars=2000)),
+        ("fitz +=", fitz_concat),
+    ]
+    try:
+        import pypdf  # noqa: F401
+        candidates.append(("pypdf +=", pypdf_concat))
+    except ImportError:
+        print("pypdf not installed; skipping the pypdf baseline\n")
+
+    # Warm the process pool so its startup is not charged to the first file
+    pdf_text._get_pool().submit(int).result()
+
+    header = f"{'file':<48} {'pages':>5} " + " ".join(f"{name:>18}" for name, _ in candidates)
+    print(header)
+    print("-" * len(header))
+    for path in paths:
+        pages = pdf_text.page_count(path)
+        row = f"{os.path.basename(path)[:48]:<48} {pages:>5} "
+        row += " ".join(f"{best_of(fn, path, repeats) * 1000:>15.2f} ms" for _, fn in candidates)
+        print(row)
+    print(f"\nBest of {repeats} runs; parallel mode applies to documents with >= {pdf_text.PARALLEL_MIN_PAGES} pages.")
+
+
+if __name__ == "__main__":
+    main()
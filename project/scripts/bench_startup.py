@@ -0,0 +1,114 @@
+"""
+Benchmark cold-start import time of each entry point with `python -X importtime`.
+Fails (exit code 1) when an entry point is slower than its threshold or imports one of the
+heavy dependencies that must only load on first use.
+
+ui_app calls ui.run() at import, so its own imports are measured instead of the module.
+
+Usage: python scripts/bench_startup.py [--repeats N] [--threshold ENTRY=MS ...] [ENTRY ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+# Entry point -> modules it imports at startup
+ENTRY_POINTS = {
+    "gemini_mcp": ["gemini_mcp"],
+    "orchestration_agent": ["orchestration_agent"],
+    "ui_app": ["nicegui", "orchestration_agent", "ui_state", "upload_store", "job_queue"],
+}
+
+# Best-of-N cumulative import time allowed per entry point, in milliseconds
+THRESHOLDS_MS = {
+    "gemini_mcp": 1500,
+    "orchestration_agent": 1000,
+    "ui_app": 2500,
+}
+
+# Must not be imported at startup by any entry point
+LAZY_MODULES = ("google.generativeai", "googleapiclient", "google_auth_oauthlib", "fitz", "pypdf",
+                "chromadb", "sentence_transformers", "resend", "gmail_agent")
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output.
+
+    Returns:
+        (total_us, {module: cumulative_us}) where total_us sums the top-level imports
+    """
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        modules[module] = int(cumulative)
+        # Nested imports are indented under the module that triggered them
+        if name[1:] == name.lstrip():
+            total += int(cumulative)
+    return total, modules
+
+
+def measure(modules, repeats):
+    """Import modules in fresh interpreters; return the fastest run's (total_us, modules) or raise."""
+    code = "; ".join(f"import {module}" for module in modules)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [APP_DIR, os.environ.get("PYTHONPATH")])))
+    best = None
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=APP_DIR, env=env,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        run = parse_importtime(result.stderr)
+        if best is None or run[0] < best[0]:
+            best = run
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("entries", nargs="*", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threshold", action="append", default=[], metavar="ENTRY=MS",
+                        help="Override an entry point's threshold")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list per entry point")
+    args = parser.parse_args()
+
+    thresholds = dict(THRESHOLDS_MS)
+    for override in args.threshold:
+        name, _, value = override.partition("=")
+        thresholds[name] = float(value)
+
+    failures = []
+    for entry in args.entries:
+        try:
+            total, modules = measure(ENTRY_POINTS[entry], args.repeats)
+        except RuntimeError as e:
+            print(f"{entry}: import failed: {e}\n")
+            failures.append(entry)
+            continue
+        eager = [module for module in modules if module.split(".")[0] in LAZY_MODULES or module in LAZY_MODULES]
+        limit = thresholds[entry]
+        status = "ok" if total / 1000 <= limit and not eager else "REGRESSION"
+        print(f"{entry}: {total / 1000:.1f} ms (threshold {limit:.0f} ms, {len(modules)} modules) {status}")
+        for module, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {cumulative / 1000:>9.1f} ms  {module}")
+        if eager:
+            print(f"  imported eagerly: {', '.join(sorted(eager))}")
+        print()
+        if status != "ok":
+            failures.append(entry)
+
+    print(f"Best of {args.repeats} runs per entry point.")
+    if failures:
+        print(f"Startup regression in: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+The agent_action tool loop against a scripted stand-in for the Gemini chat, checking that
+function-call arguments reach the tools and the session log as plain Python values.
+"""
+import asyncio
+import json
+import os
+import sys
+from collections.abc import Mapping, Sequence
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("mcp.server.fastmcp")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import expense_agent
+import gemini_mcp
+from logging_utils import SessionLogger
+
+
+class ProtoMap(Mapping):
+    """Behaves like the proto-plus MapComposite Gemini uses for function-call args."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ProtoList(Sequence):
+    """Behaves like the proto-plus RepeatedComposite used for list arguments."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class FakeResponse:
+    """A streamed response made of a single chunk."""
+
+    def __init__(self, text=None, function_call=None):
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(
+            parts=[SimpleNamespace(text=text, function_call=function_call)]))]
+
+    def __iter__(self):
+        yield self
+
+    @property
+    def text(self):
+        part = self.candidates[0].content.parts[0]
+        if part.function_call:
+            raise ValueError("response has a function call")
+        return part.text
+
+
+class FakeChat:
+    def __init__(self, responses):
+        self.responses = iter(responses)
+        self.sent = []
+
+    def send_message(self, message, stream=False):
+        self.sent.append(message)
+        return next(self.responses)
+
+
+def install_chat(monkeypatch, responses, chat_class=FakeChat):
+    chat = chat_class(responses)
+    model = SimpleNamespace(start_chat=lambda **kwargs: chat)
+    monkeypatch.setattr(gemini_mcp, "API_KEY", "test-key")
+    monkeypatch.setattr(gemini_mcp, "get_genai", lambda: SimpleNamespace(GenerativeModel=lambda **kwargs: model))
+    return chat
+
+
+def test_plain_args_converts_nested_proto_values():
+    args = ProtoMap({"paths": ProtoList(["a.pdf", "b.pdf"]), "options": ProtoMap({"ids": ProtoList([1.0])}),
+                     "folder_id": "root"})
+    plain = gemini_mcp.plain_args(args)
+    assert plain == {"paths": ["a.pdf", "b.pdf"], "options": {"ids": [1.0]}, "folder_id": "root"}
+    assert type(plain["paths"]) is list and type(plain["options"]) is dict
+    json.dumps(plain)
+
+
+def test_batch_validation_gets_list_args_through_agent_action(monkeypatch, tmp_path):
+    receipts = ["/uploads/a.pdf", "/uploads/b.pdf"]
+    call = SimpleNamespace(name="validate_reimbursements_tool",
+                           args=ProtoMap({"receipt_paths": ProtoList(receipts)}))
+    chat = install_chat(monkeypatch, [FakeResponse(function_call=call), FakeResponse(text="Both approved.")])
+    logger = SessionLogger(log_dir=str(tmp_path), console_output=False)
+    monkeypatch.setattr(gemini_mcp, "get_logger", lambda: logger)
+    received = []
+
+    def validate_reimbursements(receipt_paths):
+        received.append(receipt_paths)
+        return "Validated 2 receipts: 2 APPROVED, 0 DENIED"
+
+    monkeypatch.setattr(expense_agent, "validate_reimbursements", validate_reimbursements)
+
+    result = asyncio.run(gemini_mcp.agent_action("Validate these receipts", ctx=None))
+
+    assert result == "Both approved."
+    assert received == [receipts] and type(received[0]) is list
+    function_response = chat.sent[1]["parts"][0]["function_response"]
+    assert function_response["response"]["result"] == "Validated 2 receipts: 2 APPROVED, 0 DENIED"
+    with open(logger.json_path, encoding="utf-8") as f:
+        entries = json.load(f)
+    assert any(entry.get("parameters") == {"receipt_paths": receipts} for entry in entries)
+
+
+def test_a_cancelled_request_is_counted_once(monkeypatch):
+    class CancellingChat(FakeChat):
+        def send_message(self, message, stream=False):
+            # The orchestrator's cancel_request arrives while the model is generating
+            assert gemini_mcp.cancel_request("req-1") == "Cancellation requested for req-1."
+            return super().send_message(message, stream)
+
+    install_chat(monkeypatch, [FakeResponse(text="never delivered")], CancellingChat)
+    before = gemini_mcp.cancellation.stats.snapshot()["requests_cancelled"]
+
+    result = asyncio.run(gemini_mcp.agent_action("List my files", request_id="req-1", ctx=None))
+
+    assert result == "Request cancelled."
+    assert gemini_mcp.cancellation.stats.snapshot()["requests_cancelled"] - before == 1
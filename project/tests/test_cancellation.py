@@ -0,0 +1,37 @@
+"""
+Request cancel tokens and their propagation into tool worker threads.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import cancellation
+
+
+def test_cancel_token_reaches_worker_threads():
+    async def scenario():
+        with cancellation.request_scope("req-1"):
+            checked = []
+
+            def tool():
+                for _ in range(100):
+                    try:
+                        cancellation.checkpoint()
+                    except cancellation.RequestCancelled:
+                        checked.append("stopped")
+                        return
+                    time.sleep(0.01)
+
+            work = asyncio.create_task(asyncio.to_thread(tool))
+            await asyncio.sleep(0.03)
+            assert cancellation.cancel("req-1")
+            await work
+            return checked
+
+    before = cancellation.stats.snapshot()["requests_cancelled"]
+    assert asyncio.run(scenario()) == ["stopped"]
+    # The request counts its own cancellation when it observes it; cancel() alone does not
+    assert cancellation.stats.snapshot()["requests_cancelled"] == before
+    assert not cancellation.cancel("req-1")
@@ -0,0 +1,38 @@
+"""
+BM25 ranking behind read_document's locate argument.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from doc_search import BM25, tokenize
+
+PAGES = [
+    "Table of contents. Introduction, travel, meals, equipment.",
+    "Travel policy: flights must be booked in economy class. Hotel stays are capped per night.",
+    "Meals are reimbursed up to a daily limit. Alcohol is never reimbursed with meals.",
+    "Equipment such as laptops and monitors is ordered through IT, not reimbursed.",
+]
+
+
+def test_tokenize_lowercases_and_drops_punctuation():
+    assert tokenize("Hotel stays, 2025!") == ["hotel", "stays", "2025"]
+
+
+def test_locate_ranks_the_matching_page_first():
+    index = BM25(PAGES)
+    assert index.top("hotel economy flights", 3)[0][0] == 1
+    assert index.top("alcohol with meals", 3)[0][0] == 2
+
+
+def test_rarer_terms_outweigh_common_ones():
+    index = BM25(PAGES)
+    # "reimbursed" appears on two pages, "laptops" on one
+    assert index.top("reimbursed laptops", 1)[0][0] == 3
+
+
+def test_top_skips_sections_without_matches():
+    index = BM25(PAGES)
+    assert index.top("spaceship", 3) == []
+    assert [page for page, _ in index.top("meals", 5)] == [2, 0]
+    assert BM25([]).top("anything") == []
@@ -0,0 +1,165 @@
+"""
+Batching and per-request caching of Drive metadata lookups, against a stand-in for the
+Drive files() API.
+"""
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import drive_metadata
+from drive_metadata import MetadataResolver
+
+
+class DriveError(Exception):
+    """Carries the HTTP status the way googleapiclient's HttpError does."""
+
+    def __init__(self, status, message=""):
+        super().__init__(message)
+        self.resp = SimpleNamespace(status=status)
+
+
+class NotFound(DriveError):
+    def __init__(self, file_id):
+        super().__init__(404, f"File not found: {file_id}")
+
+
+class FakeRequest:
+    def __init__(self, service, file_id):
+        self.service = service
+        self.file_id = file_id
+
+    def execute(self):
+        self.service.single_calls += 1
+        return self.service.lookup(self.file_id)
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append(request_id)
+
+    def execute(self):
+        self.service.batches.append(list(self.requests))
+        for file_id in self.requests:
+            try:
+                self.callback(file_id, self.service.lookup(file_id), None)
+            except Exception as e:
+                self.callback(file_id, None, e)
+
+
+class FakeDrive:
+    """files().get and new_batch_http_request, answering from a dict of known files."""
+
+    def __init__(self, files, failures=None):
+        self.known = files
+        self.failures = failures or {}
+        self.single_calls = 0
+        self.batches = []
+
+    def lookup(self, file_id):
+        if self.failures.get(file_id):
+            raise self.failures[file_id].pop(0)
+        if file_id not in self.known:
+            raise NotFound(file_id)
+        return {"id": file_id, "name": self.known[file_id]}
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields):
+        assert fields == drive_metadata.METADATA_FIELDS
+        return FakeRequest(self, fileId)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+
+def test_concurrent_lookups_share_one_batch():
+    drive = FakeDrive({f"f{i}": f"file {i}.pdf" for i in range(5)})
+    resolver = MetadataResolver(window=0.1)
+    results = {}
+    barrier = threading.Barrier(5)
+
+    def lookup(file_id):
+        barrier.wait()
+        results[file_id] = resolver.get(file_id, lambda: drive)["name"]
+
+    threads = [threading.Thread(target=lookup, args=(f"f{i}",)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {f"f{i}": f"file {i}.pdf" for i in range(5)}
+    assert len(drive.batches) == 1 and sorted(drive.batches[0]) == [f"f{i}" for i in range(5)]
+    assert resolver.stats["round_trips"] == 1 and resolver.stats["files_fetched"] == 5
+
+
+def test_results_and_errors_are_cached_for_the_request():
+    drive = FakeDrive({"a": "a.pdf"})
+    resolver = MetadataResolver(window=0)
+    resolver.prefetch(["a", "missing", "a"], lambda: drive)
+    assert drive.batches == [["a", "missing"]]
+
+    assert resolver.get("a", lambda: drive) == {"id": "a", "name": "a.pdf"}
+    for _ in range(2):
+        with pytest.raises(NotFound):
+            resolver.get("missing", lambda: drive)
+    assert len(drive.batches) == 1 and drive.single_calls == 0
+    assert resolver.stats["cache_hits"] == 3
+
+    # Callers get copies, so editing a result does not change the cached one
+    resolver.get("a", lambda: drive)["name"] = "changed"
+    assert resolver.get("a", lambda: drive)["name"] == "a.pdf"
+
+
+def test_transient_errors_are_retried_on_the_next_lookup():
+    drive = FakeDrive({"a": "a.pdf", "b": "b.pdf", "c": "c.pdf"}, failures={
+        "a": [DriveError(503, "Backend Error")],
+        "b": [DriveError(429, "Too Many Requests")],
+        "c": [DriveError(403, "User Rate Limit Exceeded")],
+    })
+    resolver = MetadataResolver(window=0)
+    for file_id in ("a", "b", "c"):
+        with pytest.raises(DriveError):
+            resolver.get(file_id, lambda: drive)
+        assert resolver.get(file_id, lambda: drive)["name"] == f"{file_id}.pdf"
+    assert drive.single_calls == 6
+    assert resolver.stats["cache_hits"] == 0
+
+
+def test_permission_denied_is_cached():
+    drive = FakeDrive({"a": "a.pdf"}, failures={"a": [DriveError(403, "The user does not have sufficient permissions")]})
+    resolver = MetadataResolver(window=0)
+    for _ in range(2):
+        with pytest.raises(DriveError):
+            resolver.get("a", lambda: drive)
+    assert drive.single_calls == 1
+
+
+def test_single_lookups_skip_the_batch_envelope():
+    drive = FakeDrive({"a": "a.pdf"})
+    assert MetadataResolver(window=0).get("a", lambda: drive)["name"] == "a.pdf"
+    assert drive.single_calls == 1 and drive.batches == []
+
+
+def test_missing_credentials_fail_every_waiting_lookup():
+    resolver = MetadataResolver(window=0)
+    resolver.prefetch(["a", "b"], lambda: None)
+    for file_id in ("a", "b"):
+        with pytest.raises(RuntimeError, match="authentication required"):
+            resolver.get(file_id, lambda: None)
+
+
+def test_scope_shares_one_resolver_per_request():
+    with drive_metadata.metadata_scope() as resolver:
+        assert drive_metadata.get_resolver() is resolver
+    assert drive_metadata.get_resolver() is not resolver
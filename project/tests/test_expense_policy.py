@@ -0,0 +1,140 @@
+"""
+Policy compilation (compact prompt form and structured rules) and the Gemini policy context
+cache, against a stand-in for the caching API.
+"""
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import expense_policy
+from expense_policy import PolicyContextCache, PolicySnapshot, compact_policy
+from expense_rules import compile_policy
+
+POLICY = """\ufeffEligible Expenses:
+
+- Office supplies needed for job duties:
+    * Paper
+    * Pens
+- Approved training through:
+    * Udemy
+
+Requirements:
+- Requests must be submitted within 45 days of the expense date.
+- Items worth more than $250 dollars cannot be reimbursed
+
+Non-Reimbursable Items:
+- Personal purchases including but not limited to video games, beer or any alcoholic beverages, or cars.
+"""
+
+
+def test_compact_policy_folds_sub_items_and_drops_blank_lines():
+    assert compact_policy(POLICY).splitlines() == [
+        "Eligible Expenses:",
+        "- Office supplies needed for job duties: Paper, Pens",
+        "- Approved training through: Udemy",
+        "Requirements:",
+        "- Requests must be submitted within 45 days of the expense date.",
+        "- Items worth more than $250 dollars cannot be reimbursed",
+        "Non-Reimbursable Items:",
+        "- Personal purchases including but not limited to video games, beer or any alcoholic beverages, or cars.",
+    ]
+
+
+def test_compile_policy_reads_limits_and_excluded_items():
+    rules = compile_policy(POLICY)
+    assert rules.max_age_days == 45
+    assert rules.max_amount == 250.0
+    assert rules.non_reimbursable[:4] == ["video games", "beer", "alcoholic beverages", "cars"]
+    # "alcoholic beverages" pulls in the common drink names
+    assert "wine" in rules.non_reimbursable and "alcohol" in rules.non_reimbursable
+
+
+def test_compile_policy_keeps_defaults_for_unstated_rules():
+    defaults = compile_policy("")
+    rules = compile_policy("Requirements:\n- Submit within 10 days.")
+    assert rules.max_age_days == 10
+    assert rules.max_amount == defaults.max_amount
+    assert rules.non_reimbursable == []
+
+
+class FakeCaching:
+    """CachedContent.create stand-in that counts calls and fails with queued errors."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.calls = 0
+        self.errors = list(errors)
+        self.delay = delay
+        self.CachedContent = SimpleNamespace(create=self.create)
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(name=f"cachedContents/{self.calls}", delete=lambda: None)
+
+
+@pytest.fixture
+def caching(monkeypatch):
+    def install(**kwargs):
+        fake = FakeCaching(**kwargs)
+        monkeypatch.setattr(expense_policy, "get_genai", lambda: SimpleNamespace(caching=fake))
+        return fake
+    monkeypatch.setattr(expense_policy, "get_logger", lambda: SimpleNamespace(log_error=lambda **kwargs: None))
+    return install
+
+
+def snapshot(text, version="v1"):
+    return PolicySnapshot(text=text, compact=text, rules=None, version=version, mtime=0.0, loaded_at=0.0)
+
+
+def test_small_policies_are_sent_inline_without_calling_the_api(caching):
+    fake = caching()
+    cache = PolicyContextCache(min_tokens=1024)
+    assert cache.get(snapshot("x" * 1000), "model") is None
+    assert fake.calls == 0
+    assert cache.stats()["uncacheable_versions"] == 1
+
+
+def test_concurrent_callers_create_one_context(caching):
+    fake = caching(delay=0.2)
+    cache = PolicyContextCache(min_tokens=10)
+    policy = snapshot("x" * 400)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(policy, "model"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fake.calls == 1
+    assert len(results) == 5 and all(result is results[0] is not None for result in results)
+
+
+def test_transient_failures_back_off_and_retry(caching):
+    fake = caching(errors=[ConnectionError("reset by peer")])
+    cache = PolicyContextCache(min_tokens=10)
+    policy = snapshot("x" * 400)
+    assert cache.get(policy, "model") is None
+    assert cache.get(policy, "model") is None
+    assert fake.calls == 1
+    assert cache.stats()["uncacheable_versions"] == 0
+
+    # Once the backoff has passed the next call tries again
+    cache.failures[(policy.version, "model")] = (1, 0.0)
+    assert cache.get(policy, "model") is not None
+    assert fake.calls == 2
+
+
+def test_minimum_size_rejection_marks_the_version_uncacheable(caching):
+    fake = caching(errors=[ValueError("400 Cached content is too small. total_token_count=900, min_total_token_count=1024")])
+    cache = PolicyContextCache(min_tokens=10)
+    policy = snapshot("x" * 400)
+    assert cache.get(policy, "model") is None
+    assert cache.get(policy, "model") is None
+    assert fake.calls == 1
+    assert cache.stats()["uncacheable_versions"] == 1
@@ -0,0 +1,70 @@
+"""
+Decisions of the deterministic expense pre-screen: which receipts are denied locally and
+which are left for Gemini to judge.
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import expense_rules
+from expense_rules import PolicyRules, PrescreenStats, prescreen
+
+TODAY = datetime(2025, 12, 1)
+RULES = PolicyRules(max_age_days=30, max_amount=100.0, non_reimbursable=["video games", "beer", "alcohol"])
+
+
+def test_recent_eligible_receipt_goes_to_gemini():
+    result = prescreen("Staples\nDate: 11/25/2025\n• Stapler $12.50\nTotal $12.50", RULES, TODAY)
+    assert result.verdict is None
+    assert result.days_since_receipt == 6
+    assert result.receipt.total == 12.50
+
+
+def test_old_receipt_is_denied_on_age():
+    result = prescreen("Staples\nDate purchased: 08/30/2025\n• Pens $7.99\nTotal $7.99", RULES, TODAY)
+    assert result.verdict == "DENIED"
+    assert result.violations == ["Receipt is 93 days old (limit 30 days)"]
+
+
+def test_expensive_item_and_total_are_denied():
+    result = prescreen("Office Depot\nDate: 11/28/2025\nOffice Chair\n$149.00\nTotal $149.00", RULES, TODAY)
+    assert result.verdict == "DENIED"
+    assert "'Office Chair' costs $149.00 (limit $100)" in result.violations
+    assert "Total $149.00 exceeds $100" in result.violations
+
+
+def test_non_reimbursable_item_is_denied_in_singular_or_plural():
+    result = prescreen("Corner Store\nDate: 11/28/2025\n• Beers x2: $9.00\nTotal $9.00", RULES, TODAY)
+    assert result.violations == ["'Beers x2' is non-reimbursable (beer)"]
+
+
+def test_summary_and_tender_lines_are_not_items():
+    text = ("Office Depot\nDate: 11/28/2025\n• Printer Paper $20.00\n• Stapler $15.00\n"
+            "Subtotal: $35.00\nTax: $3.00\nTotal: $38.00\nCash: $200.00\nChange: $162.00\n"
+            "VISA ****1234 $38.00\nAmount Paid\n$38.00\nBalance: $0.00")
+    result = prescreen(text, RULES, TODAY)
+    assert [(item.description, item.amount) for item in result.receipt.items] == [
+        ("Printer Paper", 20.0), ("Stapler", 15.0)]
+    assert result.receipt.total == 38.0
+    assert result.verdict is None
+
+
+def test_negatively_labelled_dates_never_deny_on_age():
+    for text in (
+        "Costco\nMember since 01/05/2019\nPaper Towels $19.99\nTotal $19.99",
+        "Best Buy\nReturn by 12/28/2025\nUSB Cable $12.99\nTotal $12.99",
+    ):
+        result = prescreen(text, RULES, TODAY)
+        assert result.receipt.date is None
+        assert result.days_since_receipt is None
+        assert result.verdict is None
+
+
+def test_stats_count_fast_path_and_llm_receipts():
+    stats = PrescreenStats()
+    stats.record(expense_rules.evaluate(expense_rules.parse_receipt("Date: 08/30/2025\nPens $7.99", TODAY), RULES, TODAY))
+    stats.record(expense_rules.evaluate(expense_rules.parse_receipt("Date: 11/30/2025\nPens $7.99", TODAY), RULES, TODAY))
+    snapshot = stats.snapshot()
+    assert snapshot["screened"] == 2 and snapshot["fast_path"] == 1 and snapshot["sent_to_llm"] == 1
+    assert snapshot["fast_path_rate"] == 0.5
@@ -0,0 +1,152 @@
+"""
+Priorities, backpressure, cancellation and shutdown draining of the UI job queue.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import mcp_progress
+from job_queue import Job, JobQueue, JobQueueClosed, JobQueueFull, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from ui_state import ClientUploads, submit_request
+
+
+def test_job_queue_bounds_work_and_prefers_interactive_jobs():
+    async def scenario():
+        queue = JobQueue(workers=2, max_queued=20)
+        running, peak, order = 0, 0, []
+
+        async def work(job):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            order.append(job.description)
+            return job.description
+
+        jobs = [queue.submit(work, f"batch {i}", PRIORITY_BATCH) for i in range(10)]
+        jobs += [queue.submit(work, f"interactive {i}", PRIORITY_INTERACTIVE) for i in range(10)]
+        try:
+            queue.submit(work, "overflow")
+            rejected = False
+        except JobQueueFull:
+            rejected = True
+        await asyncio.gather(*(wait_for(job) for job in jobs))
+        return queue, jobs, peak, order, rejected
+
+    async def wait_for(job):
+        while not job.done:
+            await asyncio.sleep(0.005)
+
+    queue, jobs, peak, order, rejected = asyncio.run(scenario())
+    assert rejected
+    assert peak == 2
+    assert all(job.status == "done" and job.result == job.description for job in jobs)
+    # Every interactive job finishes before the batch jobs still waiting behind them
+    assert max(order.index(f"interactive {i}") for i in range(10)) < order.index("batch 9")
+    assert [event.stage for event in jobs[0].events] == ["queued", "started", "done"]
+    assert queue.get(jobs[0].id) is jobs[0]
+
+
+def test_cancelled_jobs_stop_and_keep_their_uploads():
+    async def scenario(root):
+        queue = JobQueue(workers=1)
+        uploads = ClientUploads()
+        uploads.add("receipt.pdf")
+        handler_cancelled = asyncio.Event()
+
+        async def slow_orchestrator(instructions, files, progress=None, on_text=None, request_id=None):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                handler_cancelled.set()
+                raise
+
+        running = queue.submit(lambda job: submit_request("slow", uploads, slow_orchestrator, root, request_id=job.id))
+        waiting = queue.submit(lambda job: submit_request("never runs", uploads, slow_orchestrator, root))
+        await asyncio.sleep(0.05)
+        assert queue.cancel(waiting)
+        assert queue.cancel(running)
+        while not running.done:
+            await asyncio.sleep(0.005)
+        return queue, running, waiting, uploads, handler_cancelled.is_set()
+
+    with tempfile.TemporaryDirectory() as root:
+        queue, running, waiting, uploads, handler_cancelled = asyncio.run(scenario(root))
+    assert handler_cancelled
+    assert running.status == "cancelled" and waiting.status == "cancelled"
+    assert waiting.started is None
+    assert uploads.snapshot() == ["receipt.pdf"]
+    assert queue.snapshot()["cancelled"] == 2
+
+
+def test_jobs_cancelled_while_queued_free_their_slot():
+    async def scenario():
+        queue = JobQueue(workers=1, max_queued=2)
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        running = queue.submit(work, "running")
+        await asyncio.sleep(0.01)
+        queued = [queue.submit(work, f"queued {i}") for i in range(2)]
+        try:
+            queue.submit(work, "overflow")
+            rejected = False
+        except JobQueueFull:
+            rejected = True
+        queue.cancel(queued[0])
+        replacement = queue.submit(work, "replacement")
+        snapshot = queue.snapshot()
+        release.set()
+        while not (running.done and replacement.done):
+            await asyncio.sleep(0.005)
+        return rejected, snapshot, queue.snapshot(), replacement
+
+    rejected, during, after, replacement = asyncio.run(scenario())
+    assert rejected
+    assert during["queued"] == 2 and during["running"] == 1
+    assert after["queued"] == 0 and after["rejected"] == 1
+    assert replacement.status == "done"
+
+
+def test_closed_queue_refuses_jobs_and_drains_accepted_ones():
+    async def scenario():
+        queue = JobQueue(workers=1)
+
+        async def work(job):
+            await asyncio.sleep(0.05)
+            return job.description
+
+        jobs = [queue.submit(work, f"job {i}") for i in range(3)]
+        queue.close()
+        try:
+            queue.submit(work, "late")
+            refused = False
+        except JobQueueClosed:
+            refused = True
+        assert queue.active() == 3
+        assert not await queue.drain(timeout=0.01)
+        drained = await queue.drain(timeout=5)
+        return jobs, refused, drained
+
+    jobs, refused, drained = asyncio.run(scenario())
+    assert refused and drained
+    assert all(job.status == "done" for job in jobs)
+
+
+def test_narration_before_a_tool_call_is_discarded():
+    job = Job("j", "request", PRIORITY_INTERACTIVE, run=None)
+    texts = []
+    job.subscribe(lambda job, event: texts.append(job.partial))
+    messages = [mcp_progress.partial_text("Let me check "), mcp_progress.partial_text("your Drive."),
+                mcp_progress.RESET_TEXT, mcp_progress.partial_text("Found 3 files.")]
+    for message in messages:
+        is_text, payload = mcp_progress.parse(message)
+        assert is_text
+        job.stream_text(payload)
+    assert texts == ["Let me check ", "Let me check your Drive.", "", "Found 3 files."]
+    assert mcp_progress.parse("Running list_drive_files_tool") == (False, "Running list_drive_files_tool")
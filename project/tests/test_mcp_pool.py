@@ -0,0 +1,22 @@
+"""
+Spreading MCP calls across workers and skipping workers marked down.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from mcp_pool import McpPool
+
+
+def test_mcp_pool_spreads_calls_and_skips_down_workers():
+    pool = McpPool(["http://a/sse", "http://b/sse", "http://c/sse"], cooldown=60)
+    with pool.lease() as first, pool.lease() as second, pool.lease() as third:
+        # Concurrent calls land on different workers
+        assert {first, second, third} == set(pool.urls)
+        with pool.lease() as fourth:
+            assert pool.in_flight[fourth] == 2
+    assert all(count == 0 for count in pool.in_flight.values())
+
+    pool.mark_down("http://b/sse")
+    assert "http://b/sse" not in {pool.pick() for _ in range(10)}
+    assert pool.snapshot()["http://b/sse"]["down"] == 1
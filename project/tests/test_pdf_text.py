@@ -0,0 +1,37 @@
+"""
+Page range parsing used by read_document's pages argument.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from pdf_text import parse_page_range, resolve_pages
+
+
+def test_page_ranges_are_one_based_sorted_and_clamped():
+    assert parse_page_range("1-3,7", 10) == [0, 1, 2, 6]
+    assert parse_page_range("8-", 10) == [7, 8, 9]
+    assert parse_page_range("-2", 10) == [0, 1]
+    assert parse_page_range(" 5, 2-3 ,5", 10) == [1, 2, 4]
+    assert parse_page_range("9-20", 10) == [8, 9]
+
+
+@pytest.mark.parametrize("spec", ["abc", "1-x", "1-2-3", "0", "5-3", "1.5"])
+def test_malformed_ranges_get_a_clear_message(spec):
+    with pytest.raises(ValueError, match="Invalid page range"):
+        parse_page_range(spec, 10)
+
+
+def test_ranges_outside_the_document_select_nothing():
+    with pytest.raises(ValueError, match="No pages selected"):
+        parse_page_range("11-12", 10)
+    with pytest.raises(ValueError, match="No pages selected"):
+        parse_page_range("12-", 10)
+
+
+def test_resolve_pages_accepts_specs_indexes_or_everything():
+    assert resolve_pages(None, 3) == [0, 1, 2]
+    assert resolve_pages("2", 3) == [1]
+    assert resolve_pages([2, 5, -1], 3) == [2]
@@ -0,0 +1,74 @@
+"""
+Accuracy of the local receipt date extractor on a labeled corpus.
+
+Runs under pytest, or as a script for a per-sample report. Set RUN_LLM_DATE_EVAL=1
+(with GEMINI_API_KEY) to also measure the Gemini date-extraction path on the same corpus.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from receipt_dates import extract_receipt_date
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'receipt_dates_corpus.json')
+MIN_ACCURACY = 0.95
+
+
+def load_corpus():
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    return datetime.strptime(corpus['today'], '%Y-%m-%d'), corpus['samples']
+
+
+def local_date(text, today):
+    date = extract_receipt_date(text, today=today)
+    return date.strftime('%Y-%m-%d') if date else None
+
+
+def llm_date(text):
+    """The Gemini date-extraction prompt validate_reimbursement used before local extraction."""
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    model = genai.GenerativeModel("gemini-2.5-flash")
+    response = model.generate_content(
+        "Extract only the receipt date from the following text.\n"
+        "Return the date in ISO format (YYYY-MM-DD) if possible.\n"
+        "If no date is found, reply with 'UNKNOWN'.\n\n"
+        f"Receipt text:\n{text}"
+    )
+    answer = response.text.strip()
+    return None if answer == 'UNKNOWN' else answer
+
+
+def evaluate(extract):
+    """Return (accuracy, mean seconds per sample, misses) for an extractor."""
+    today, samples = load_corpus()
+    misses = []
+    start = time.perf_counter()
+    for sample in samples:
+        predicted = extract(sample['text'], today)
+        if predicted != sample['date']:
+            misses.append((sample['text'].splitlines()[0], sample['date'], predicted))
+    elapsed = time.perf_counter() - start
+    return 1 - len(misses) / len(samples), elapsed / len(samples), misses
+
+
+def test_local_extractor_accuracy():
+    accuracy, _, misses = evaluate(local_date)
+    assert accuracy >= MIN_ACCURACY, f"accuracy {accuracy:.1%} below {MIN_ACCURACY:.0%}: {misses}"
+
+
+if __name__ == "__main__":
+    accuracy, seconds, misses = evaluate(local_date)
+    print(f"Local extractor: {accuracy:.1%} accurate, {seconds * 1e6:.0f} µs per receipt")
+    for first_line, expected, predicted in misses:
+        print(f"  MISS {first_line!r}: expected {expected}, got {predicted}")
+
+    if os.getenv("RUN_LLM_DATE_EVAL") and os.getenv("GEMINI_API_KEY"):
+        accuracy, seconds, misses = evaluate(lambda text, today: llm_date(text))
+        print(f"Gemini path:     {accuracy:.1%} accurate, {seconds * 1000:.0f} ms per receipt")
+        for first_line, expected, predicted in misses:
+            print(f"  MISS {first_line!r}: expected {expected}, got {predicted}")
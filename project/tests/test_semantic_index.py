@@ -0,0 +1,77 @@
+"""
+Chunking and incremental update planning of the local vector index, against an in-memory
+stand-in for the chromadb collection (no embedding model needed).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import semantic_index
+
+
+class FakeCollection:
+    """The subset of the chromadb collection API used by plan_update and write_chunks."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, where=None, include=None, limit=None):
+        ids = [cid for cid, row in self.rows.items() if row["metadata"]["file_id"] == where["file_id"]]
+        return {"ids": ids, "metadatas": [self.rows[cid]["metadata"] for cid in ids]}
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        for cid, document, metadata in zip(ids, documents, metadatas):
+            self.rows[cid] = {"document": document, "metadata": metadata}
+
+    def update(self, ids, metadatas):
+        for cid, metadata in zip(ids, metadatas):
+            self.rows[cid]["metadata"] = metadata
+
+    def delete(self, ids):
+        for cid in ids:
+            del self.rows[cid]
+
+
+def index(chunks):
+    changed, unchanged, stale = semantic_index.plan_update("file", chunks)
+    semantic_index.write_chunks("file", "doc.pdf", "v", chunks, changed, unchanged, stale,
+                                [[0.0] for _ in changed])
+    return changed, unchanged, stale
+
+
+def test_inserting_a_chunk_only_embeds_the_new_text(monkeypatch):
+    monkeypatch.setattr(semantic_index, "_collection", FakeCollection())
+    original = ["intro", "body", "conclusion"]
+    assert index(original) == ([0, 1, 2], [], [])
+
+    # A new paragraph near the top shifts every later chunk by one position
+    changed, unchanged, stale = index(["preface"] + original)
+    assert changed == [0] and unchanged == [1, 2, 3] and stale == []
+    rows = semantic_index._collection.rows.values()
+    assert sorted(row["metadata"]["chunk"] for row in rows) == [0, 1, 2, 3]
+
+    changed, unchanged, stale = index(["preface", "intro", "conclusion"])
+    assert changed == [] and len(stale) == 1
+    assert len(semantic_index._collection.rows) == 3
+
+
+def test_repeated_chunks_get_distinct_ids():
+    ids = semantic_index.chunk_ids("file", ["same", "other", "same"])
+    assert len(set(ids)) == 3
+    assert ids[0].startswith("file:") and ids[2] == ids[0] + ":1"
+
+
+def test_chunks_overlap_and_end_on_word_boundaries():
+    text = " ".join(f"word{i}" for i in range(400))
+    chunks = semantic_index.chunk_text(text, size=200, overlap=50)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    # Only the overlap may start mid-word; chunks themselves end on whitespace
+    assert all(chunk.split()[-1] in text.split() for chunk in chunks)
+    # Consecutive chunks share text, and together they cover the whole document
+    assert all(set(a.split()) & set(b.split()) for a, b in zip(chunks, chunks[1:]))
+    assert chunks[0].startswith("word0 ") and chunks[-1].endswith("word399")
+
+
+def test_short_and_empty_texts():
+    assert semantic_index.chunk_text("  just one chunk  ") == ["just one chunk"]
+    assert semantic_index.chunk_text("   ") == []
@@ -0,0 +1,95 @@
+"""
+Load test for concurrent UI submissions.
+
+Simulates many browser clients that each upload their own receipts and submit at the same
+time, and checks that every request sees only its own files, logs to its own session and
+that submissions overlap instead of running one after another.
+
+Runs under pytest, or as a script for a throughput report (LOAD_TEST_CLIENTS sets the size).
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from logging_utils import get_logger
+from ui_state import ClientUploads, submit_request
+from upload_store import UploadStore
+from test_upload_store import FakeUpload
+
+CLIENTS = int(os.getenv("LOAD_TEST_CLIENTS", 200))
+FILES_PER_CLIENT = 3
+# Simulated agent latency per request, in seconds
+HANDLER_DELAY = (0.05, 0.15)
+
+
+async def orchestrator(instructions, files, progress=None, on_text=None, request_id=None):
+    """Stand-in request handler that echoes what it was given, logging through the session logger."""
+    await asyncio.sleep(random.uniform(*HANDLER_DELAY))
+    get_logger().log_tool_call(tool_name="echo", parameters={"files": files}, result=instructions)
+    return [instructions, *sorted(files)]
+
+
+async def simulate_client(client_id, store, log_dir):
+    uploads = ClientUploads()
+    expected = []
+    for n in range(FILES_PER_CLIENT):
+        content = f"receipt {client_id}-{n}".encode() * 1000
+        stored = await store.save_stream(FakeUpload(f"receipt{n}.pdf", content).iterate(), f"receipt{n}.pdf")
+        uploads.add(stored.path)
+        expected.append(stored.path)
+    # A shared receipt every client uploads; stored once, visible to each client
+    shared = await store.save_stream(FakeUpload("policy.pdf", b"shared" * 1000).iterate(), "policy.pdf")
+    uploads.add(shared.path)
+    expected.append(shared.path)
+
+    result = await submit_request(f"client {client_id}", uploads, orchestrator, log_dir)
+    return client_id, sorted(expected), result, uploads
+
+
+async def run_load(clients, root):
+    store = UploadStore(os.path.join(root, "uploads"), os.path.join(root, "uploads.sqlite3"))
+    log_dir = os.path.join(root, "logs")
+    started = time.perf_counter()
+    results = await asyncio.gather(*(simulate_client(i, store, log_dir) for i in range(clients)))
+    return results, time.perf_counter() - started, store, log_dir
+
+
+def test_concurrent_clients_are_isolated():
+    with tempfile.TemporaryDirectory() as root:
+        results, elapsed, store, log_dir = asyncio.run(run_load(CLIENTS, root))
+
+        for client_id, expected, result, uploads in results:
+            assert result.ok
+            lines = result.output.split('\n')
+            assert lines[0] == f"client {client_id}"
+            assert lines[1:] == expected
+            assert uploads.snapshot() == []
+
+        # One session log per request, each holding only its own client's entries
+        sessions = [name for name in os.listdir(log_dir) if name.endswith('.json')]
+        assert len(sessions) == CLIENTS
+        for name in sessions:
+            with open(os.path.join(log_dir, name), encoding='utf-8') as f:
+                entries = json.load(f)
+            inputs = {entry["input_text"] for entry in entries if "input_text" in entry}
+            echoed = {entry["result"] for entry in entries if entry.get("tool_name") == "echo"}
+            assert len(inputs) == 1 and inputs == echoed
+
+        snapshot = store.snapshot()
+        assert snapshot["stored_files"] == CLIENTS * FILES_PER_CLIENT + 1
+        assert snapshot["duplicates"] == CLIENTS - 1
+
+        # Requests must overlap: serial handling would take at least CLIENTS * min delay
+        assert elapsed < CLIENTS * HANDLER_DELAY[0] / 4
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as root:
+        results, elapsed, store, _ = asyncio.run(run_load(CLIENTS, root))
+    failed = sum(1 for _, expected, result, _ in results if result.output.split('\n')[1:] != expected)
+    print(f"{CLIENTS} clients in {elapsed:.2f}s ({CLIENTS / elapsed:.1f} requests/s), {failed} with wrong files")
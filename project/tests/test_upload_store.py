@@ -0,0 +1,86 @@
+"""
+Content-addressed upload storage: references, quota eviction and expiry.
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from upload_store import UploadStore
+
+
+class FakeUpload:
+    """Stands in for a NiceGUI upload event file."""
+
+    def __init__(self, name, content):
+        self.name = name
+        self.content = content
+
+    async def iterate(self):
+        for start in range(0, len(self.content), 4096):
+            await asyncio.sleep(0)
+            yield self.content[start:start + 4096]
+
+
+def test_upload_store_collects_only_unreferenced_files():
+    async def save(store, content, name, owner=None):
+        return await store.save_stream(FakeUpload(name, content).iterate(), name, owner)
+
+    async def scenario(root):
+        store = UploadStore(os.path.join(root, "uploads"), os.path.join(root, "uploads.sqlite3"),
+                            ttl=60, quota_bytes=2500)
+        kept = await save(store, b"a" * 1000, "a.pdf", owner="client-1")
+        oldest = await save(store, b"b" * 1000, "b.pdf")
+        newest = await save(store, b"c" * 1000, "c.pdf")
+        # Over quota: the least recently used unreferenced file goes, the referenced one stays
+        assert [os.path.exists(u.path) for u in (kept, oldest, newest)] == [True, False, True]
+
+        store.acquire("job-1", [newest.path])
+        store.release("client-1")
+        assert store.collect(time.time() + 120) == 1
+        assert not os.path.exists(kept.path) and os.path.exists(newest.path)
+
+        store.release("job-1")
+        assert store.collect(time.time() + 120) == 1
+        return store.snapshot()
+
+    with tempfile.TemporaryDirectory() as root:
+        snapshot = asyncio.run(scenario(root))
+    assert snapshot["stored_files"] == 0 and snapshot["stored_bytes"] == 0
+    assert snapshot["evicted"] == 1 and snapshot["expired"] == 2
+
+
+def test_stores_opened_together_migrate_an_old_index_once():
+    with tempfile.TemporaryDirectory() as root:
+        index_path = os.path.join(root, "uploads.sqlite3")
+        conn = sqlite3.connect(index_path)
+        conn.execute("CREATE TABLE uploads (sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, "
+                     "size INTEGER NOT NULL, created REAL NOT NULL)")
+        conn.execute("INSERT INTO uploads VALUES ('abc', 'abc.pdf', 10, 123.0)")
+        conn.commit()
+        conn.close()
+
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def open_store():
+            barrier.wait()
+            try:
+                UploadStore(os.path.join(root, "uploads"), index_path).conn.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_store) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        conn = sqlite3.connect(index_path)
+        assert conn.execute("SELECT last_used FROM uploads").fetchall() == [(123.0,)]
+        conn.close()
@@ -0,0 +1,70 @@
+"""
+Expiry rules of the persistent verdict cache: approvals lapse when the receipt leaves the
+policy's date window, undated approvals after a day, denials after DENIAL_TTL.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+import verdict_cache
+from verdict_cache import DENIAL_TTL, UNDATED_APPROVAL_TTL, VerdictCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VerdictCache(str(tmp_path / "verdicts.sqlite3"))
+
+
+def expires_at(cache, receipt_hash):
+    return cache.conn.execute("SELECT expires_at FROM verdicts WHERE receipt_hash = ?", (receipt_hash,)).fetchone()[0]
+
+
+def later(monkeypatch, seconds):
+    now = time.time()
+    monkeypatch.setattr(verdict_cache.time, "time", lambda: now + seconds)
+
+
+def test_approval_expires_the_day_after_the_date_window_closes(cache):
+    receipt_date = datetime.now() - timedelta(days=30)
+    cache.put("inside", "policy", "APPROVED", "ok", receipt_date, max_age_days=30)
+    assert expires_at(cache, "inside") == (receipt_date + timedelta(days=31)).timestamp()
+    assert cache.get("inside", "policy") == ("APPROVED", "ok")
+
+    cache.put("outside", "policy", "APPROVED", "ok", datetime.now() - timedelta(days=31, minutes=1), max_age_days=30)
+    assert cache.get("outside", "policy") is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_undated_approval_lives_one_day(cache, monkeypatch):
+    before = time.time()
+    cache.put("undated", "policy", "APPROVED", "ok", None, max_age_days=30)
+    assert before + UNDATED_APPROVAL_TTL <= expires_at(cache, "undated") <= time.time() + UNDATED_APPROVAL_TTL
+    assert cache.get("undated", "policy") == ("APPROVED", "ok")
+
+    later(monkeypatch, UNDATED_APPROVAL_TTL + 1)
+    assert cache.get("undated", "policy") is None
+
+
+def test_denials_expire_after_the_denial_ttl(cache, monkeypatch):
+    before = time.time()
+    cache.put("denied", "policy", "DENIED", "alcohol", datetime.now() - timedelta(days=400), max_age_days=30)
+    cache.put("undated", "policy", "DENIED", "no date", None, max_age_days=30)
+    for receipt_hash in ("denied", "undated"):
+        assert before + DENIAL_TTL <= expires_at(cache, receipt_hash) <= time.time() + DENIAL_TTL
+
+    later(monkeypatch, DENIAL_TTL - 60)
+    assert cache.get("denied", "policy") == ("DENIED", "alcohol")
+    later(monkeypatch, DENIAL_TTL + 1)
+    assert cache.get("denied", "policy") is None
+    assert cache.get("undated", "policy") is None
+
+
+def test_verdicts_are_scoped_to_the_policy_version(cache):
+    cache.put("receipt", "v1", "DENIED", "too old", None, max_age_days=30)
+    assert cache.get("receipt", "v2") is None
+    assert cache.purge_other_policies("v2") == 1
+    assert cache.stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0, "entries": 0}